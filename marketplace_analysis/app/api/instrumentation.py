@@ -0,0 +1,186 @@
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from functools import wraps
+from pathlib import Path
+import asyncio
+import json
+import logging
+import random
+import time
+
+from app.core.config import settings
+from app.core.metrics import (
+    REGISTRY,
+    REQUEST_SECONDS,
+    REQUESTS_TOTAL,
+    STAGE_SECONDS,
+    RequestTimings,
+    current_request,
+    timed,
+)
+from app.core.profiling import ProfileSession, current_profile
+
+# Canal de los logs por solicitud: se puede silenciar sin perder las métricas
+request_logger = logging.getLogger('app.requests')
+
+class InstrumentedRoute(APIRoute):
+    """Ruta que registra su plantilla y mide la duración del endpoint"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    async def handle(self, scope, receive, send):
+        timings = current_request.get()
+        if timings is not None:
+            timings.route = self.path
+        await super().handle(scope, receive, send)
+
+def _timed_endpoint(endpoint):
+    if not asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with timed('endpoint'):
+            return await endpoint(*args, **kwargs)
+    return wrapper
+
+class MetricsMiddleware:
+    """Middleware ASGI: duración total por ruta y estado, y etapa de serialización
+
+    La serialización (validación del response_model y JSON) se estima como el
+    total menos la autenticación y el endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not REGISTRY.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_request.set(timings)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            elapsed = time.perf_counter() - start
+            route = timings.route or 'unmatched'
+            REQUEST_SECONDS.observe(elapsed, scope['method'], route, str(status_code))
+            REQUESTS_TOTAL.inc(scope['method'], route, str(status_code))
+            if 'endpoint' in timings.stages:
+                serialization = elapsed - timings.stages['endpoint'] - timings.stages.get('auth', 0.0)
+                STAGE_SECONDS.observe(max(serialization, 0.0), 'serialization')
+            request_logger.info(f"{scope['method']} {route} {status_code} {elapsed * 1000:.1f}ms")
+
+class ProfilingMiddleware:
+    """Middleware ASGI: perfila solicitudes marcadas con un header o muestreadas
+
+    Solo actúa con PROFILING_ENABLED; las solicitudes no seleccionadas pasan
+    sin costo adicional. El header solo se atiende con un token válido en
+    Authorization. Con el header en 'inline' la respuesta se reemplaza por
+    {"response": ..., "profile": ...}; en otro caso el perfil se guarda en
+    PROFILE_DIR (rotativo) y su id se devuelve en el header X-Profile-Id.
+    Si ya hay una sesión activa la solicitud se atiende sin perfilar.
+    """
+
+    def __init__(self, app, valid_tokens=frozenset()):
+        self.app = app
+        self.valid_tokens = valid_tokens  # Tokens autorizados a pedir un perfil por header
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.profiling_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(f"{scope['method']} {scope['path']}")
+        if not session.start():
+            request_logger.debug(f"Perfil omitido para {session.route}: otra sesión en curso")
+            await self.app(scope, receive, send)
+            return
+        token = current_profile.set(session)
+        try:
+            if mode == 'inline':
+                await self._run_inline(session, scope, receive, send)
+            else:
+                await self._run_to_file(session, scope, receive, send)
+        finally:
+            current_profile.reset(token)
+
+    def _requested_mode(self, scope):
+        headers = dict(scope['headers'])
+        value = headers.get(settings.profile_header.encode('latin-1'))
+        if value is not None and self._authorized(headers):
+            return 'inline' if value.decode('latin-1').lower() == 'inline' else 'file'
+        if settings.profile_sample_rate and random.random() < settings.profile_sample_rate:
+            return 'file'
+        return None
+
+    def _authorized(self, headers) -> bool:
+        scheme, _, token = headers.get(b'authorization', b'').decode('latin-1').partition(' ')
+        return scheme.lower() == 'bearer' and token in self.valid_tokens
+
+    async def _run_to_file(self, session: ProfileSession, scope, receive, send):
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                message = {
+                    **message,
+                    'headers': [*message.get('headers', []), (b'x-profile-id', session.id.encode('latin-1'))]
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session.stop()
+            # Escritura a disco fuera del event loop
+            await run_in_threadpool(session.save, Path(settings.profile_dir), settings.profile_keep)
+
+    async def _run_inline(self, session: ProfileSession, scope, receive, send):
+        start_message = None
+        body = []
+
+        async def buffer(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+            elif message['type'] == 'http.response.body':
+                body.append(message.get('body', b''))
+
+        try:
+            await self.app(scope, receive, buffer)
+        finally:
+            session.stop()
+
+        content = b''.join(body)
+        try:
+            response = json.loads(content) if content else None
+        except ValueError:
+            response = content.decode('utf-8', errors='replace')
+        payload = json.dumps({'response': response, 'profile': session.report()}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': start_message['status'] if start_message else 500,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode('latin-1')),
+                (b'x-profile-id', session.id.encode('latin-1'))
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': payload})
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 
 class ProductBase(BaseModel):
@@ -21,6 +21,7 @@ class ProductRecommendation(BaseModel):
     category: str
     reviews_count: int
     similarity_score: float
+    rank_score: Optional[float] = None  # Similitud combinada con la calidad (solo al re-ordenar)
 
 class RecommendationResponse(BaseModel):
     product_id: int
@@ -28,6 +29,54 @@ class RecommendationResponse(BaseModel):
     category: str        # Cambiado de product_category
     recommendations: List[ProductRecommendation]
 
+# Recomendaciones en lote
+class BatchRecommendationRequest(BaseModel):
+    product_ids: List[int] = Field(..., min_length=1, max_length=500)
+    n_recommendations: int = Field(5, ge=1)
+    quality_weight: Optional[float] = Field(None, ge=0, le=1)
+
+class BatchRecommendationItem(BaseModel):
+    product_id: int
+    title: Optional[str] = None
+    category: Optional[str] = None
+    recommendations: List[ProductRecommendation] = []
+    error: Optional[str] = None  # Presente si el producto no pudo resolverse
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[BatchRecommendationItem]
+
+# Cambios incrementales del catálogo
+class ProductMutationResponse(BaseModel):
+    product_id: int
+    status: str
+
+class CompactionResponse(BaseModel):
+    compacted_updates: int
+    total_products: int
+
+# Reentrenamiento y estado del modelo activo
+class RetrainResponse(BaseModel):
+    status: str
+    active_model_version: int
+
+class RetrainingStatus(BaseModel):
+    state: str  # idle, training o failed
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+class ModelStatusResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # Permite el campo model_version
+
+    model_version: int
+    built_at: Optional[str] = None
+    build_seconds: Optional[float] = None
+    n_products: int
+    pending_updates: int
+    index_backend: str
+    retraining: RetrainingStatus
+
 # Si necesitas la respuesta de productos similares
 class SimilarProductsResponse(BaseModel):
     product_id: int
@@ -0,0 +1,16 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+
+from app.core.serialization import dumps
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse con el codificador rápido (orjson si está instalado)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class EncodedJSONResponse(Response):
+    """Respuesta con un cuerpo JSON ya codificado, enviado tal cual"""
+
+    media_type = 'application/json'
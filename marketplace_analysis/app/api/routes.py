@@ -1,79 +1,126 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-from typing import List
-import os
+from typing import List, Optional
+import asyncio
 import logging
-from pathlib import Path
 
-from app.services.analyzer import ProductAnalyzer
-from app.services.recommender import ProductRecommender
-from .models import ProductBase, RecommendationResponse
+from app.core.config import settings
+from app.core.metrics import REGISTRY, timed
+from app.api.instrumentation import InstrumentedRoute, MetricsMiddleware, ProfilingMiddleware, request_logger
+from app.api.responses import EncodedJSONResponse, FastJSONResponse
+# Sin pandas ni scikit-learn al importar: el modelo se carga en segundo plano
+from app.services.errors import ReadOnlyModelError
+from app.services.executor import ExecutorSaturated, RecommendationExecutor
+from app.services.model_manager import DATA_PATH, ModelManager, train_recommender
+from .models import (
+    ProductBase,
+    RecommendationResponse,
+    SimilarProductsResponse,
+    BatchRecommendationRequest,
+    BatchRecommendationResponse,
+    ProductMutationResponse,
+    CompactionResponse,
+    RetrainResponse,
+    ModelStatusResponse,
+    CategoryDistribution,
+)
 
 # Configuraciones
-MODEL_PATH = Path('models/trained/recommender.pkl')
+MODEL_PATH = settings.model_path
 VALID_TOKENS = {"test-token"}
 
-# Configurar logging detallado
+# Configurar logging (nivel configurable; los logs por solicitud se pueden silenciar)
 logging.basicConfig(
-    level=logging.DEBUG,  # Cambiado a DEBUG para más detalle
+    level=settings.log_level,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+logging.getLogger().setLevel(settings.log_level)
+if not settings.request_logging:
+    request_logger.setLevel(logging.WARNING)
+REGISTRY.enabled = settings.metrics_enabled
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manejador del ciclo de vida de la aplicación"""
+    """Manejador del ciclo de vida de la aplicación
+
+    El servidor acepta conexiones de inmediato: el modelo se carga (o se
+    entrena si no hay uno guardado) en segundo plano y /readyz responde 503
+    hasta que termina.
+    """
+    logger.info("Iniciando inicialización de la aplicación")
+    get_model_manager(app).start_loading(warm_up=settings.model_warm_up)
+    compaction_task = asyncio.create_task(periodic_compaction(app))
     try:
-        logger.info("Iniciando inicialización de la aplicación")
-        
-        # Inicializar analyzer
-        app.state.analyzer = ProductAnalyzer()
-        logger.info("Analyzer inicializado")
-        
-        # Intentar cargar modelo guardado
-        model_path = MODEL_PATH
-        if model_path.exists():
-            logger.info(f"Cargando modelo desde {model_path}")
-            app.state.recommender = ProductRecommender.load_model(model_path)
-            logger.info("Modelo cargado exitosamente")
-        else:
-            logger.info("Entrenando nuevo modelo...")
-            # Cargar y procesar datos
-            analyzer = app.state.analyzer
-            df = analyzer.load_data('data/raw/products.csv')
-            logger.info(f"Datos cargados: {df.shape} registros")
-            
-            df = analyzer.extract_features()
-            df = analyzer.normalize_features()
-            logger.info("Features procesadas")
-            
-            # Entrenar nuevo recomendador
-            recommender = ProductRecommender()
-            recommender.fit(df)
-            app.state.recommender = recommender
-            logger.info("Modelo entrenado")
-            
-            # Guardar el modelo
-            os.makedirs(model_path.parent, exist_ok=True)
-            recommender.save_model(model_path)
-            logger.info(f"Modelo guardado en {model_path}")
-        
-        logger.info("Inicialización completada exitosamente")
         yield
-    except Exception as e:
-        logger.error(f"Error durante la inicialización: {str(e)}")
-        raise
     finally:
+        compaction_task.cancel()
+        if hasattr(app.state, 'executor'):
+            app.state.executor.shutdown()
         logger.info("Limpieza de recursos")
 
+def get_model_manager(app: FastAPI) -> ModelManager:
+    """Gestor del modelo activo (se crea con la primera solicitud que lo necesita)"""
+    if not hasattr(app.state, 'model_manager'):
+        app.state.model_manager = ModelManager(
+            app.state,
+            model_path=MODEL_PATH,
+            train=lambda: train_recommender(DATA_PATH)
+        )
+    return app.state.model_manager
+
+def get_executor(app: FastAPI) -> RecommendationExecutor:
+    """Capa de ejecución de las llamadas al recomendador (se crea bajo demanda)"""
+    if not hasattr(app.state, 'executor'):
+        app.state.executor = RecommendationExecutor(
+            max_workers=settings.executor_workers,
+            max_queue=settings.executor_queue_size,
+            mode=settings.executor_mode,
+            model_path=MODEL_PATH,
+            retry_after=settings.retry_after_seconds
+        )
+        # En modo 'process' los procesos reabren el modelo tras cada reemplazo
+        get_model_manager(app).on_swap.append(app.state.executor.reload)
+    return app.state.executor
+
+async def compact_catalog(app: FastAPI) -> int:
+    """Reentrenar sobre el catálogo activo y reemplazar el recomendador
+
+    Las escrituras que llegan durante el reentrenamiento esperan y se aplican
+    al modelo compactado; comparte el candado con /admin/model/retrain (ver
+    ModelManager.rebuild).
+    """
+    # Los procesos sirven el modelo guardado: persistir antes de reemplazar
+    save = get_executor(app).mode == 'process'
+    pending = await run_in_threadpool(get_model_manager(app).rebuild, save)
+    logger.info(f"Catálogo compactado: {pending} cambios consolidados")
+    return pending
+
+async def periodic_compaction(app: FastAPI):
+    """Compactar periódicamente el catálogo si hubo cambios incrementales"""
+    while True:
+        await asyncio.sleep(settings.catalog_compaction_interval)
+        try:
+            recommender = getattr(app.state, 'recommender', None)
+            if recommender is not None and recommender.pending_updates:
+                await compact_catalog(app)
+        except Exception as e:
+            logger.error(f"Error en la compactación periódica: {str(e)}")
+
 app = FastAPI(
     title="Marketplace Analysis API",
     description="API para análisis y recomendaciones de productos",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
+app.router.route_class = InstrumentedRoute  # Mide cada endpoint declarado a continuación
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware, valid_tokens=VALID_TOKENS)  # Inactivo salvo con PROFILING_ENABLED
 
 app.add_middleware(
     CORSMiddleware,
@@ -83,12 +130,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """Responder 503 con Retry-After cuando la capa de ejecución está llena"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def require_model(request: Request):
+    """Responder 503 mientras el modelo se está cargando"""
+    if getattr(request.app.state, 'recommender', None) is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Modelo cargándose, reintentar más tarde",
+            headers={"Retry-After": str(settings.retry_after_seconds)}
+        )
+
+MODEL_REQUIRED = [Depends(require_model)]  # Endpoints que necesitan el modelo activo
+
+async def require_writable_catalog(request: Request):
+    """Rechazar los cambios del catálogo cuando las lecturas se sirven desde procesos
+
+    En modo 'process' los procesos leen el modelo guardado: un cambio aplicado
+    solo en el proceso principal no sería visible hasta la próxima compactación.
+    """
+    if get_executor(request.app).mode == 'process':
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Los cambios del catálogo no están disponibles con EXECUTOR_MODE=process; "
+                   "reentrenar el modelo o usar el modo 'thread'"
+        )
+
+CATALOG_WRITE = MODEL_REQUIRED + [Depends(require_writable_catalog)]  # Altas, cambios y bajas
+
+def encoded_response(body: bytes, response_model) -> EncodedJSONResponse:
+    """Enviar un cuerpo JSON pre-codificado; con VALIDATE_RESPONSES se valida antes con pydantic"""
+    if settings.validate_responses:
+        response_model.model_validate_json(body)
+    return EncodedJSONResponse(body)
+
 # Configuración de seguridad
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 async def verify_token(token: str = Depends(oauth2_scheme)):
     """Verificar que el token sea válido"""
-    if token not in VALID_TOKENS:
+    with timed('auth'):
+        valid = token in VALID_TOKENS
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido",
@@ -99,18 +189,40 @@ async def verify_token(token: str = Depends(oauth2_scheme)):
 @app.get("/")
 async def root():
     """Endpoint de prueba"""
-    logger.info("Acceso al endpoint raíz")
+    request_logger.info("Acceso al endpoint raíz")
     return {"message": "Marketplace Analysis API v1.0"}
 
-@app.get("/products/{product_id}/recommendations", response_model=RecommendationResponse)
+@app.get("/healthz")
+async def healthz():
+    """Sonda de vida: el proceso atiende solicitudes (con o sin modelo)"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz(request: Request):
+    """Sonda de disponibilidad: 200 solo con un modelo activo"""
+    readiness = get_model_manager(request.app).readiness()
+    if not readiness["ready"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content=readiness,
+            headers={"Retry-After": str(settings.retry_after_seconds)}
+        )
+    return readiness
+
+@app.get("/products/{product_id}/recommendations", response_model=RecommendationResponse, dependencies=MODEL_REQUIRED)
 async def get_recommendations(
     product_id: int,
     request: Request,
     token: str = Depends(verify_token),
-    n_recommendations: int = 5
+    n_recommendations: int = Query(5, ge=1),
+    quality_weight: Optional[float] = Query(None, ge=0, le=1)
 ):
-    """Obtener recomendaciones para un producto específico"""
-    logger.info(f"Solicitando recomendaciones para producto {product_id}")
+    """Obtener recomendaciones para un producto específico
+
+    quality_weight combina la similitud con la puntuación del producto
+    (0 = solo similitud); sin indicarlo se usa el peso del modelo.
+    """
+    request_logger.info(f"Solicitando recomendaciones para producto {product_id}")
     
     try:
         recommender = request.app.state.recommender
@@ -121,12 +233,16 @@ async def get_recommendations(
                 detail="Recomendador no inicializado correctamente"
             )
         
-        # Obtener recomendaciones
-        recommendations = recommender.get_recommendations(product_id, n_recommendations)
-        logger.info(f"Recomendaciones generadas: {len(recommendations['recommendations'])} items")
+        # Respuesta armada con los fragmentos JSON pre-codificados del modelo
+        body = await get_executor(request.app).call(
+            recommender, 'get_recommendations_json', product_id, n_recommendations, quality_weight
+        )
+        request_logger.info(f"Recomendaciones generadas: {len(body)} bytes")
         
-        return recommendations
+        return encoded_response(body, RecommendationResponse)
         
+    except (HTTPException, ExecutorSaturated):
+        raise
     except ValueError as e:
         logger.warning(f"Producto no encontrado: {product_id}")
         raise HTTPException(
@@ -140,28 +256,62 @@ async def get_recommendations(
             detail=str(e)
         )
 
-@app.get("/products/{product_id}/similar", response_model=RecommendationResponse)
+@app.post("/products/recommendations/batch", response_model=BatchRecommendationResponse, dependencies=MODEL_REQUIRED)
+async def get_recommendations_batch(
+    batch: BatchRecommendationRequest,
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Obtener recomendaciones para varios productos en una sola llamada"""
+    request_logger.info(f"Solicitando recomendaciones en lote para {len(batch.product_ids)} productos")
+    
+    try:
+        recommender = request.app.state.recommender
+        body = await get_executor(request.app).call(
+            recommender,
+            'get_recommendations_batch_json',
+            batch.product_ids,
+            batch.n_recommendations,
+            batch.quality_weight
+        )
+        request_logger.info(f"Lote procesado: {len(batch.product_ids)} productos, {len(body)} bytes")
+        
+        return encoded_response(body, BatchRecommendationResponse)
+        
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        logger.error(f"Error al obtener recomendaciones en lote: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.get("/products/{product_id}/similar", response_model=SimilarProductsResponse, dependencies=MODEL_REQUIRED)
 async def get_similar_products(
     product_id: int,
     request: Request,
     by_category: bool = True,
     token: str = Depends(verify_token),
-    n_recommendations: int = 5
+    n_recommendations: int = Query(5, ge=1),
+    quality_weight: Optional[float] = Query(None, ge=0, le=1)
 ):
     """Obtener productos similares"""
-    logger.info(f"Solicitando productos similares a {product_id}")
+    request_logger.info(f"Solicitando productos similares a {product_id}")
     try:
         recommender = request.app.state.recommender
-        recommendations = recommender.get_similar_products(
+        body = await get_executor(request.app).call(
+            recommender,
+            'get_similar_products_json',
             product_id,
-            by_category=by_category,
-            n_recommendations=n_recommendations
+            by_category,
+            n_recommendations,
+            quality_weight
         )
-        logger.info(f"Productos similares encontrados: {len(recommendations)}")
-        return {
-            "product_id": product_id,
-            "recommendations": recommendations
-        }
+        request_logger.info(f"Productos similares generados: {len(body)} bytes")
+        return encoded_response(body, SimilarProductsResponse)
+    except ExecutorSaturated:
+        raise
     except ValueError as e:
         logger.warning(f"Producto no encontrado: {product_id}")
         raise HTTPException(
@@ -175,52 +325,219 @@ async def get_similar_products(
             detail="Error interno del servidor"
         )
 
-@app.get("/metrics/category_distribution")
+def get_catalog_stats(request: Request):
+    """Estadísticas precalculadas del recomendador activo"""
+    recommender = getattr(request.app.state, 'recommender', None)
+    if recommender is None or recommender.stats is None:
+        logger.error("Estadísticas del catálogo no disponibles")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Recomendador no inicializado"
+        )
+    return recommender.stats
+
+@app.get("/metrics/category_distribution", response_model=CategoryDistribution, dependencies=MODEL_REQUIRED)
 async def get_category_distribution(
     request: Request,
     token: str = Depends(verify_token),
 ):
     """Obtener distribución de categorías"""
-    logger.info("Solicitando distribución de categorías")
+    request_logger.info("Solicitando distribución de categorías")
+    return get_catalog_stats(request).category_distribution()
+
+@app.get("/metrics/category_stats", dependencies=MODEL_REQUIRED)
+async def get_category_stats(
+    request: Request,
+    token: str = Depends(verify_token),
+):
+    """Obtener conteo y percentiles de precio, rating y ventas por categoría"""
+    stats = get_catalog_stats(request)
+    return {
+        "categories": stats.category_summary,
+        "total_products": stats.total_products
+    }
+
+@app.get("/metrics/histograms", dependencies=MODEL_REQUIRED)
+async def get_histograms(
+    request: Request,
+    token: str = Depends(verify_token),
+):
+    """Obtener los histogramas de stock y de puntuación del producto"""
+    return get_catalog_stats(request).histograms()
+
+@app.post(
+    "/products",
+    response_model=ProductMutationResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=CATALOG_WRITE
+)
+async def add_product(
+    product: ProductBase,
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Agregar un producto al catálogo sin reentrenar"""
+    request_logger.info(f"Agregando producto: {product.title}")
     try:
         recommender = request.app.state.recommender
-        if not recommender:
-            logger.error("Recomendador no encontrado")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Recomendador no inicializado"
-            )
-            
-        df = recommender.df
-        if df is None:
-            logger.error("DataFrame no encontrado")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Datos no disponibles"
-            )
-            
-        logger.info(f"DataFrame shape: {df.shape}")
-        logger.info(f"Columnas disponibles: {df.columns.tolist()}")
-        
-        if 'category' not in df.columns:
-            logger.error("Columna 'category' no encontrada")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Columna 'category' no encontrada en los datos"
-            )
-            
-        distribution = df['category'].value_counts().to_dict()
-        logger.info(f"Distribución calculada: {len(distribution)} categorías")
-        
+        product_id = await get_executor(request.app).run(recommender.add_product, product.model_dump())
+        return {"product_id": product_id, "status": "created"}
+    except ExecutorSaturated:
+        raise
+    except ReadOnlyModelError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error al agregar producto: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.put("/products/{product_id}", response_model=ProductMutationResponse, dependencies=CATALOG_WRITE)
+async def update_product(
+    product_id: int,
+    product: ProductBase,
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Actualizar un producto del catálogo sin reentrenar"""
+    request_logger.info(f"Actualizando producto {product_id}")
+    try:
+        recommender = request.app.state.recommender
+        await get_executor(request.app).run(recommender.update_product, product_id, product.model_dump())
+        return {"product_id": product_id, "status": "updated"}
+    except ExecutorSaturated:
+        raise
+    except ReadOnlyModelError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except ValueError as e:
+        logger.warning(f"Producto no encontrado: {product_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error al actualizar producto: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.delete("/products/{product_id}", response_model=ProductMutationResponse, dependencies=CATALOG_WRITE)
+async def remove_product(
+    product_id: int,
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Eliminar un producto del catálogo sin reentrenar"""
+    request_logger.info(f"Eliminando producto {product_id}")
+    try:
+        recommender = request.app.state.recommender
+        await get_executor(request.app).run(recommender.remove_product, product_id)
+        return {"product_id": product_id, "status": "deleted"}
+    except ExecutorSaturated:
+        raise
+    except ReadOnlyModelError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except ValueError as e:
+        logger.warning(f"Producto no encontrado: {product_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error al eliminar producto: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.post("/admin/catalog/compact", response_model=CompactionResponse, dependencies=MODEL_REQUIRED)
+async def compact(
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Consolidar los cambios incrementales reentrenando sobre el catálogo activo"""
+    request_logger.info("Solicitando compactación del catálogo")
+    try:
+        pending = await compact_catalog(request.app)
         return {
-            "distribution": distribution,
-            "total_products": len(df)
+            "compacted_updates": pending,
+            "total_products": len(request.app.state.recommender.product_indices)
         }
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"Error inesperado: {str(e)}")
+        logger.error(f"Error al compactar el catálogo: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al obtener la distribución de categorías: {str(e)}"
-        )
\ No newline at end of file
+            detail=str(e)
+        )
+
+@app.get("/metrics/executor")
+async def get_executor_stats(
+    request: Request,
+    token: str = Depends(verify_token),
+):
+    """Obtener la ocupación de la capa de ejecución"""
+    return get_executor(request.app).stats()
+
+@app.get("/metrics/cache", dependencies=MODEL_REQUIRED)
+async def get_cache_stats(
+    request: Request,
+    token: str = Depends(verify_token),
+):
+    """Obtener contadores de la caché de recomendaciones"""
+    recommender = request.app.state.recommender
+    return {
+        "model_version": recommender.model_version,
+        **recommender.cache.stats()
+    }
+
+@app.post(
+    "/admin/model/retrain",
+    response_model=RetrainResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=MODEL_REQUIRED
+)
+async def retrain_model(
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Reentrenar el modelo sobre el catálogo activo en segundo plano y reemplazarlo al terminar"""
+    request_logger.info("Solicitando reentrenamiento del modelo")
+    manager = get_model_manager(request.app)
+    if not manager.start_retraining():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ya hay un reentrenamiento en curso"
+        )
+    return {
+        "status": "started",
+        "active_model_version": manager.recommender.model_version
+    }
+
+@app.get("/admin/model/status", response_model=ModelStatusResponse, dependencies=MODEL_REQUIRED)
+async def get_model_status(
+    request: Request,
+    token: str = Depends(verify_token)
+):
+    """Obtener el modelo activo y el estado del último reentrenamiento"""
+    return get_model_manager(request.app).status()
+
+@app.get("/internal/metrics", response_class=PlainTextResponse)
+async def get_internal_metrics():
+    """Métricas de latencia por etapa y por ruta en formato de texto de Prometheus"""
+    return REGISTRY.render()
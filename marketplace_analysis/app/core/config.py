@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+class Settings:
+    """Configuración de la API leída de variables de entorno"""
+
+    def __init__(self):
+        # Modelo servido: se carga en segundo plano al arrancar
+        self.model_path = Path(os.getenv('MODEL_PATH', 'models/trained/recommender'))
+        self.model_warm_up = os.getenv('MODEL_WARM_UP', 'true').lower() in ('1', 'true', 'yes')
+
+        # Capa de ejecución de las llamadas al recomendador
+        self.executor_mode = os.getenv('EXECUTOR_MODE', 'thread')  # 'thread' o 'process'
+        self.executor_workers = int(os.getenv('EXECUTOR_WORKERS', os.cpu_count() or 1))
+        self.executor_queue_size = int(os.getenv('EXECUTOR_QUEUE_SIZE', 64))
+        self.retry_after_seconds = int(os.getenv('RETRY_AFTER_SECONDS', 1))
+
+        # Segundos entre compactaciones del catálogo (solo si hubo cambios incrementales)
+        self.catalog_compaction_interval = float(os.getenv('CATALOG_COMPACTION_INTERVAL', 3600))
+
+        # Logging e instrumentación
+        self.log_level = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+        self.request_logging = os.getenv('REQUEST_LOGGING', 'true').lower() in ('1', 'true', 'yes')
+        self.metrics_enabled = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+        # Validación pydantic de las respuestas pre-codificadas (modo de pruebas/depuración)
+        self.validate_responses = os.getenv('VALIDATE_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+
+        # Perfilado por solicitud (desactivado salvo que se habilite explícitamente)
+        self.profiling_enabled = os.getenv('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.profile_header = os.getenv('PROFILE_HEADER', 'X-Profile').lower()  # valor: 'inline' o 'file'
+        self.profile_sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+        self.profile_dir = os.getenv('PROFILE_DIR', 'profiles')
+        self.profile_keep = int(os.getenv('PROFILE_KEEP', 50))  # Perfiles conservados en disco
+
+settings = Settings()
@@ -0,0 +1,143 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+import threading
+import time
+
+# Límites de los histogramas de latencia (segundos)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class RequestTimings:
+    """Ruta y duración de las etapas medidas durante una solicitud"""
+
+    __slots__ = ('route', 'stages')
+
+    def __init__(self):
+        self.route = None
+        self.stages = {}
+
+# Solicitud en curso (la crea el middleware de métricas)
+current_request: ContextVar[Optional[RequestTimings]] = ContextVar('current_request', default=None)
+
+class Histogram:
+    """Histograma acumulativo por combinación de etiquetas (formato Prometheus)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # etiquetas -> [conteos por tramo, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            base = [f'{name}="{value}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join(base + ['le="%s"' % bound])
+                yield f"{self.name}_bucket{{{bucket_labels}}} {cumulative}"
+            suffix = f"{{{','.join(base)}}}" if base else ''
+            yield f"{self.name}_sum{suffix} {total}"
+            yield f"{self.name}_count{suffix} {count}"
+
+class Counter:
+    """Contador monótono por combinación de etiquetas"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            suffix = ','.join(f'{name}="{label}"' for name, label in zip(self.labelnames, labels))
+            yield f"{self.name}{{{suffix}}} {value}" if suffix else f"{self.name} {value}"
+
+class MetricsRegistry:
+    """Registro de métricas del proceso con exposición en texto"""
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, documentation, labelnames, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, documentation, labelnames)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """Texto en formato de exposición de Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'marketplace_stage_duration_seconds',
+    'Duración de cada etapa del servicio de recomendaciones',
+    ('stage',)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'marketplace_request_duration_seconds',
+    'Duración total de las solicitudes HTTP',
+    ('method', 'route', 'status')
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    'marketplace_requests_total',
+    'Solicitudes HTTP atendidas',
+    ('method', 'route', 'status')
+)
+
+@contextmanager
+def timed(stage: str):
+    """Medir una etapa y registrarla en el histograma de etapas"""
+    if not REGISTRY.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def record_stage(stage: str, elapsed: float):
+    """Registrar la duración de una etapa en el histograma y en la solicitud en curso"""
+    STAGE_SECONDS.observe(elapsed, stage)
+    timings = current_request.get()
+    if timings is not None:
+        timings.stages[stage] = timings.stages.get(stage, 0.0) + elapsed
@@ -0,0 +1,124 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import tracemalloc
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Funciones y líneas de asignación incluidas en los informes
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_ALLOCATIONS = 15
+
+class ProfileSession:
+    """Perfil de CPU (cProfile) y de memoria (tracemalloc) de una solicitud
+
+    cProfile solo observa el hilo que lo activa: el event loop usa el perfil
+    principal y cada llamada enviada al pool de hilos se perfila con uno
+    propio (runcall) que se combina al final. El perfil del event loop
+    también registra las corrutinas de otras solicitudes concurrentes.
+    cProfile y tracemalloc son globales al proceso: hay una sola sesión
+    activa a la vez y start() devuelve False si ya hay otra en curso.
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self, route: str):
+        self.id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.route = route
+        self.profile = cProfile.Profile()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._owns_tracing = False  # False si otro componente ya había activado tracemalloc
+        self.memory = None
+
+    def start(self) -> bool:
+        """Activar los perfiles; False (sin perfilar) si otra sesión está activa"""
+        if not ProfileSession._active.acquire(blocking=False):
+            return False
+        self._owns_tracing = not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.profile.enable()
+        return True
+
+    def stop(self):
+        try:
+            self.profile.disable()
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)
+            ])
+            if self._owns_tracing:
+                tracemalloc.stop()
+        finally:
+            ProfileSession._active.release()
+        self.memory = {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'top_allocations': [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+            ]
+        }
+
+    def runcall(self, function):
+        """Ejecutar function() en un hilo del pool con su propio perfil"""
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function)
+        finally:
+            with self._lock:
+                self.thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.profile)
+        with self._lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+        return stats
+
+    def cpu_report(self) -> str:
+        """Funciones con mayor tiempo acumulado, en texto de pstats"""
+        stream = io.StringIO()
+        stats = self.stats()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        return stream.getvalue()
+
+    def report(self) -> Dict:
+        return {
+            'id': self.id,
+            'route': self.route,
+            'cpu': self.cpu_report(),
+            'memory': self.memory
+        }
+
+    def save(self, directory: Path, keep: int) -> Path:
+        """Guardar el perfil (.prof para pstats/snakeviz) y el resumen (.json)"""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{self.id}.prof'
+        self.stats().dump_stats(path)
+        path.with_suffix('.json').write_text(json.dumps(self.report(), indent=2), encoding='utf-8')
+        _rotate(directory, keep)
+        logger.info(f"Perfil de {self.route} guardado en {path}")
+        return path
+
+def _rotate(directory: Path, keep: int):
+    """Conservar solo los `keep` perfiles más recientes"""
+    profiles = sorted(directory.glob('*.prof'), key=lambda path: path.stat().st_mtime_ns)
+    for path in profiles[:max(len(profiles) - keep, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.json').unlink(missing_ok=True)
+
+# Sesión de perfilado de la solicitud en curso (None en las no muestreadas)
+current_profile: ContextVar[Optional[ProfileSession]] = ContextVar('current_profile', default=None)
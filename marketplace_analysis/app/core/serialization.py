@@ -0,0 +1,33 @@
+import json
+import math
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # Dependencia opcional: se usa el codificador estándar
+    orjson = None
+
+# Claves no textuales (conteos por id) y arrays NumPy se codifican sin conversión previa
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+def dumps(value: Any) -> bytes:
+    """Codificar a JSON compacto en UTF-8 (orjson si está instalado)"""
+    if orjson is not None:
+        return orjson.dumps(value, option=ORJSON_OPTIONS)
+    try:
+        return _json_dumps(value)
+    except ValueError:
+        # NaN e infinitos no son JSON válido: igual que orjson, se codifican como null
+        return _json_dumps(_replace_non_finite(value))
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+def _replace_non_finite(value: Any) -> Any:
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _replace_non_finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite(item) for item in value]
+    return value
@@ -1,69 +1,226 @@
 # app/services/analyzer.py
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
+import logging
+from pathlib import Path
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+# Esquema explícito del catálogo para la ingesta por bloques
+CATALOG_SCHEMA = {
+    'product_id': 'int64',
+    'title': 'object',
+    'description': 'object',
+    'category': 'category',
+    'price': 'float32',
+    'rating': 'float32',
+    'reviews_count': 'float32',
+    'sales_last_30_days': 'float32',
+    'stock': 'float32',
+    'seller_rating': 'float32',
+    'shipping_time_days': 'float32',
+}
+
+# Conteos: se leen como float32 (admiten nulos) y se compactan a int32
+COUNT_COLUMNS = ['reviews_count', 'sales_last_30_days', 'stock', 'shipping_time_days']
+
+# Columnas numéricas que se normalizan
+NORMALIZED_COLUMNS = ['price', 'rating', 'reviews_count', 'sales_last_30_days']
+
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+# Ponderación de las características normalizadas en la puntuación del producto
+PRODUCT_SCORE_WEIGHTS = {
+    'price': 1.0,
+    'rating': 0.3,
+    'reviews_count': 0.2,
+    'sales_last_30_days': 0.2,
+}
 
 class ProductAnalyzer:
     def __init__(self):
-        self.price_scaler = MinMaxScaler()
-        
-    def load_data(self, file_path):
-        """Cargar y realizar limpieza inicial de datos"""
-        self.df = pd.read_csv(file_path)
-        print("Columnas disponibles:", self.df.columns.tolist())  # Para debug
+        # scikit-learn se importa aquí: el módulo también lo usan las estadísticas al servir
+        from sklearn.preprocessing import MinMaxScaler
+        # Un solo escalador multi-columna: mínimos y máximos en una pasada
+        self.feature_scaler = MinMaxScaler(clip=True)
+
+    def load_data(self, file_path, chunksize=None):
+        """Cargar y realizar limpieza inicial de datos
+
+        Con `chunksize` (o un archivo Parquet) el catálogo se lee por bloques
+        con el esquema tipado de CATALOG_SCHEMA.
+        """
+        if chunksize is None and not self._is_parquet(file_path):
+            self.df = pd.read_csv(file_path)
+        else:
+            self.df = self._concat_chunks(self.iter_chunks(file_path, chunksize or 100_000))
+        logger.debug(f"Columnas disponibles: {self.df.columns.tolist()}")
         return self.df
-    
+
+    def iter_chunks(self, file_path, chunksize=100_000, columns=None):
+        """Leer el catálogo por bloques tipados (CSV o Parquet)"""
+        if columns is None:
+            columns = list(CATALOG_SCHEMA)
+        if self._is_parquet(file_path):
+            chunks = self._iter_parquet(file_path, chunksize, columns)
+        else:
+            header = self.available_columns(file_path)
+            usecols = [col for col in columns if col in header]
+            chunks = pd.read_csv(
+                file_path,
+                usecols=usecols,
+                dtype={col: CATALOG_SCHEMA[col] for col in usecols},
+                chunksize=chunksize
+            )
+        for chunk in chunks:
+            yield self._apply_schema(chunk)
+
+    def process_stream(self, file_path, chunksize=100_000):
+        """Limpiar, extraer y normalizar el catálogo bloque a bloque
+
+        Una primera pasada ajusta el escalador solo con las columnas numéricas
+        presentes en el archivo; la segunda genera los bloques procesados. La
+        memoria pico depende del tamaño de bloque y no del archivo.
+        """
+        available = self.available_columns(file_path)
+        numeric_columns = [col for col in NORMALIZED_COLUMNS if col in available]
+        from sklearn.preprocessing import MinMaxScaler
+        self.feature_scaler = MinMaxScaler(clip=True)
+        for chunk in self.iter_chunks(file_path, chunksize, columns=numeric_columns):
+            self.feature_scaler.partial_fit(chunk[numeric_columns].values)
+        self.normalized_columns = numeric_columns
+
+        for chunk in self.iter_chunks(file_path, chunksize):
+            chunk = self._extract_features(chunk)
+            self._assign_normalized(chunk, numeric_columns, self.feature_scaler.transform(chunk[numeric_columns].values))
+            yield chunk
+
+    def load_processed(self, file_path, chunksize=100_000):
+        """Cargar el catálogo ya limpio y normalizado, procesado por bloques
+
+        Los bloques acotan la memoria de la lectura, la limpieza y la
+        normalización, pero el resultado se concatena en un solo DataFrame:
+        el entrenamiento (TF-IDF e índice de vecinos) necesita el catálogo
+        completo en memoria.
+        """
+        self.df = self._concat_chunks(self.process_stream(file_path, chunksize))
+        logger.info(f"Catálogo procesado por bloques: {len(self.df)} registros")
+        return self.df
+
+    def available_columns(self, file_path):
+        """Columnas del archivo (encabezado del CSV o esquema del Parquet)"""
+        if self._is_parquet(file_path):
+            import pyarrow.parquet as pq
+            return list(pq.ParquetFile(file_path).schema_arrow.names)
+        return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+    def _is_parquet(self, file_path):
+        return Path(file_path).suffix.lower() in PARQUET_SUFFIXES
+
+    def _iter_parquet(self, file_path, chunksize, columns):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Se requiere pyarrow para leer archivos Parquet") from e
+
+        parquet_file = pq.ParquetFile(file_path)
+        available = set(parquet_file.schema_arrow.names)
+        columns = [col for col in columns if col in available]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas().astype({col: CATALOG_SCHEMA[col] for col in columns})
+
+    def _apply_schema(self, chunk):
+        """Compactar tipos de un bloque: conteos a int32"""
+        for col in COUNT_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = chunk[col].fillna(0).astype('int32')
+        return chunk
+
+    def _concat_chunks(self, chunks):
+        """Concatenar bloques conservando las columnas categóricas"""
+        chunks = list(chunks)
+        if not chunks:
+            return pd.DataFrame(columns=list(CATALOG_SCHEMA))
+        for col in chunks[0].columns:
+            if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+                categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+                for chunk in chunks:
+                    chunk[col] = chunk[col].cat.set_categories(categories)
+        return pd.concat(chunks, ignore_index=True)
+
     def clean_text(self, text):
         """Limpieza básica de texto"""
         if pd.isna(text):
             return ""
         text = str(text).lower().strip()
         return text
-    
+
     def normalize_features(self):
         """Normalizar características numéricas"""
-        # Normalizar precio
-        self.df['price_normalized'] = self.price_scaler.fit_transform(
-            self.df[['price']].values
-        )
-        
-        # Normalizar otros campos numéricos si existen
-        for col in ['rating', 'reviews_count', 'sales_last_30_days']:
-            if col in self.df.columns:
-                self.df[f'{col}_normalized'] = self.price_scaler.fit_transform(
-                    self.df[[col]].values
-                )
+        # Una sola pasada de mínimos/máximos sobre todas las columnas presentes
+        columns = [col for col in NORMALIZED_COLUMNS if col in self.df.columns]
+        self.normalized_columns = columns
+        normalized = self.df[columns].to_numpy(np.float64, copy=True)
+        self.feature_scaler.fit(normalized)
+        # Transformar en sitio sobre la copia (sin la validación extra de transform)
+        normalized *= self.feature_scaler.scale_
+        normalized += self.feature_scaler.min_
+        np.clip(normalized, 0, 1, out=normalized)
+        self._assign_normalized(self.df, columns, normalized)
         return self.df
-    
+
+    def _assign_normalized(self, df, columns, normalized):
+        for position, col in enumerate(columns):
+            df[f'{col}_normalized'] = normalized[:, position]
+
     def extract_features(self):
         """Extraer características adicionales"""
+        self.df = self._extract_features(self.df)
+        return self.df
+
+    def _extract_features(self, df):
         # Procesar título
-        self.df['title_clean'] = self.df['title'].apply(self.clean_text)
-        
+        df['title_clean'] = self.clean_series(df['title'])
+
         # Procesar descripción si existe
-        if 'description' in self.df.columns:
-            self.df['description_clean'] = self.df['description'].apply(self.clean_text)
-        
+        if 'description' in df.columns:
+            df['description_clean'] = self.clean_series(df['description'])
+
         # Extraer categoría principal
-        self.df['main_category'] = self.df['category'].apply(
-            lambda x: x.split('/')[0] if pd.notna(x) else "Unknown"
-        )
-        
-        return self.df
+        df['main_category'] = self.main_category(df['category'])
+
+        return df
+
+    def clean_series(self, series):
+        """Versión vectorizada de clean_text para una columna completa"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Limpiar solo las categorías únicas y expandir por código
+            return self._expand_codes(series.cat.codes.to_numpy(), self.clean_series(pd.Series(series.cat.categories)), "")
+        if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            # Valores no textuales: convertir como str(x), igual que clean_text
+            series = series.fillna('').astype(str)
+        return series.str.lower().str.strip().fillna('')
+
+    def main_category(self, categories):
+        """Categoría principal (antes del primer '/') calculada una vez por categoría única"""
+        codes, uniques = pd.factorize(categories)
+        main = pd.Series(uniques.astype(str)).str.split('/').str[0]
+        return self._expand_codes(codes, main, "Unknown")
+
+    def _expand_codes(self, codes, values, missing):
+        # El código -1 (nulo) apunta al último elemento: el valor por defecto
+        lookup = np.append(values.to_numpy(dtype=object), missing)
+        return lookup[codes]
 
     def calculate_product_score(self):
         """Calcular puntuación del producto basada en múltiples factores"""
         # Inicializar score con precio normalizado
-        self.df['product_score'] = self.df['price_normalized']
-        
+        self.df['product_score'] = self.df['price_normalized'] * PRODUCT_SCORE_WEIGHTS['price']
+
         # Añadir otros factores si están disponibles
-        if 'rating' in self.df.columns:
-            self.df['product_score'] += self.df['rating_normalized'] * 0.3
-            
-        if 'reviews_count' in self.df.columns:
-            self.df['product_score'] += self.df['reviews_count_normalized'] * 0.2
-            
-        if 'sales_last_30_days' in self.df.columns:
-            self.df['product_score'] += self.df['sales_last_30_days_normalized'] * 0.2
-            
-        return self.df
\ No newline at end of file
+        for col, weight in PRODUCT_SCORE_WEIGHTS.items():
+            if col != 'price' and col in self.df.columns:
+                self.df['product_score'] += self.df[f'{col}_normalized'] * weight
+
+        return self.df
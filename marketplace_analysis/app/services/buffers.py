@@ -0,0 +1,50 @@
+import numpy as np
+
+# Capacidad mínima (en filas) al reservar un buffer nuevo
+MIN_CAPACITY = 16
+
+class RowBuffer:
+    """Array que crece por el final con capacidad libre (se duplica al llenarse)
+
+    extend() escribe las filas nuevas en la capacidad libre y devuelve una
+    vista de las filas ocupadas: agregar filas cuesta O(filas nuevas)
+    amortizado en lugar de copiar el array completo. Las filas ya escritas no
+    cambian, así que una vista anterior sigue siendo válida para los lectores.
+    Un array que no salió del buffer (recién cargado, mapeado en memoria) se
+    copia una sola vez, al primer crecimiento.
+    """
+
+    def __init__(self):
+        self._buffer = None
+        self._view = None
+
+    def extend(self, values: np.ndarray, new_values) -> np.ndarray:
+        """Vista de values con new_values agregadas al final"""
+        new_values = np.asarray(new_values, dtype=values.dtype)
+        if not self._is_current(values):
+            # Otro array (o una vista anterior): se adopta sin capacidad libre
+            self._buffer = values
+        length = len(values)
+        end = length + len(new_values)
+        if end > len(self._buffer):
+            buffer = np.empty((max(end, 2 * length, MIN_CAPACITY),) + values.shape[1:], dtype=values.dtype)
+            buffer[:length] = values
+            self._buffer = buffer
+        if end > length:  # Un array adoptado puede ser de solo lectura
+            self._buffer[length:end] = new_values
+        self._view = self._buffer[:end]
+        return self._view
+
+    def _is_current(self, values: np.ndarray) -> bool:
+        # La última vista o una equivalente (SciPy vuelve a cortar los arrays del CSR)
+        if values is self._view:
+            return True
+        buffer = self._buffer
+        return (
+            buffer is not None and values.base is buffer and len(values) == len(self._view)
+            and values.ctypes.data == buffer.ctypes.data and values.strides == buffer.strides
+        )
+
+    def __reduce__(self):
+        # La capacidad libre no se serializa: las vistas se guardan por su cuenta
+        return (RowBuffer, ())
@@ -0,0 +1,4 @@
+# Excepciones compartidas con la API: este módulo no importa dependencias pesadas
+
+class ReadOnlyModelError(ValueError):
+    """El modelo activo es una tabla de vecinos y no admite cambios en el catálogo"""
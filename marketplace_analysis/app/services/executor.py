@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+import asyncio
+import logging
+import time
+
+from app.core.metrics import REGISTRY, STAGE_SECONDS, RequestTimings, current_request, record_stage
+from app.core.profiling import current_profile
+
+if TYPE_CHECKING:
+    from app.services.recommender import ProductRecommender
+
+logger = logging.getLogger(__name__)
+
+# Modelo de cada proceso del pool (modo 'process')
+_worker_recommender = None
+
+def _load_worker_model(model_path: str):
+    global _worker_recommender
+    from app.services.recommender import ProductRecommender
+    _worker_recommender = ProductRecommender.load(model_path)
+
+def _call_worker_model(submitted: float, method: str, *args):
+    # Las etapas medidas en el proceso se devuelven con el resultado: las
+    # métricas del proceso hijo no se exponen. La espera en cola usa el reloj
+    # de pared, comparable entre procesos.
+    timings = RequestTimings()
+    timings.stages['queue_wait'] = max(time.time() - submitted, 0.0)
+    token = current_request.set(timings)
+    try:
+        return getattr(_worker_recommender, method)(*args), timings.stages
+    finally:
+        current_request.reset(token)
+
+def _measure_queue_wait(submitted: float, function):
+    # Tiempo en cola hasta que un hilo del pool toma la llamada
+    STAGE_SECONDS.observe(time.perf_counter() - submitted, 'queue_wait')
+    return function()
+
+class ExecutorSaturated(Exception):
+    """La cola de trabajo está llena: el cliente debe reintentar más tarde"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Servicio saturado, reintentar más tarde")
+        self.retry_after = retry_after
+
+class RecommendationExecutor:
+    """Ejecuta las llamadas del recomendador fuera del event loop con control de admisión
+
+    En modo 'thread' usa un pool de hilos acotado (NumPy libera el GIL). En
+    modo 'process' las lecturas se atienden en procesos que abren el modelo
+    guardado en `model_path` con mmap; las escrituras siguen en hilos sobre el
+    modelo del proceso principal. Las etapas medidas en los procesos (y su
+    espera en cola) se registran en las métricas del proceso principal. Como máximo se admiten `max_workers`
+    llamadas en ejecución más `max_queue` en espera; el resto se rechaza.
+    """
+
+    MODES = ('thread', 'process')
+
+    def __init__(self, max_workers: int, max_queue: int = 64, mode: str = 'thread',
+                 model_path: Optional[Path] = None, retry_after: int = 1):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de ejecución no soportado: {mode}")
+        if mode == 'process' and model_path is None:
+            raise ValueError("El modo 'process' requiere la ruta del modelo guardado")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.mode = mode
+        self.model_path = model_path
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommender')
+        self._processes = self._start_processes() if mode == 'process' else None
+
+    def _start_processes(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_load_worker_model,
+            initargs=(str(self.model_path),)
+        )
+
+    async def run(self, function, *args):
+        """Ejecutar function(*args) en el pool de hilos"""
+        return await self._submit(self._threads, partial(function, *args))
+
+    async def call(self, recommender: 'ProductRecommender', method: str, *args):
+        """Ejecutar un método de solo lectura del recomendador (en procesos si corresponde)"""
+        if self._processes is not None:
+            result, stages = await self._submit(
+                self._processes, partial(_call_worker_model, time.time(), method, *args)
+            )
+            if REGISTRY.enabled:
+                for stage, elapsed in stages.items():
+                    record_stage(stage, elapsed)
+            return result
+        return await self._submit(self._threads, partial(getattr(recommender, method), *args))
+
+    async def _submit(self, pool, function):
+        # El contador solo se modifica desde el event loop: no necesita candado
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Solicitud rechazada: {self.in_flight} llamadas en curso o en cola")
+            raise ExecutorSaturated(self.retry_after)
+        self.in_flight += 1
+        if pool is self._threads:
+            # run_in_executor no propaga el contexto: la sesión de perfilado se pasa explícitamente
+            session = current_profile.get()
+            if session is not None:
+                function = partial(session.runcall, function)
+            function = partial(_measure_queue_wait, time.perf_counter(), function)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, function)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def reload(self):
+        """Reabrir el modelo guardado en los procesos (tras reemplazar el modelo)"""
+        if self._processes is None:
+            return
+        previous, self._processes = self._processes, self._start_processes()
+        previous.shutdown(wait=False)
+        logger.info(f"Procesos del executor recargados desde {self.model_path}")
+
+    def stats(self) -> Dict:
+        """Ocupación y contadores de la capa de ejecución"""
+        return {
+            'mode': self.mode,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected
+        }
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
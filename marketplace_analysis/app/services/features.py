@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from scipy import sparse
+
+from app.services.buffers import RowBuffer
+
+# Hasta este número de filas consulta se multiplica sin la transpuesta cacheada
+SMALL_QUERY_ROWS = 64
+
+# Cuantización int8: valor máximo y filas dequantizadas a la vez al puntuar
+INT8_MAX = 127
+QUANTIZED_CHUNK_ROWS = 65536
+
+# Columnas que forman el documento TF-IDF de cada producto, en orden
+TEXT_COLUMNS = ('title', 'description', 'category')
+
+# Por debajo de este número de filas no compensa repartir el texto entre procesos
+PARALLEL_TEXT_MIN_ROWS = 200_000
+
+def build_documents(df: pd.DataFrame, n_jobs: int = 1) -> pd.Series:
+    """Ensamblar los documentos TF-IDF con operaciones de texto por columna
+
+    Equivale a unir str(valor).lower().strip() de cada columna con espacios
+    (los nulos quedan como 'nan' y una columna ausente como texto vacío).
+    Con `n_jobs` > 1 y catálogos grandes, los bloques se reparten entre procesos.
+    """
+    columns = pd.DataFrame(
+        {col: df[col] if col in df.columns else '' for col in TEXT_COLUMNS},
+        index=df.index
+    )
+    if n_jobs <= 1 or len(columns) < PARALLEL_TEXT_MIN_ROWS:
+        return _assemble_documents(columns)
+
+    chunks = np.array_split(np.arange(len(columns)), n_jobs)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        parts = executor.map(_assemble_documents, [columns.iloc[rows] for rows in chunks])
+        return pd.concat(list(parts))
+
+def _assemble_documents(columns: pd.DataFrame) -> pd.Series:
+    cleaned = [columns[col].astype(str).str.lower().str.strip() for col in columns.columns]
+    return cleaned[0].str.cat(cleaned[1:], sep=' ')
+
+class FeatureMatrix:
+    """Matriz de características por bloques: TF-IDF disperso (CSR) + numéricas densas"""
+
+    _buffers = None  # RowBuffer de data, indices, indptr y numeric, compartidos por vstack()
+
+    def __init__(self, text: sparse.csr_matrix, numeric: np.ndarray, scales: np.ndarray = None):
+        # Ambos bloques comparten la normalización L2 de la fila completa,
+        # por lo que el producto punto entre filas es la similitud coseno
+        self.text = text
+        self.numeric = numeric
+        self.scales = scales  # Escala por dimensión si los bloques están cuantizados en int8
+        self._text_t = None
+
+    @classmethod
+    def from_blocks(cls, text, numeric=None, numeric_weight: float = 1.0):
+        """Combinar bloques ponderando las numéricas y normalizar cada fila"""
+        text = sparse.csr_matrix(text)
+        if numeric is None:
+            numeric = np.zeros((text.shape[0], 0), dtype=text.dtype)
+        numeric = np.asarray(numeric, dtype=text.dtype) * numeric_weight
+
+        squared_norms = np.asarray(text.multiply(text).sum(axis=1)).ravel()
+        squared_norms += np.einsum('ij,ij->i', numeric, numeric)
+        norms = np.sqrt(squared_norms)
+        norms[norms == 0] = 1.0
+        inverse = (1.0 / norms).astype(text.dtype)
+
+        text = sparse.csr_matrix(sparse.diags(inverse) @ text)
+        return cls(text, numeric * inverse[:, None])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.text.dtype
+
+    @property
+    def shape(self):
+        return (self.text.shape[0], self.text.shape[1] + self.numeric.shape[1])
+
+    @property
+    def nnz(self) -> int:
+        return self.text.nnz + self.numeric.size
+
+    @property
+    def nbytes(self) -> int:
+        text = self.text
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return text.data.nbytes + text.indices.nbytes + text.indptr.nbytes + self.numeric.nbytes + scales
+
+    def __len__(self):
+        return self.text.shape[0]
+
+    def __getitem__(self, rows):
+        if np.isscalar(rows):
+            rows = [rows]
+        return FeatureMatrix(self.text[rows], self.numeric[rows], self.scales)
+
+    def dot(self, other: 'FeatureMatrix') -> np.ndarray:
+        """Similitud densa (filas de self × filas de other) sin densificar el TF-IDF"""
+        if self.scales is not None or other.scales is not None:
+            return self._quantized_dot(other)
+        if other._text_t is None and len(self) <= SMALL_QUERY_ROWS:
+            # Consultas pequeñas: evitar transponer (y cachear) toda la matriz
+            scores = (other.text @ self.text.T).T.toarray()
+        else:
+            scores = (self.text @ other._transposed_text()).toarray()
+        if other.numeric.shape[1]:
+            scores += self.numeric @ other.numeric.T
+        return scores
+
+    def _quantized_dot(self, other: 'FeatureMatrix') -> np.ndarray:
+        # Dequantizar other por tramos de filas: la copia float32 queda acotada
+        query = self.dequantize()
+        scores = np.empty((len(self), len(other)), dtype=np.float32)
+        for start in range(0, len(other), QUANTIZED_CHUNK_ROWS):
+            chunk = other[start:start + QUANTIZED_CHUNK_ROWS].dequantize()
+            scores[:, start:start + len(chunk)] = query.dot(chunk)
+        return scores
+
+    def astype(self, dtype) -> 'FeatureMatrix':
+        """Copia de la matriz con otro tipo numérico (sin copiar si ya lo tiene); int8 cuantiza"""
+        dtype = np.dtype(dtype)
+        if dtype == np.int8:
+            return self.quantize()
+        if self.scales is not None:
+            return self.dequantize(dtype)
+        if self.text.dtype == dtype and self.numeric.dtype == dtype:
+            return self
+        return FeatureMatrix(self.text.astype(dtype), self.numeric.astype(dtype))
+
+    def quantize(self, scales: np.ndarray = None) -> 'FeatureMatrix':
+        """Cuantización escalar int8 con una escala por dimensión (máximo absoluto / 127)
+
+        Con `scales` se reutilizan las escalas de otra matriz (filas nuevas de
+        un modelo ya cuantizado); los valores fuera de rango se saturan.
+        """
+        if self.scales is not None:
+            return self
+        n_text = self.text.shape[1]
+        if scales is None:
+            text_max = abs(self.text).max(axis=0).toarray().ravel()
+            numeric_max = np.abs(self.numeric).max(axis=0, initial=0)
+            scales = np.concatenate([text_max, numeric_max]).astype(np.float32) / INT8_MAX
+            scales[scales == 0] = 1.0
+        text_data = np.rint(self.text.data / scales[self.text.indices])
+        text = sparse.csr_matrix(
+            (np.clip(text_data, -INT8_MAX, INT8_MAX).astype(np.int8), self.text.indices, self.text.indptr),
+            shape=self.text.shape
+        )
+        numeric = np.clip(np.rint(self.numeric / scales[n_text:]), -INT8_MAX, INT8_MAX).astype(np.int8)
+        return FeatureMatrix(text, numeric, scales)
+
+    def dequantize(self, dtype=np.float32) -> 'FeatureMatrix':
+        """Matriz en punto flotante a partir de la versión int8"""
+        if self.scales is None:
+            return self.astype(dtype)
+        n_text = self.text.shape[1]
+        text = sparse.csr_matrix(
+            ((self.text.data * self.scales[self.text.indices]).astype(dtype), self.text.indices, self.text.indptr),
+            shape=self.text.shape
+        )
+        return FeatureMatrix(text, (self.numeric * self.scales[n_text:]).astype(dtype))
+
+    def vstack(self, other: 'FeatureMatrix') -> 'FeatureMatrix':
+        """Nueva matriz con las filas de other agregadas al final (en la representación de self)
+
+        Los componentes crecen en buffers con capacidad libre: las filas de
+        self no se copian y la matriz anterior sigue siendo válida.
+        """
+        other = other.quantize(self.scales) if self.scales is not None else other.astype(self.dtype)
+        if self._buffers is None:
+            self._buffers = tuple(RowBuffer() for _ in range(4))
+        data, indices, indptr, numeric = self._buffers
+        text = sparse.csr_matrix(
+            (
+                data.extend(self.text.data, other.text.data),
+                indices.extend(self.text.indices, other.text.indices),
+                indptr.extend(self.text.indptr, other.text.indptr[1:] + self.text.indptr[-1])
+            ),
+            shape=(len(self) + len(other), self.text.shape[1]),
+            copy=False
+        )
+        stacked = FeatureMatrix(text, numeric.extend(self.numeric, other.numeric), self.scales)
+        stacked._buffers = self._buffers
+        return stacked
+
+    def project(self, planes: np.ndarray) -> np.ndarray:
+        """Proyectar las filas sobre una matriz densa (columnas = dimensiones de la fila completa)"""
+        if self.scales is not None:
+            # Dequantizar por tramos de filas: la copia float32 queda acotada
+            return np.vstack([
+                self[start:start + QUANTIZED_CHUNK_ROWS].dequantize().project(planes)
+                for start in range(0, len(self), QUANTIZED_CHUNK_ROWS)
+            ])
+        n_text = self.text.shape[1]
+        projection = np.asarray(self.text @ planes[:n_text])
+        if self.numeric.shape[1]:
+            projection += self.numeric @ planes[n_text:]
+        return projection
+
+    def _transposed_text(self):
+        # Cachear la transpuesta para no convertirla en cada bloque
+        if self._text_t is None:
+            self._text_t = self.text.T.tocsr()
+        return self._text_t
+
+    def tocsr(self) -> sparse.csr_matrix:
+        """Representación dispersa combinada"""
+        if self.scales is not None:
+            return self.dequantize().tocsr()
+        return sparse.hstack([self.text, sparse.csr_matrix(self.numeric)], format='csr')
+
+    def save(self, directory: Path):
+        """Guardar los componentes CSR y el bloque numérico como .npy"""
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / 'text_data.npy', self.text.data)
+        np.save(directory / 'text_indices.npy', self.text.indices)
+        np.save(directory / 'text_indptr.npy', self.text.indptr)
+        np.save(directory / 'numeric.npy', self.numeric)
+        if self.scales is not None:
+            np.save(directory / 'scales.npy', self.scales)
+
+    @classmethod
+    def load(cls, directory: Path, n_text_columns: int, mmap_mode: str = None):
+        """Reconstruir la matriz desde sus componentes, opcionalmente mapeados en memoria"""
+        indptr = np.load(directory / 'text_indptr.npy', mmap_mode=mmap_mode)
+        text = sparse.csr_matrix(
+            (
+                np.load(directory / 'text_data.npy', mmap_mode=mmap_mode),
+                np.load(directory / 'text_indices.npy', mmap_mode=mmap_mode),
+                indptr
+            ),
+            shape=(len(indptr) - 1, n_text_columns),
+            copy=False
+        )
+        scales = np.load(directory / 'scales.npy') if (directory / 'scales.npy').exists() else None
+        return cls(text, np.load(directory / 'numeric.npy', mmap_mode=mmap_mode), scales)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_text_t'] = None
+        return state
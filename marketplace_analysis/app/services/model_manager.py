@@ -0,0 +1,212 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+import logging
+import threading
+import time
+
+if TYPE_CHECKING:
+    from app.services.recommender import ProductRecommender
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = Path('data/raw/products.csv')
+
+def train_recommender(data_path=DATA_PATH, chunksize: Optional[int] = None, **options) -> 'ProductRecommender':
+    """Pipeline de entrenamiento: cargar y procesar el catálogo y ajustar el recomendador
+
+    Con `chunksize` el catálogo se limpia y normaliza por bloques (archivos
+    grandes); el catálogo procesado se entrena completo en memoria.
+    """
+    from app.services.analyzer import ProductAnalyzer
+    from app.services.recommender import ProductRecommender
+
+    analyzer = ProductAnalyzer()
+    if chunksize:
+        df = analyzer.load_processed(data_path, chunksize)
+    else:
+        df = analyzer.load_data(data_path)
+        logger.info(f"Datos cargados: {df.shape} registros")
+        analyzer.extract_features()
+        df = analyzer.normalize_features()
+    logger.info("Features procesadas")
+
+    return ProductRecommender(**options).fit(df)
+
+class ModelManager:
+    """Modelo activo de la API: reentrenamiento en segundo plano y reemplazo atómico
+
+    El modelo activo vive en `state.recommender`. Cada solicitud toma la
+    referencia una sola vez, así que las que están en curso terminan con el
+    modelo anterior mientras las nuevas ya usan el reemplazo. La carga
+    inicial también corre en segundo plano: hasta que termina no hay modelo
+    activo y la API responde que no está lista. `train` solo se usa cuando
+    no hay modelo guardado; los reentrenamientos parten del catálogo activo.
+    """
+
+    def __init__(self, state, model_path: Optional[Path] = None,
+                 train: Callable[[], 'ProductRecommender'] = train_recommender):
+        self.state = state
+        self.model_path = model_path
+        self.train = train
+        self._swap_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # Reentrenamiento y compactación, uno a la vez
+        self._job_lock = threading.Lock()
+        self._job = None
+        self.on_swap = []  # Funciones a llamar tras cada reemplazo del modelo
+        self.job_status = {
+            'state': 'idle',
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'error': None
+        }
+
+    @property
+    def recommender(self) -> 'ProductRecommender':
+        return self.state.recommender
+
+    @property
+    def ready(self) -> bool:
+        return getattr(self.state, 'recommender', None) is not None
+
+    @property
+    def is_training(self) -> bool:
+        return self._job is not None and self._job.is_alive()
+
+    def swap(self, recommender: 'ProductRecommender') -> 'ProductRecommender':
+        """Reemplazar el modelo activo y devolver el anterior"""
+        with self._swap_lock:
+            previous = getattr(self.state, 'recommender', None)
+            self.state.recommender = recommender
+        for callback in self.on_swap:
+            callback()
+        if previous is not None and previous.pending_updates and previous.successor is not recommender:
+            logger.warning(
+                f"El modelo reemplazado tenía {previous.pending_updates} cambios incrementales sin consolidar"
+            )
+        logger.info(
+            f"Modelo activo reemplazado: versión {recommender.model_version}, "
+            f"{len(recommender.product_indices)} productos"
+        )
+        return previous
+
+    def start_retraining(self) -> bool:
+        """Lanzar el reentrenamiento en un hilo; False si ya hay uno en curso"""
+        if not self._start_job('training', self._retrain, 'model-retraining'):
+            return False
+        logger.info("Reentrenamiento en segundo plano iniciado")
+        return True
+
+    def start_loading(self, warm_up: bool = True) -> bool:
+        """Cargar el modelo guardado (o entrenarlo si no existe) en un hilo"""
+        if not self._start_job('loading', lambda: self._load(warm_up), 'model-loading'):
+            return False
+        logger.info("Carga del modelo en segundo plano iniciada")
+        return True
+
+    def _start_job(self, state: str, target, name: str) -> bool:
+        with self._job_lock:
+            if self.is_training:
+                return False
+            self.job_status = {
+                'state': state,
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'finished_at': None,
+                'duration_seconds': None,
+                'error': None
+            }
+            self._job = threading.Thread(target=target, name=name, daemon=True)
+            self._job.start()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Esperar a que termine el reentrenamiento en curso"""
+        job = self._job
+        if job is not None:
+            job.join(timeout)
+        return not self.is_training
+
+    def rebuild(self, save: bool = True) -> int:
+        """Reentrenar sobre el catálogo activo, reemplazar el modelo y devolver los cambios consolidados
+
+        Se parte del almacén del modelo activo, no del CSV original: los
+        productos agregados, actualizados o eliminados por la API se
+        conservan, y las escrituras que llegan durante el reentrenamiento se
+        reenvían al modelo nuevo (ProductRecommender.compacted). El candado
+        evita que un reentrenamiento y una compactación simultáneos instalen
+        un modelo anterior sobre otro más nuevo.
+        """
+        with self._rebuild_lock:
+            recommender = self.recommender
+            pending = recommender.pending_updates
+            rebuilt = recommender.compacted()
+            try:
+                if save and self.model_path is not None:
+                    rebuilt.save(self.model_path)
+            finally:
+                # El modelo anterior ya reenvía sus escrituras al nuevo: se instala aunque falle el guardado
+                self.swap(rebuilt)
+        return pending
+
+    def _retrain(self):
+        self._run_job(self.rebuild, "Error en el reentrenamiento")
+
+    def _load(self, warm_up: bool):
+        def load():
+            from app.services.recommender import ProductRecommender
+
+            if self.model_path is not None and (self.model_path / 'manifest.json').exists():
+                logger.info(f"Cargando modelo desde {self.model_path}")
+                recommender = ProductRecommender.load(self.model_path)
+            else:
+                logger.info("No hay modelo guardado, entrenando uno nuevo")
+                recommender = self._train_and_save()
+            if warm_up:
+                recommender.warm_up()
+            self.swap(recommender)
+        self._run_job(load, "Error al cargar el modelo")
+
+    def _train_and_save(self) -> 'ProductRecommender':
+        recommender = self.train()
+        if self.model_path is not None:
+            recommender.save(self.model_path)
+        return recommender
+
+    def _run_job(self, job: Callable, error_message: str):
+        started = time.perf_counter()
+        try:
+            job()
+            state, error = 'idle', None
+        except Exception as e:
+            logger.error(f"{error_message}: {str(e)}")
+            state, error = 'failed', str(e)
+
+        self.job_status = {
+            **self.job_status,
+            'state': state,
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'duration_seconds': time.perf_counter() - started,
+            'error': error
+        }
+
+    def readiness(self) -> Dict:
+        """Estado de la carga del modelo para la sonda de disponibilidad"""
+        return {
+            'ready': self.ready,
+            'model_version': self.recommender.model_version if self.ready else None,
+            'loading': dict(self.job_status)
+        }
+
+    def status(self) -> Dict:
+        """Modelo activo (versión, fecha y duración del entrenamiento) y último reentrenamiento"""
+        recommender = self.recommender
+        return {
+            'model_version': recommender.model_version,
+            'built_at': recommender.built_at,
+            'build_seconds': recommender.build_seconds,
+            'n_products': len(recommender.product_indices),
+            'pending_updates': recommender.pending_updates,
+            'index_backend': recommender.index_backend,
+            'retraining': dict(self.job_status)
+        }
@@ -0,0 +1,422 @@
+import numpy as np
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.services.buffers import RowBuffer
+from app.services.features import QUANTIZED_CHUNK_ROWS, FeatureMatrix
+
+logger = logging.getLogger(__name__)
+
+# Bytes por celda de un bloque: puntajes float32, su negación en argpartition
+# y los índices int64 que devuelve argpartition
+TILE_BYTES_PER_CELL = 16
+
+class NeighborIndex:
+    """Índice de vecinos: ids y puntajes de los top-K productos más similares por fila
+
+    Las escrituras reemplazan filas en el lugar con set_rows(), que incrementa
+    `generation` antes y después: impar mientras escribe. neighbors() vuelve a
+    leer si la generación cambió, así nunca combina ids y puntajes de
+    versiones distintas de una fila.
+    """
+
+    generation = 0
+    _buffers = None  # RowBuffer de indices y scores, creados al primer append
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray):
+        # indices[i] contiene las filas vecinas de i ordenadas por similitud
+        # descendente; las posiciones vacías se marcan con -1
+        self.indices = indices
+        self.scores = scores
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.indices.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.scores.nbytes
+
+    def save(self, directory: Path):
+        """Guardar ids (uint32, vacío = 0xFFFFFFFF) y puntajes como .npy"""
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / 'indices.npy', self.indices.view(np.uint32))
+        np.save(directory / 'scores.npy', self.scores)
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: str = None):
+        """Abrir el índice guardado, opcionalmente mapeado en memoria"""
+        indices = np.load(directory / 'indices.npy', mmap_mode=mmap_mode)
+        if indices.dtype == np.uint32:
+            # Mismos bits que int32 con -1 como vacío: vista sin copia
+            indices = indices.view(np.int32)
+        return cls(indices, np.load(directory / 'scores.npy', mmap_mode=mmap_mode))
+
+    def astype(self, score_dtype) -> 'NeighborIndex':
+        """Índice con los puntajes en otro tipo (float16 los reduce a la mitad)"""
+        if self.scores.dtype == score_dtype:
+            return self
+        return NeighborIndex(self.indices, self.scores.astype(score_dtype))
+
+    def kth_scores(self) -> np.ndarray:
+        """Puntaje del último vecino de cada fila (-inf si la lista no está completa)"""
+        if self.n_neighbors == 0:
+            return np.full(len(self), np.inf, dtype=np.float32)
+        return np.where(self.indices[:, -1] < 0, -np.inf, self.scores[:, -1])
+
+    def neighbors(self, rows, n: int):
+        """Ids y puntajes de los n primeros vecinos de varias filas, de una misma versión"""
+        while True:
+            generation = self.generation
+            indices, scores = self.indices[rows, :n], self.scores[rows, :n]
+            if generation % 2 == 0 and generation == self.generation:
+                return indices, scores
+            time.sleep(0)  # Ceder el GIL al escritor
+
+    def set_rows(self, rows, indices: np.ndarray, scores: np.ndarray):
+        """Reemplazar las listas de vecinos de varias filas (los escritores se serializan fuera)"""
+        self.generation += 1
+        try:
+            self.indices[rows] = indices
+            self.scores[rows] = scores
+        finally:
+            self.generation += 1
+
+    def append(self, n_rows: int):
+        """Agregar filas vacías al final del índice (O(n_rows) amortizado)"""
+        if self._buffers is None:
+            self._buffers = (RowBuffer(), RowBuffer())
+        indices, scores = self._buffers
+        self.generation += 1
+        try:
+            self.indices = indices.extend(self.indices, np.full((n_rows, self.n_neighbors), -1, dtype=np.int32))
+            self.scores = scores.extend(self.scores, np.zeros((n_rows, self.n_neighbors), dtype=self.scores.dtype))
+        finally:
+            self.generation += 1
+
+    def insert(self, rows: np.ndarray, candidate: int, candidate_scores: np.ndarray):
+        """Insertar un candidato en las listas de vecinos de varias filas"""
+        candidates = np.full((len(rows), 1), candidate, dtype=np.int32)
+        self.set_rows(rows, *merge_top_k(
+            self.indices[rows], self.scores[rows], candidates,
+            np.asarray(candidate_scores, dtype=np.float32)[:, None], self.n_neighbors
+        ))
+
+    @classmethod
+    def build(cls, matrix: FeatureMatrix, n_neighbors: int, block_size: int = 1024,
+              n_jobs: int = None, memory_budget_mb: float = None, log_progress: bool = True):
+        """Construir el índice por bloques de filas en float32 (memoria O(block_size·N))
+
+        Los bloques se reparten en un pool de `n_jobs` hilos (None = todos los
+        núcleos); NumPy y SciPy liberan el GIL en el producto y la selección.
+        `memory_budget_mb` limita la memoria de los bloques simultáneos. Una
+        matriz int8 no se dequantiza completa: ver _build_quantized().
+        """
+        n_rows = len(matrix)
+        k = max(0, min(n_neighbors, n_rows - 1))
+        indices = np.full((n_rows, k), -1, dtype=np.int32)
+        scores = np.zeros((n_rows, k), dtype=np.float32)
+        if k == 0:
+            return cls(indices, scores)
+
+        n_jobs = resolve_n_jobs(n_jobs)
+        rows_per_tile = tile_rows(n_rows, n_jobs, block_size, memory_budget_mb)
+        if matrix.scales is not None:
+            return cls._build_quantized(matrix, k, rows_per_tile, n_jobs, log_progress)
+
+        matrix = matrix.astype(np.float32)
+        matrix._transposed_text()  # Compartida por todos los hilos
+        starts = range(0, n_rows, rows_per_tile)
+        progress = TileProgress('Índice de vecinos', len(starts), enabled=log_progress)
+
+        def compute_tile(start):
+            stop = min(start + rows_per_tile, n_rows)
+            block = matrix[start:stop].dot(matrix)
+            indices[start:stop], scores[start:stop] = select_top_k(
+                block, k, exclude=np.arange(start, stop)
+            )
+            progress.advance()
+
+        run_tiles(compute_tile, starts, n_jobs)
+        return cls(indices, scores)
+
+    @classmethod
+    def _build_quantized(cls, matrix: FeatureMatrix, k: int, rows_per_tile: int, n_jobs: int,
+                         log_progress: bool = True):
+        """Índice exacto de una matriz int8 dequantizando un tramo de filas a la vez
+
+        El catálogo se recorre en tramos de QUANTIZED_CHUNK_ROWS filas: cada
+        tramo se dequantiza y transpone una sola vez, se puntúa contra todos
+        los bloques consulta (dequantizados dentro del bloque) y sus mejores
+        candidatos se fusionan con los de los tramos anteriores.
+        """
+        n_rows = len(matrix)
+        indices = np.full((n_rows, k), -1, dtype=np.int32)
+        scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+        chunk_starts = range(0, n_rows, QUANTIZED_CHUNK_ROWS)
+        progress = TileProgress('Índice de vecinos (int8)', len(chunk_starts), enabled=log_progress)
+        for chunk_start in chunk_starts:
+            chunk = matrix[chunk_start:chunk_start + QUANTIZED_CHUNK_ROWS].dequantize()
+            chunk._transposed_text()  # Compartida por todos los hilos
+            chunk_stop = chunk_start + len(chunk)
+
+            def compute_tile(start):
+                stop = min(start + rows_per_tile, n_rows)
+                block = matrix[start:stop].dequantize().dot(chunk)
+                # El propio producto, si cae dentro del tramo
+                own = np.arange(max(start, chunk_start), min(stop, chunk_stop))
+                block[own - start, own - chunk_start] = -np.inf
+                local, local_scores = select_top_k(block, k)
+                candidates = np.where(local >= 0, local + chunk_start, -1)
+                if chunk_start > 0 or local.shape[1] < k:  # El primer tramo no tiene con qué fusionarse
+                    candidates, local_scores = merge_top_k(
+                        indices[start:stop], scores[start:stop], candidates, local_scores, k
+                    )
+                indices[start:stop], scores[start:stop] = candidates, local_scores
+
+            run_tiles(compute_tile, range(0, n_rows, rows_per_tile), n_jobs)
+            progress.advance()
+        return cls(indices, scores)
+
+    @classmethod
+    def build_partitioned(cls, matrix: FeatureMatrix, partitions: np.ndarray, n_neighbors: int,
+                          block_size: int = 1024, n_jobs: int = None, memory_budget_mb: float = None):
+        """Construir un índice cuyos vecinos pertenecen a la misma partición (p. ej. categoría)"""
+        n_rows = len(matrix)
+        k = max(0, min(n_neighbors, n_rows - 1))
+        indices = np.full((n_rows, k), -1, dtype=np.int32)
+        scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+
+        order = np.argsort(partitions, kind='stable')
+        boundaries = np.flatnonzero(np.diff(partitions[order])) + 1
+        groups = [members for members in np.split(order, boundaries) if len(members) >= 2]
+        progress = TileProgress('Índice por partición', len(groups))
+        for members in groups:
+            local = cls.build(matrix[members], k, block_size, n_jobs, memory_budget_mb, log_progress=False)
+            width = local.n_neighbors
+            indices[members, :width] = np.where(
+                local.indices >= 0, members[np.maximum(local.indices, 0)], -1
+            )
+            scores[members, :width] = local.scores
+            progress.advance()
+        return cls(indices, scores)
+
+    @classmethod
+    def build_lsh(cls, matrix: FeatureMatrix, n_neighbors: int, n_tables: int = 8,
+                  n_bits: int = None, block_size: int = 1024, seed: int = 0,
+                  n_jobs: int = None, memory_budget_mb: float = None):
+        """Construir un índice aproximado con LSH de proyecciones aleatorias (hiperplanos)
+
+        Cada tabla asigna las filas a cubetas según `n_bits` proyecciones
+        binarizadas; los vecinos se buscan solo dentro de la misma cubeta y se
+        fusionan entre tablas. Más tablas mejoran el recall, más bits reducen
+        el tamaño de las cubetas (y el costo). Las filas que no completan K
+        candidatos se completan con búsqueda exacta.
+        """
+        n_rows = len(matrix)
+        k = max(0, min(n_neighbors, n_rows - 1))
+        indices = np.full((n_rows, k), -1, dtype=np.int32)
+        scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return cls(indices, np.zeros_like(scores))
+        if n_bits is None:
+            # Cubetas de ~8·K filas en promedio
+            n_bits = int(np.clip(np.round(np.log2(n_rows / (8 * k))), 1, 30))
+
+        # Una matriz int8 se dequantiza por cubeta (y por tramos al proyectar), no completa
+        if matrix.scales is None:
+            matrix = matrix.astype(np.float32)
+        n_jobs = resolve_n_jobs(n_jobs)
+        rng = np.random.default_rng(seed)
+        weights = 1 << np.arange(n_bits, dtype=np.int64)
+        progress = TileProgress('Tablas LSH', n_tables)
+        for table in range(n_tables):
+            planes = rng.standard_normal((matrix.shape[1], n_bits)).astype(np.float32)
+            # Umbral en la mediana de cada proyección: las características son
+            # no negativas y con umbral 0 casi todas caerían en la misma cubeta
+            projection = matrix.project(planes)
+            codes = (projection > np.median(projection, axis=0)).astype(np.int64) @ weights
+
+            order = np.argsort(codes, kind='stable')
+            boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+            buckets = [members for members in np.split(order, boundaries) if len(members) >= 2]
+
+            # Las cubetas de una tabla son disjuntas: se procesan en paralelo
+            def compute_bucket(members):
+                bucket = matrix[members].astype(np.float32)
+                for start in range(0, len(members), block_size):
+                    block_rows = members[start:start + block_size]
+                    block = bucket[start:start + block_size].dot(bucket)
+                    local, local_scores = select_top_k(
+                        block, k, exclude=np.arange(start, start + len(block_rows))
+                    )
+                    candidates = np.where(local >= 0, members[np.maximum(local, 0)], -1)
+                    indices[block_rows], scores[block_rows] = merge_top_k(
+                        indices[block_rows], scores[block_rows], candidates, local_scores, k
+                    )
+
+            run_tiles(compute_bucket, buckets, n_jobs)
+            progress.advance()
+            logger.debug(f"Tabla LSH {table + 1}/{n_tables} procesada ({n_bits} bits)")
+
+        # Completar con búsqueda exacta las filas sin K candidatos
+        incomplete = np.flatnonzero((indices < 0).any(axis=1))
+        if len(incomplete):
+            logger.warning(
+                f"LSH: {len(incomplete)} de {n_rows} filas sin {k} candidatos, completando con búsqueda exacta"
+            )
+            rows_per_tile = tile_rows(n_rows, n_jobs, block_size, memory_budget_mb)
+            if matrix.scales is None:
+                matrix._transposed_text()
+
+            def fill_tile(start):
+                block_rows = incomplete[start:start + rows_per_tile]
+                block = matrix[block_rows].dot(matrix)
+                indices[block_rows], scores[block_rows] = select_top_k(block, k, exclude=block_rows)
+
+            run_tiles(fill_tile, range(0, len(incomplete), rows_per_tile), n_jobs)
+
+        return cls(indices, scores)
+
+def resolve_n_jobs(n_jobs: int = None) -> int:
+    """Número de hilos de cómputo (None o <= 0: todos los núcleos disponibles)"""
+    if n_jobs is None or n_jobs <= 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+def tile_rows(n_columns: int, n_jobs: int, block_size: int, memory_budget_mb: float = None) -> int:
+    """Filas por bloque para que los bloques simultáneos quepan en el presupuesto de memoria"""
+    if memory_budget_mb is None:
+        return block_size
+    per_row = TILE_BYTES_PER_CELL * max(n_columns, 1) * n_jobs
+    return int(np.clip(memory_budget_mb * 1e6 // per_row, 1, block_size))
+
+def run_tiles(function, tiles, n_jobs: int):
+    """Ejecutar function sobre cada bloque, en un pool de hilos si n_jobs > 1"""
+    tiles = list(tiles)
+    if n_jobs <= 1 or len(tiles) <= 1:
+        for tile in tiles:
+            function(tile)
+        return
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        # list() propaga la primera excepción de un bloque
+        list(executor.map(function, tiles))
+
+class TileProgress:
+    """Reportar el avance de un cómputo por bloques en pasos de ~10%"""
+
+    def __init__(self, label: str, total: int, enabled: bool = True):
+        self.label = label
+        self.total = total
+        self.enabled = enabled and total > 0
+        self.done = 0
+        self._next_report = 0.1
+        self._lock = threading.Lock()
+
+    def advance(self):
+        with self._lock:
+            self.done += 1
+            fraction = self.done / self.total
+            if not self.enabled or fraction < self._next_report:
+                return
+            self._next_report = np.floor(fraction * 10) / 10 + 0.1
+        logger.info(f"{self.label}: {self.done}/{self.total} bloques ({fraction:.0%})")
+
+def merge_top_k(indices_a, scores_a, indices_b, scores_b, k: int):
+    """Fusionar dos listas top-k por fila eliminando ids duplicados"""
+    indices = np.hstack([indices_a, indices_b])
+    scores = np.hstack([scores_a, scores_b]).astype(np.float32)
+    scores[indices < 0] = -np.inf
+
+    # Ordenar por id para detectar duplicados adyacentes
+    order = np.argsort(indices, axis=1, kind='stable')
+    indices = np.take_along_axis(indices, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    duplicated = np.zeros_like(indices, dtype=bool)
+    duplicated[:, 1:] = indices[:, 1:] == indices[:, :-1]
+    scores[duplicated] = -np.inf
+
+    top, top_scores = select_top_k(scores, k)
+    top_indices = np.where(top >= 0, np.take_along_axis(indices, np.maximum(top, 0), axis=1), -1)
+    return top_indices.astype(np.int32), top_scores
+
+def rerank_top_k(indices, scores, quality: np.ndarray, quality_weight: float, k: int):
+    """Reordenar candidatos por (1 - w)·similitud + w·calidad y conservar los k mejores
+
+    Todo opera sobre los arrays de candidatos (filas × M): la calidad se lee
+    por índice del array precalculado, sin consultar el catálogo. Se ordena
+    el puntaje combinado negado, armado sobre un único array; argpartition
+    separa los k mejores y solo esos se ordenan. Las selecciones usan
+    posiciones planas con take en lugar de índices 2D. Devuelve ids,
+    similitudes originales y puntajes combinados.
+    """
+    weight = float(quality_weight)
+    cost = quality.take(indices)
+    cost *= -weight
+    if weight < 1.0:
+        cost += np.multiply(scores, weight - 1.0, dtype=np.float32)
+    # Las posiciones vacías (-1) van al final de cada lista: basta mirar la última columna
+    if len(indices) and indices[:, -1].min() < 0:
+        cost[indices < 0] = np.inf
+
+    n_rows, n_candidates = cost.shape
+    k = min(k, n_candidates)
+    if k == 0:
+        return indices[:, :0], scores[:, :0], cost[:, :0]
+    partial = k < n_candidates
+    top = np.argpartition(cost, k - 1, axis=1)[:, :k] if partial else np.argsort(cost, axis=1)
+    if n_rows > 1:  # Con una sola fila las posiciones ya son planas
+        top += np.arange(0, cost.size, n_candidates)[:, None]
+    if partial:
+        order = cost.take(top).argsort(axis=1)
+        if n_rows > 1:
+            order += np.arange(0, top.size, k)[:, None]
+        top = top.take(order)
+    blended = cost.take(top)
+    np.negative(blended, out=blended)
+    return indices.take(top), scores.take(top), blended
+
+def recall_at_k(approx_indices: np.ndarray, exact_indices: np.ndarray) -> float:
+    """Fracción promedio de vecinos exactos recuperados por el índice aproximado"""
+    k = exact_indices.shape[1]
+    if k == 0:
+        return 1.0
+    hits = [
+        len(np.intersect1d(approx[approx >= 0], exact[exact >= 0]))
+        for approx, exact in zip(approx_indices[:, :k], exact_indices)
+    ]
+    valid = np.maximum((exact_indices >= 0).sum(axis=1), 1)
+    return float(np.mean(np.array(hits) / valid))
+
+def select_top_k(scores: np.ndarray, k: int, exclude=None):
+    """Seleccionar los k mayores puntajes por fila en O(N): argpartition + sort de los k ganadores
+
+    `exclude` indica, por fila, la columna a descartar (el propio producto).
+    Devuelve índices y puntajes ordenados de forma descendente; si una fila
+    tiene menos de k candidatos válidos, se rellena con -1.
+    """
+    scores = np.atleast_2d(scores)
+    n_rows, n_cols = scores.shape
+    if exclude is not None:
+        scores[np.arange(n_rows), exclude] = -np.inf
+    k = min(k, n_cols)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int32), np.empty((n_rows, 0), dtype=np.float32)
+
+    if k < n_cols:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    top_scores = np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+    top[np.isneginf(top_scores)] = -1
+    return top, top_scores
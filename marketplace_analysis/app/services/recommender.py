@@ -1,12 +1,28 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
+from scipy import sparse
 from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from pathlib import Path
+import itertools
+import json
+import mmap
 import pickle
 import os
+import shutil
 import logging
+import threading
+import time
+
+from app.core.metrics import timed
+from app.core.serialization import dumps
+from app.services.buffers import RowBuffer
+from app.services.cache import ResultCache
+from app.services.errors import ReadOnlyModelError
+from app.services.features import FeatureMatrix, build_documents
+from app.services.neighbors import NeighborIndex, recall_at_k, rerank_top_k, select_top_k
+from app.services.stats import CatalogStats
+from app.services.store import PayloadFragments, ProductStore, StringColumn
 
 # Configurar logging con más detalle
 logging.basicConfig(
@@ -14,40 +30,179 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+request_logger = logging.getLogger('app.requests')  # Logs por solicitud (silenciables)
+
+# Versiones de modelo únicas dentro del proceso (claves de caché)
+_model_versions = itertools.count(1)
+
+# Versión del formato en disco de save()/load()
+MODEL_FORMAT_VERSION = 1
+
+# Posiciones guardadas del orden por calidad precalculado (n mayores se re-ordenan al vuelo)
+RANKED_DEPTH = 20
+
+# Margen al buscar las listas que contienen una fila: cubre el redondeo de los puntajes float16
+NEIGHBOR_SCORE_MARGIN = 1e-3
+
+# Tipos de artefacto: modelo completo o tabla de vecinos de solo lectura para servir
+ARTIFACT_MODEL = 'model'
+ARTIFACT_NEIGHBOR_TABLE = 'neighbor_table'
+
+# Características numéricas usadas en la matriz de características
+NUMERIC_FEATURES = [
+    'price',
+    'rating',
+    'reviews_count',
+    'sales_last_30_days',
+    'stock',
+    'seller_rating',
+    'shipping_time_days'
+]
 
 class ProductRecommender:
-    def __init__(self):
+    INDEX_BACKENDS = ('exact', 'lsh')
+    CATEGORY_LEVELS = ('category', 'main_category')
+    VECTOR_DTYPES = ('float64', 'float32', 'int8')
+    SCORE_DTYPES = ('float32', 'float16')
+
+    def __init__(self, n_neighbors: int = 50, block_size: int = 1024, numeric_weight: float = 1.0,
+                 index_backend: str = 'exact', lsh_tables: int = 8, lsh_bits: Optional[int] = None,
+                 cache_size: int = 10000, cache_ttl: float = 300.0, category_level: str = 'category',
+                 text_jobs: int = 1, n_jobs: Optional[int] = None,
+                 memory_budget_mb: Optional[float] = None, vector_dtype: str = 'float32',
+                 score_dtype: str = 'float16', quality_weight: float = 0.0, rerank_candidates: int = 50):
         """Inicializar el sistema de recomendación"""
         logger.info("Inicializando sistema de recomendación")
-        self.tfidf = TfidfVectorizer(stop_words='english')
-        self.similarity_matrix = None
-        self.feature_matrix = None  # Cambiado de product_features
+        if index_backend not in self.INDEX_BACKENDS:
+            raise ValueError(f"Backend de índice no soportado: {index_backend}")
+        if category_level not in self.CATEGORY_LEVELS:
+            raise ValueError(f"Nivel de categoría no soportado: {category_level}")
+        if vector_dtype not in self.VECTOR_DTYPES:
+            raise ValueError(f"Tipo de vectores no soportado: {vector_dtype}")
+        if score_dtype not in self.SCORE_DTYPES:
+            raise ValueError(f"Tipo de puntajes no soportado: {score_dtype}")
+        self._check_quality_weight(quality_weight)
+        # scikit-learn solo se importa al entrenar o al transformar productos nuevos
+        self._tfidf = None
+        self._numeric_scaler = None
+        self._saved_transformers = None  # Vocabulario, idf y rango numérico de un modelo cargado
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.numeric_weight = numeric_weight  # Peso del bloque numérico frente al TF-IDF
+        self.index_backend = index_backend  # 'exact' o 'lsh' (aproximado)
+        self.lsh_tables = lsh_tables        # Más tablas: más recall, más costo
+        self.lsh_bits = lsh_bits            # Más bits: cubetas más pequeñas (None = automático)
+        self.neighbor_index = None  # Top-K vecinos por producto, reemplaza la matriz N×N
+        self.category_index = None  # Top-K vecinos restringidos a la categoría de cada producto
+        self.category_level = category_level  # 'category' o 'main_category' (partición)
+        self.text_jobs = text_jobs  # Procesos para ensamblar los documentos en catálogos grandes
+        self.n_jobs = n_jobs  # Hilos para construir los índices (None = todos los núcleos)
+        self.memory_budget_mb = memory_budget_mb  # Tope de memoria de los bloques simultáneos
+        self.vector_dtype = vector_dtype  # Almacenamiento de las características ('int8' = cuantizado)
+        self.score_dtype = score_dtype    # Almacenamiento de los puntajes de los índices de vecinos
+        self.quality_weight = quality_weight  # Peso de la calidad al re-ordenar (0 = solo similitud)
+        self.rerank_candidates = rerank_candidates  # Candidatos por similitud que se re-ordenan
+        self.quality_scores = None  # Puntuación del producto por fila en [0, 1]
+        self.ranked_neighbors = None  # (peso, {same_category: (filas, similitudes, combinados)}) del peso del modelo
+        self.categories = []  # Nombre de cada partición por código
+        self.category_codes = None  # Código de partición por fila
+        self._category_lookup = {}
+        self.feature_matrix = None  # FeatureMatrix normalizada por fila: coseno = producto punto
         self.tfidf_matrix = None    # Agregado para mantener la matriz TF-IDF
         self.product_indices = {}
         self.inverse_indices = {}
-        self.df = None
+        self.store = None  # ProductStore columnar usado en el camino de servicio
+        self.fragments = None  # PayloadFragments del almacén activo (respuestas JSON)
+        self.stats = None  # CatalogStats precalculadas del catálogo activo
+        self._df = None
+        self.numeric_columns = []
+        self.pending_updates = 0  # Cambios incrementales desde el último entrenamiento
+        self._write_lock = threading.Lock()
+        self._buffers = {'category_codes': RowBuffer(), 'quality_scores': RowBuffer()}  # Crecimiento por escrituras
+        self.successor = None  # Modelo compactado que recibe las escrituras tras compacted()
+        self.model_version = 0  # Cambia con cada entrenamiento, carga o cambio del catálogo
+        self.built_at = None  # Fecha (ISO, UTC) del entrenamiento del modelo
+        self.build_seconds = None  # Duración del entrenamiento
+        self.cache = ResultCache(cache_size, cache_ttl)
         self.model_data = {}
 
+    @property
+    def tfidf(self):
+        """Vectorizador TF-IDF (se construye al primer uso)"""
+        if self._tfidf is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            tfidf = TfidfVectorizer(stop_words='english')
+            if self._saved_transformers is not None:
+                tfidf.vocabulary_ = self._saved_transformers['vocabulary']
+                tfidf.idf_ = self._saved_transformers['idf']
+            self._tfidf = tfidf
+        return self._tfidf
+    
+    @tfidf.setter
+    def tfidf(self, tfidf):
+        self._tfidf = tfidf
+    
+    @property
+    def numeric_scaler(self):
+        """Escalador de las numéricas (en modelos cargados se reconstruye al primer uso)"""
+        if self._numeric_scaler is None and self._saved_transformers is not None:
+            from sklearn.preprocessing import MinMaxScaler
+            scaler = MinMaxScaler()
+            numeric_range = self._saved_transformers['numeric_range']
+            if self.numeric_columns:
+                scaler.fit(np.array([numeric_range['min'], numeric_range['max']]))
+            self._numeric_scaler = scaler
+        return self._numeric_scaler
+    
+    @numeric_scaler.setter
+    def numeric_scaler(self, scaler):
+        self._numeric_scaler = scaler
+    
+    @property
+    def read_only(self) -> bool:
+        """True para una tabla de vecinos cargada (sin características para recalcular)"""
+        return self.store is not None and self.feature_matrix is None
+    
+    @staticmethod
+    def _check_quality_weight(quality_weight: float):
+        if not 0.0 <= quality_weight <= 1.0:
+            raise ValueError(f"El peso de la calidad debe estar entre 0 y 1: {quality_weight}")
+    
+    @staticmethod
+    def _check_n_neighbors(n: int):
+        if n < 1:
+            raise ValueError(f"El número de vecinos debe ser al menos 1: {n}")
+
+    def _require_features(self):
+        if self.read_only:
+            raise ReadOnlyModelError("El modelo es una tabla de vecinos de solo lectura, reentrenar para modificarlo")
+    
+    @property
+    def df(self):
+        """Vista DataFrame del catálogo, materializada bajo demanda desde el almacén"""
+        if self.store is None:
+            return None
+        if self._df is None:
+            self._df = self.store.to_frame()
+        return self._df
+
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """Obtener información de un producto por su ID"""
         try:
             if product_id not in self.product_indices:
                 logger.warning(f"Producto {product_id} no encontrado")
                 return None
-                
-            product_info = self.df.loc[self.df['product_id'] == product_id].iloc[0]
-            
-            return {
-                "product_id": int(product_id),
-                "title": str(product_info["title"]),
-                "price": float(product_info["price"]),
-                "rating": float(product_info.get("rating", 0)),
-                "category": str(product_info["category"]),                           
-                "reviews_count": int(product_info.get("reviews_count", 0))
-            }
+            return self.store.get(self.product_indices[product_id])
         except Exception as e:
             logger.error(f"Error al obtener producto {product_id}: {str(e)}")
             return None
+    
+    def get_products(self, product_ids) -> List[Optional[Dict]]:
+        """Obtener información de varios productos en lote (None si no existe)"""
+        rows = [self.product_indices.get(pid, -1) for pid in product_ids]
+        found = [row for row in rows if row >= 0]
+        products = iter(self.store.get_many(found))
+        return [next(products) if row >= 0 else None for row in rows]
         
     def _preprocess_text(self, text):
         """Preprocesar texto para TF-IDF"""
@@ -58,6 +213,7 @@ class ProductRecommender:
     def fit(self, df):
         """Entrenar el sistema de recomendaciones"""
         logger.info("Iniciando entrenamiento del sistema de recomendaciones")
+        started = time.perf_counter()
         
         try:
             # Validar datos de entrada
@@ -65,8 +221,11 @@ class ProductRecommender:
             if not all(col in df.columns for col in required_columns):
                 raise ValueError(f"DataFrame debe contener las columnas: {required_columns}")
 
-            # Guardar el DataFrame
-            self.df = df.copy()
+            # Guardar el catálogo en el almacén columnar
+            self.store = ProductStore.from_frame(df)
+            self.stats = CatalogStats.from_store(self.store)
+            self.quality_scores = self.stats.quality_scores(self.store)
+            self._df = None
             logger.info(f"DataFrame cargado con {len(df)} registros")
             
             # Crear mapeo de índices
@@ -75,185 +234,901 @@ class ProductRecommender:
             logger.info(f"Índices creados para {len(self.product_indices)} productos")
             
             # Preparar características textuales
-            text_features = df.apply(
-                lambda row: ' '.join([
-                    self._preprocess_text(str(row['title'])),
-                    self._preprocess_text(str(row.get('description', ''))),
-                    self._preprocess_text(str(row['category']))
-                ]),
-                axis=1
-            )
+            text_features = build_documents(df, self.text_jobs)
             logger.info("Características textuales preparadas")
             
             # Crear matriz TF-IDF
             self.tfidf_matrix = self.tfidf.fit_transform(text_features)
             logger.info(f"Matriz TF-IDF creada con forma {self.tfidf_matrix.shape}")
             
-            # Preparar características numéricas
-            numeric_features = []
-            
-            # Normalizar características numéricas básicas
-            scaler = MinMaxScaler()
-            
-            # Normalizar precio
-            if 'price' in df.columns:
-                df['price_normalized'] = scaler.fit_transform(df[['price']].fillna(0))
-                numeric_features.append('price_normalized')
-                
-            # Normalizar rating
-            if 'rating' in df.columns:
-                df['rating_normalized'] = scaler.fit_transform(df[['rating']].fillna(0))
-                numeric_features.append('rating_normalized')
-                
-            # Normalizar reviews_count
-            if 'reviews_count' in df.columns:
-                df['reviews_count_normalized'] = scaler.fit_transform(df[['reviews_count']].fillna(0))
-                numeric_features.append('reviews_count_normalized')
-                
-            # Normalizar características adicionales si existen
-            additional_features = [
-                'sales_last_30_days',
-                'stock',
-                'seller_rating',
-                'shipping_time_days'
-            ]
-            
-            for feature in additional_features:
-                if feature in df.columns:
-                    normalized_name = f"{feature}_normalized"
-                    df[normalized_name] = scaler.fit_transform(df[[feature]].fillna(0))
-                    numeric_features.append(normalized_name)
+            # Normalizar características numéricas con un único escalador multi-columna,
+            # que se conserva para transformar productos nuevos sin reentrenar
+            self.numeric_columns = [col for col in NUMERIC_FEATURES if col in df.columns]
+            from sklearn.preprocessing import MinMaxScaler
+            self.numeric_scaler = MinMaxScaler()
+            numeric_features = [f"{col}_normalized" for col in self.numeric_columns]
+            if self.numeric_columns:
+                numeric_matrix = self.numeric_scaler.fit_transform(df[self.numeric_columns].fillna(0).values)
+                df[numeric_features] = numeric_matrix.astype(np.float32)
             
             logger.info(f"Características numéricas normalizadas: {numeric_features}")
             
-            # Combinar características
-            if numeric_features:
-                numeric_matrix = df[numeric_features].fillna(0).values
-                self.feature_matrix = np.hstack((
-                    self.tfidf_matrix.toarray(),
-                    numeric_matrix
-                ))
-                logger.info(f"Matriz de características combinada: {self.feature_matrix.shape}")
-            else:
+            # Combinar características manteniendo el TF-IDF disperso
+            if not numeric_features:
                 logger.warning("No se encontraron características numéricas. Usando solo TF-IDF.")
-                self.feature_matrix = self.tfidf_matrix.toarray()
+                numeric_matrix = None
+            # Se guarda en forma compacta y los índices se calculan sobre ella
+            self.feature_matrix = FeatureMatrix.from_blocks(
+                self.tfidf_matrix, numeric_matrix, self.numeric_weight
+            ).astype(self.vector_dtype)
+            logger.info(
+                f"Matriz de características combinada: {self.feature_matrix.shape}, "
+                f"{self.feature_matrix.nnz} no nulos, {self.vector_dtype}, "
+                f"{self.feature_matrix.nbytes / 1e6:.1f} MB"
+            )
+            
+            # Calcular índice de vecinos top-K por bloques
+            logger.info(f"Calculando índice de vecinos (K={self.n_neighbors}, backend={self.index_backend})")
+            self.neighbor_index = self._build_index()
+            logger.info(
+                f"Índice de vecinos calculado: {self.neighbor_index.indices.shape}, "
+                f"{self.neighbor_index.nbytes / 1e6:.1f} MB"
+            )
             
-            # Calcular matriz de similitud
-            logger.info("Calculando matriz de similitud")
-            self.similarity_matrix = cosine_similarity(self.feature_matrix)
-            logger.info(f"Matriz de similitud calculada: {self.similarity_matrix.shape}")
+            # Particionar el índice por categoría para get_similar_products
+            self._build_category_index(df['category'])
             
             # Guardar datos del modelo
-            self.model_data = {
-                'df': self.df,
-                'product_indices': self.product_indices,
-                'inverse_indices': self.inverse_indices,
-                'similarity_matrix': self.similarity_matrix,
-                'feature_matrix': self.feature_matrix,
-                'tfidf': self.tfidf
-            }
+            self.pending_updates = 0
+            self.built_at = datetime.now(timezone.utc).isoformat()
+            self.build_seconds = time.perf_counter() - started
+            self._update_model_data()
             
-            logger.info("Entrenamiento completado exitosamente")
+            logger.info(f"Entrenamiento completado exitosamente en {self.build_seconds:.1f}s")
             return self
             
         except Exception as e:
             logger.error(f"Error durante el entrenamiento: {str(e)}")
             raise
     
-    def get_recommendations(self, product_id: int, n_recommendations: int = 5) -> Dict:
-        """Obtener recomendaciones para un producto"""
-        logger.info(f"Obteniendo recomendaciones para el producto {product_id}")
+    def _update_model_data(self, rank: bool = True):
+        """Refrescar las referencias del modelo y pasar a una nueva versión (invalida la caché)
+
+        rank=False (cambios incrementales) descarta el orden por calidad
+        precalculado en lugar de recalcularlo sobre todo el catálogo.
+        """
+        self.model_version = next(_model_versions)
+        self.cache.clear()
+        if rank:
+            self._rank_default_neighbors()
+        else:
+            self.ranked_neighbors = None
+        if self.fragments is None or self.fragments.store is not self.store:
+            self.fragments = PayloadFragments(self.store)
+        self.model_data = {
+            'store': self.store,
+            'product_indices': self.product_indices,
+            'inverse_indices': self.inverse_indices,
+            'neighbor_index': self.neighbor_index,
+            'category_index': self.category_index,
+            'categories': self.categories,
+            'category_codes': self.category_codes,
+            'category_level': self.category_level,
+            'feature_matrix': self.feature_matrix,
+            'numeric_columns': self.numeric_columns
+        }
+    
+    def _document(self, product: Dict) -> str:
+        """Texto TF-IDF de un producto (mismo formato que en el entrenamiento)"""
+        return ' '.join([
+            self._preprocess_text(str(product['title'])),
+            self._preprocess_text(str(product.get('description', ''))),
+            self._preprocess_text(str(product['category']))
+        ])
+    
+    def _transform_products(self, products: List[Dict]) -> FeatureMatrix:
+        """Transformar productos con el vectorizador y el escalador ya ajustados"""
+        if self.numeric_scaler is None:
+            raise ValueError("El modelo no admite actualizaciones incrementales, reentrenar")
+        text = self.tfidf.transform([self._document(product) for product in products])
+        numeric = None
+        if self.numeric_columns:
+            values = np.array([
+                [product.get(col) if product.get(col) is not None else 0 for col in self.numeric_columns]
+                for product in products
+            ], dtype=np.float64)
+            numeric = self.numeric_scaler.transform(values)
+        return FeatureMatrix.from_blocks(text, numeric, self.numeric_weight)
+    
+    def add_product(self, product: Dict) -> int:
+        """Agregar un producto al catálogo sin reentrenar el modelo"""
+        with self._write_lock:
+            if self.successor is not None:
+                return self.successor.add_product(product)
+            if self.store is None:
+                raise ValueError("El modelo no ha sido entrenado")
+            self._require_features()
+            product_id = product.get('product_id')
+            if product_id is None:
+                product_id = int(self.store.columns['product_id'].max()) + 1
+            elif product_id in self.product_indices:
+                raise ValueError(f"Producto {product_id} ya existe")
+            
+            no_rows = np.empty(0, dtype=np.int64)
+            row, features, record = self._prepare_row(product_id, product)
+            self._link_row(row, record, features, affected=(no_rows, no_rows))
+            logger.info(f"Producto {product_id} agregado al catálogo")
+            return product_id
+    
+    def update_product(self, product_id: int, product: Dict) -> int:
+        """Actualizar un producto: baja de la fila anterior y alta de la nueva versión"""
+        with self._write_lock:
+            if self.successor is not None:
+                return self.successor.update_product(product_id, product)
+            if product_id not in self.product_indices:
+                raise ValueError(f"Producto {product_id} no encontrado")
+            self._require_features()
+            
+            # La nueva versión se prepara antes de la baja: si falla, el producto queda intacto
+            row, features, record = self._prepare_row(product_id, product)
+            affected = self._deactivate(product_id)
+            self._link_row(row, record, features, affected)
+            logger.info(f"Producto {product_id} actualizado")
+            return product_id
+    
+    def remove_product(self, product_id: int):
+        """Eliminar un producto y reparar las listas de vecinos que lo contenían"""
+        with self._write_lock:
+            if self.successor is not None:
+                return self.successor.remove_product(product_id)
+            if product_id not in self.product_indices:
+                raise ValueError(f"Producto {product_id} no encontrado")
+            self._require_features()
+            
+            affected = self._deactivate(product_id)
+            self._refresh_neighbors(*affected)
+            self.pending_updates += 1
+            self._update_model_data(rank=False)
+            logger.info(f"Producto {product_id} eliminado del catálogo")
+    
+    def _deactivate(self, product_id: int):
+        """Dar de baja la fila de un producto y devolver las filas que lo tenían como vecino"""
+        row = self.product_indices.pop(product_id)
+        self.inverse_indices.pop(row, None)
+        self.store.deactivate(row)
+        if self.stats is not None:
+            self.stats.remove_row(self.store, row)
+        self._df = None
+        
+        # Solo puede listar la fila quien la puntúa al menos como a su último vecino:
+        # se revisan esos candidatos en lugar de recorrer las N×K posiciones del índice
+        scores = self.feature_matrix[row].dot(self.feature_matrix)[0]
+        affected = []
+        for index in (self.neighbor_index, self.category_index):
+            rows = np.flatnonzero(scores >= index.kth_scores().astype(np.float32) - NEIGHBOR_SCORE_MARGIN)
+            rows = rows[(index.indices[rows] == row).any(axis=1)]
+            affected.append(rows[self.store.active[rows]])
+        return tuple(affected)
+    
+    def _prepare_row(self, product_id: int, product: Dict):
+        """Transformar el producto y agregar su fila al almacén (aún sin vecinos)"""
+        record = dict(product, product_id=product_id)
+        features = self._transform_products([record])
+        row = int(self.store.append([record])[0])
+        if self.stats is not None:
+            self.stats.add_row(self.store, row)
+            self.quality_scores = self._buffers['quality_scores'].extend(
+                self.quality_scores, self.stats.quality_scores(self.store, [row])
+            )
+        return row, features, record
+    
+    def _link_row(self, row: int, record: Dict, features: FeatureMatrix, affected):
+        """Indexar una fila ya agregada y parchear solo las listas de vecinos afectadas"""
+        product_id = record['product_id']
+        self.feature_matrix = self.feature_matrix.vstack(features)
+        self.category_codes = self._buffers['category_codes'].extend(
+            self.category_codes, [self._category_code(record['category'])]
+        )
+        self.neighbor_index.append(1)
+        self.category_index.append(1)
+        
+        # Similitud de la nueva fila (ya en la representación de la matriz) contra el catálogo activo
+        scores = self.feature_matrix[row].dot(self.feature_matrix)[0]
+        scores[~self.store.active] = -np.inf
+        same_category = self.category_codes == self.category_codes[row]
+        self._insert_row(self.neighbor_index, row, scores, affected[0])
+        self._insert_row(self.category_index, row, np.where(same_category, scores, -np.inf), affected[1])
+        # El producto se publica cuando ya tiene sus listas de vecinos
+        self.product_indices[product_id] = row
+        self.inverse_indices[row] = product_id
+        self._df = None
+        
+        # Recalcular las listas que apuntaban a la versión anterior
+        self._refresh_neighbors(*affected)
+        self.pending_updates += 1
+        self._update_model_data(rank=False)
+    
+    def _insert_row(self, index: NeighborIndex, row: int, scores: np.ndarray, affected: np.ndarray):
+        """Calcular los vecinos de una fila nueva e insertarla donde supera al último vecino"""
+        index.set_rows([row], *select_top_k(scores[None, :].copy(), index.n_neighbors, exclude=[row]))
+        candidates = np.flatnonzero(scores > index.kth_scores())
+        candidates = candidates[(candidates != row) & ~np.isin(candidates, affected)]
+        if len(candidates):
+            index.insert(candidates, row, scores[candidates])
+    
+    def _refresh_neighbors(self, rows: np.ndarray, category_rows: np.ndarray):
+        """Recalcular de forma exacta las listas de vecinos de algunas filas"""
+        for index, index_rows, same_category in (
+            (self.neighbor_index, rows, False),
+            (self.category_index, category_rows, True)
+        ):
+            if len(index_rows) == 0:
+                continue
+            index.set_rows(index_rows, *self._exact_neighbors(index_rows, index.n_neighbors, same_category))
+        logger.debug(f"Listas de vecinos recalculadas: {len(rows)} globales, {len(category_rows)} por categoría")
+    
+    def _category_key(self, category) -> str:
+        """Partición de un producto según el nivel de categoría configurado"""
+        category = str(category)
+        if self.category_level == 'main_category':
+            return category.split('/')[0]
+        return category
+    
+    def _category_code(self, category) -> int:
+        """Código de partición de una categoría, registrándola si es nueva"""
+        key = self._category_key(category)
+        if key not in self._category_lookup:
+            self._category_lookup[key] = len(self.categories)
+            self.categories.append(key)
+        return self._category_lookup[key]
+    
+    def _build_category_index(self, categories: pd.Series):
+        """Codificar las categorías de cada fila y construir el índice particionado"""
+        # main_category se deriva igual que en ProductAnalyzer.extract_features
+        codes, categories = pd.factorize(categories.astype(str).map(self._category_key))
+        self.category_codes = codes.astype(np.int32)
+        self.categories = list(categories)
+        self._category_lookup = {name: code for code, name in enumerate(self.categories)}
+        
+        self.category_index = NeighborIndex.build_partitioned(
+            self.feature_matrix, self.category_codes, self.n_neighbors, self.block_size,
+            n_jobs=self.n_jobs, memory_budget_mb=self.memory_budget_mb
+        ).astype(self.score_dtype)
+        logger.info(f"Índice por categoría calculado: {len(self.categories)} particiones ({self.category_level})")
+    
+    def compacted(self) -> 'ProductRecommender':
+        """Reentrenar sobre el catálogo activo (descarta bajas y reajusta el vocabulario)
+
+        Las escrituras esperan durante el reentrenamiento y, al terminar, este
+        modelo las reenvía al compactado: ningún cambio se pierde aunque
+        llegue antes de que el nuevo modelo se instale con swap().
+        """
+        with self._write_lock:
+            if self.successor is not None:
+                raise ValueError("El modelo ya fue compactado")
+            logger.info(f"Compactando catálogo: {self.pending_updates} cambios pendientes")
+            self.successor = self._refit_active()
+            return self.successor
+    
+    def _refit_active(self) -> 'ProductRecommender':
+        """Nuevo recomendador con la misma configuración entrenado sobre las filas activas"""
+        recommender = ProductRecommender(
+            n_neighbors=self.n_neighbors,
+            block_size=self.block_size,
+            numeric_weight=self.numeric_weight,
+            index_backend=self.index_backend,
+            lsh_tables=self.lsh_tables,
+            lsh_bits=self.lsh_bits,
+            cache_size=self.cache.maxsize,
+            cache_ttl=self.cache.ttl,
+            category_level=self.category_level,
+            text_jobs=self.text_jobs,
+            n_jobs=self.n_jobs,
+            memory_budget_mb=self.memory_budget_mb,
+            vector_dtype=self.vector_dtype,
+            score_dtype=self.score_dtype,
+            quality_weight=self.quality_weight,
+            rerank_candidates=self.rerank_candidates
+        )
+        return recommender.fit(self.store.to_frame())
+    
+    def _build_index(self) -> NeighborIndex:
+        """Construir el índice de vecinos con el backend configurado"""
+        if self.index_backend == 'lsh':
+            index = NeighborIndex.build_lsh(
+                self.feature_matrix,
+                self.n_neighbors,
+                n_tables=self.lsh_tables,
+                n_bits=self.lsh_bits,
+                block_size=self.block_size,
+                n_jobs=self.n_jobs,
+                memory_budget_mb=self.memory_budget_mb
+            )
+        else:
+            index = NeighborIndex.build(
+                self.feature_matrix, self.n_neighbors, self.block_size,
+                n_jobs=self.n_jobs, memory_budget_mb=self.memory_budget_mb
+            )
+        return index.astype(self.score_dtype)
+    
+    def index_recall(self, k: int = 10, sample_size: int = 1000, seed: int = 0) -> Dict:
+        """Reporte de recall@k del índice frente a la búsqueda exacta sobre una muestra"""
+        if self.neighbor_index is None:
+            raise ValueError("El modelo no ha sido entrenado")
         
-        if self.df is None:
+        k = min(k, self.neighbor_index.n_neighbors)
+        rng = np.random.default_rng(seed)
+        n_rows = len(self.neighbor_index)
+        rows = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        exact_indices, _ = self._exact_neighbors(rows, k)
+        recall = recall_at_k(self.neighbor_index.indices[rows, :k], exact_indices)
+        
+        report = {
+            'backend': self.index_backend,
+            'k': k,
+            'sample_size': len(rows),
+            'recall': recall
+        }
+        logger.info(f"Recall@{k} del índice ({self.index_backend}): {recall:.4f}")
+        return report
+    
+    def precision_report(self, reference: 'ProductRecommender', k: int = 10,
+                         sample_size: int = 1000, seed: int = 0) -> Dict:
+        """Comparar las recomendaciones con las de un modelo de precisión completa
+
+        `reference` debe estar entrenado sobre el mismo catálogo (p. ej. con
+        vector_dtype='float64' y score_dtype='float32'). Reporta el solapamiento
+        de los top-k del índice y de la búsqueda exacta, el error de los
+        puntajes de los vecinos comunes y la memoria de ambos modelos.
+        """
+        if self.neighbor_index is None or reference.neighbor_index is None:
             raise ValueError("El modelo no ha sido entrenado")
+        if len(reference.neighbor_index) != len(self.neighbor_index):
+            raise ValueError("Los modelos no fueron entrenados sobre el mismo catálogo")
+        
+        k = min(k, self.neighbor_index.n_neighbors, reference.neighbor_index.n_neighbors)
+        rng = np.random.default_rng(seed)
+        n_rows = len(self.neighbor_index)
+        rows = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        
+        indices = self.neighbor_index.indices[rows, :k]
+        reference_indices = reference.neighbor_index.indices[rows, :k]
+        same = (indices == reference_indices) & (indices >= 0)
+        score_error = np.abs(
+            self.neighbor_index.scores[rows, :k].astype(np.float64)
+            - reference.neighbor_index.scores[rows, :k].astype(np.float64)
+        )[same]
+        
+        def memory(model):
+            return {
+                'features_bytes': model.feature_matrix.nbytes,
+                'index_bytes': model.neighbor_index.nbytes + model.category_index.nbytes
+            }
+        
+        report = {
+            'vector_dtype': self.vector_dtype,
+            'score_dtype': self.score_dtype,
+            'k': k,
+            'sample_size': len(rows),
+            'index_overlap': recall_at_k(indices, reference_indices),
+            'exact_overlap': recall_at_k(self._exact_neighbors(rows, k)[0], reference._exact_neighbors(rows, k)[0]),
+            'max_score_error': float(score_error.max()) if len(score_error) else 0.0,
+            'mean_score_error': float(score_error.mean()) if len(score_error) else 0.0,
+            'memory': memory(self),
+            'reference_memory': memory(reference)
+        }
+        logger.info(
+            f"Precisión {self.vector_dtype}/{self.score_dtype}: solapamiento@{k} "
+            f"{report['index_overlap']:.4f} (índice), {report['exact_overlap']:.4f} (exacto)"
+        )
+        return report
+    
+    def get_recommendations(self, product_id: int, n_recommendations: int = 5,
+                            quality_weight: Optional[float] = None) -> Dict:
+        """Obtener recomendaciones para un producto (quality_weight=None usa el del modelo)"""
+        request_logger.info(f"Obteniendo recomendaciones para el producto {product_id}")
+        return self._recommend(
+            'recommendations', product_id, n_recommendations, False, quality_weight, self._build_response
+        )
+    
+    def get_recommendations_json(self, product_id: int, n_recommendations: int = 5,
+                                 quality_weight: Optional[float] = None) -> bytes:
+        """Recomendaciones ya codificadas en JSON (mismo contenido que get_recommendations)"""
+        request_logger.info(f"Obteniendo recomendaciones (JSON) para el producto {product_id}")
+        return self._recommend(
+            'recommendations_json', product_id, n_recommendations, False, quality_weight, self._encode_response
+        )
+    
+    def _recommend(self, kind: str, product_id: int, n_recommendations: int, same_category: bool,
+                   quality_weight: Optional[float], build):
+        """Consulta común: caché, búsqueda de la fila, vecinos y armado de la respuesta con build"""
+        if self.store is None:
+            raise ValueError("El modelo no ha sido entrenado")
+        
+        quality_weight = self._resolve_quality_weight(quality_weight)
+        cache_key = (kind, product_id, n_recommendations, same_category, quality_weight, self.model_version)
+        with timed('cache'):
+            cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
             
-        if product_id not in self.product_indices:
+        with timed('lookup'):
+            idx = self.product_indices.get(product_id)
+        if idx is None:
             raise ValueError(f"Producto {product_id} no encontrado")
             
-        # Obtener información del producto original
-        product_info = self.get_product_by_id(product_id)
-        if not product_info:
-            raise ValueError(f"No se pudo obtener información del producto {product_id}")
-        
-        idx = self.product_indices[product_id]
-        similarity_scores = list(enumerate(self.similarity_matrix[idx]))
-        similarity_scores = sorted(similarity_scores, key=lambda x: x[1], reverse=True)
-        
-        recommendations = similarity_scores[1:n_recommendations+1]
-        
-        recommended_products = []
-        for rec in recommendations:
-            rec_id = self.inverse_indices[rec[0]]
-            rec_info = self.get_product_by_id(rec_id)
-            if rec_info:
-                recommended_products.append({
-                    'product_id': int(rec_info['product_id']),
-                    'title': str(rec_info['title']),
-                    'category': str(rec_info['category']),
-                    'price': float(rec_info['price']),
-                    'rating': float(rec_info['rating']),
-                    'reviews_count': int(rec_info['reviews_count']),
-                    'similarity_score': float(rec[1])
-                })
+        with timed('scoring'):
+            neighbor_rows, neighbor_scores, rank_scores = self.rank_neighbors(
+                [idx], n_recommendations, same_category, quality_weight
+            )
+        
+        with timed('hydration'):
+            result = build(idx, neighbor_rows[0], neighbor_scores[0], None if rank_scores is None else rank_scores[0])
+        self.cache.set(cache_key, result)
+        return result
+    
+    def _build_response(self, idx: int, neighbor_rows: np.ndarray, neighbor_scores: np.ndarray,
+                        rank_scores: Optional[np.ndarray] = None) -> Dict:
+        """Hidratar el producto consultado y sus vecinos desde el almacén
+
+        Mismas claves que _encode_response: rank_score es None sin re-ordenar.
+        """
+        product_info = self.store.get(idx)
+        valid = neighbor_rows >= 0
+        recommended_products = self.store.get_many(neighbor_rows[valid])
+        ranks = rank_scores[valid].tolist() if rank_scores is not None else itertools.repeat(None)
+        for rec_info, score, rank in zip(recommended_products, neighbor_scores[valid].tolist(), ranks):
+            rec_info['similarity_score'] = score
+            rec_info['rank_score'] = rank
         
         return {
-            'product_id': int(product_info['product_id']),
-            'title': str(product_info['title']),
-            'category': str(product_info['category']),
+            'product_id': product_info['product_id'],
+            'title': product_info['title'],
+            'category': product_info['category'],
             'recommendations': recommended_products
         }
     
+    def _encode_response(self, idx: int, neighbor_rows: np.ndarray, neighbor_scores: np.ndarray,
+                         rank_scores: Optional[np.ndarray] = None) -> bytes:
+        """Armar la respuesta JSON con los fragmentos pre-codificados de cada producto
+
+        Solo se codifican los puntajes de la solicitud; los floats usan repr,
+        igual que el codificador JSON estándar.
+        """
+        product_info = self.store.get(idx)
+        valid = neighbor_rows >= 0
+        fragments = self.fragments.get_many(neighbor_rows[valid].tolist())
+        scores = neighbor_scores[valid].tolist()
+        ranks = rank_scores[valid].tolist() if rank_scores is not None else [None] * len(scores)
+        items = [
+            b'%s,"similarity_score":%r,"rank_score":%s}' % (
+                fragment, score, b'null' if rank is None else b'%r' % rank
+            )
+            for fragment, score, rank in zip(fragments, scores, ranks)
+        ]
+        header = dumps({
+            'product_id': product_info['product_id'],
+            'title': product_info['title'],
+            'category': product_info['category']
+        })[:-1]
+        return b'%s,"recommendations":[%s]}' % (header, b','.join(items))
+    
+    def get_recommendations_batch(self, product_ids: List[int], n_recommendations: int = 5,
+                                  quality_weight: Optional[float] = None) -> List[Dict]:
+        """Obtener recomendaciones para varios productos en una sola pasada vectorizada"""
+        request_logger.info(f"Obteniendo recomendaciones en lote para {len(product_ids)} productos")
+        
+        if self.store is None:
+            raise ValueError("El modelo no ha sido entrenado")
+        
+        quality_weight = self._resolve_quality_weight(quality_weight)
+        with timed('lookup'):
+            rows = np.array([self.product_indices.get(pid, -1) for pid in product_ids], dtype=np.int64)
+            found = rows >= 0
+        with timed('scoring'):
+            neighbor_rows, neighbor_scores, rank_scores = self.rank_neighbors(
+                rows[found], n_recommendations, quality_weight=quality_weight
+            )
+        
+        # Hidratar todos los productos consultados y recomendados de una vez
+        with timed('hydration'):
+            valid = neighbor_rows >= 0
+            queried = iter(self.store.get_many(rows[found]))
+            recommended = iter(self.store.get_many(neighbor_rows[valid]))
+            scores = iter(neighbor_scores[valid].tolist())
+            ranks = iter(rank_scores[valid].tolist()) if rank_scores is not None else itertools.repeat(None)
+            counts = iter(valid.sum(axis=1).tolist())
+        
+        results = []
+        for product_id, is_found in zip(product_ids, found):
+            if not is_found:
+                results.append({
+                    'product_id': product_id,
+                    'title': None,
+                    'category': None,
+                    'recommendations': [],
+                    'error': f"Producto {product_id} no encontrado"
+                })
+                continue
+            product_info = next(queried)
+            recommended_products = [next(recommended) for _ in range(next(counts))]
+            for rec_info in recommended_products:
+                rec_info['similarity_score'] = next(scores)
+                rec_info['rank_score'] = next(ranks)
+            results.append({
+                'product_id': product_info['product_id'],
+                'title': product_info['title'],
+                'category': product_info['category'],
+                'recommendations': recommended_products,
+                'error': None
+            })
+        return results
+    
+    def get_recommendations_batch_json(self, product_ids: List[int], n_recommendations: int = 5,
+                                       quality_weight: Optional[float] = None) -> bytes:
+        """Recomendaciones en lote ya codificadas en JSON (mismo contenido que get_recommendations_batch)"""
+        request_logger.info(f"Obteniendo recomendaciones en lote (JSON) para {len(product_ids)} productos")
+        
+        if self.store is None:
+            raise ValueError("El modelo no ha sido entrenado")
+        
+        quality_weight = self._resolve_quality_weight(quality_weight)
+        with timed('lookup'):
+            rows = np.array([self.product_indices.get(pid, -1) for pid in product_ids], dtype=np.int64)
+            found = rows >= 0
+        with timed('scoring'):
+            neighbor_rows, neighbor_scores, rank_scores = self.rank_neighbors(
+                rows[found], n_recommendations, quality_weight=quality_weight
+            )
+        
+        with timed('hydration'):
+            items = []
+            position = 0
+            for product_id, row, is_found in zip(product_ids, rows.tolist(), found.tolist()):
+                if not is_found:
+                    items.append(dumps({
+                        'product_id': product_id,
+                        'title': None,
+                        'category': None,
+                        'recommendations': [],
+                        'error': f"Producto {product_id} no encontrado"
+                    }))
+                    continue
+                body = self._encode_response(
+                    row, neighbor_rows[position], neighbor_scores[position],
+                    None if rank_scores is None else rank_scores[position]
+                )
+                items.append(body[:-1] + b',"error":null}')
+                position += 1
+        return b'{"results":[%s]}' % b','.join(items)
+    
+    def _resolve_quality_weight(self, quality_weight: Optional[float]) -> float:
+        """Peso de la solicitud o, si no se indica, el configurado en el modelo"""
+        if quality_weight is None:
+            return self.quality_weight
+        self._check_quality_weight(quality_weight)
+        return float(quality_weight)
+    
+    def rank_neighbors(self, rows, n: int, same_category: bool = False, quality_weight: float = 0.0):
+        """Vecinos de las filas consulta, re-ordenados por calidad si quality_weight > 0
+
+        Se toman los M mejores candidatos por similitud (M = rerank_candidates,
+        acotado al K del índice) y se combinan con quality_scores. Con el peso
+        del modelo y n <= RANKED_DEPTH se leen del orden precalculado. Devuelve
+        filas, similitudes y puntajes combinados (None sin re-ordenar).
+        """
+        if quality_weight <= 0 or self.quality_scores is None:
+            return (*self.query_neighbors(rows, n, same_category), None)
+        self._check_n_neighbors(n)
+        ranked = self.ranked_neighbors
+        if ranked is not None and ranked[0] == quality_weight:
+            indices, scores, blended = ranked[1][same_category]
+            if n <= indices.shape[1]:
+                rows = np.asarray(rows, dtype=np.int64)
+                return indices[rows, :n], scores[rows, :n], blended[rows, :n]
+        index = self.category_index if same_category else self.neighbor_index
+        n_candidates = max(n, min(self.rerank_candidates, index.n_neighbors))
+        candidates, scores = self.query_neighbors(rows, n_candidates, same_category)
+        return rerank_top_k(candidates, scores, self.quality_scores, quality_weight, n)
+    
+    def _rank_default_neighbors(self):
+        """Precalcular por bloques el orden por calidad del peso del modelo en ambos índices"""
+        self.ranked_neighbors = None
+        if self.quality_weight <= 0 or self.quality_scores is None or self.category_index is None:
+            return
+        started = time.perf_counter()
+        ranked = {}
+        for same_category, index in ((False, self.neighbor_index), (True, self.category_index)):
+            n_candidates = min(self.rerank_candidates, index.n_neighbors)
+            depth = min(RANKED_DEPTH, n_candidates)
+            blocks = [
+                rerank_top_k(
+                    index.indices[start:start + self.block_size, :n_candidates],
+                    index.scores[start:start + self.block_size, :n_candidates],
+                    self.quality_scores, self.quality_weight, depth
+                )
+                for start in range(0, max(len(index), 1), self.block_size)
+            ]
+            ranked[same_category] = tuple(np.concatenate(arrays) for arrays in zip(*blocks))
+        self.ranked_neighbors = (self.quality_weight, ranked)
+        nbytes = sum(array.nbytes for arrays in ranked.values() for array in arrays)
+        logger.info(f"Orden por calidad precalculado (peso {self.quality_weight}): "
+                    f"{nbytes / 1e6:.1f} MB en {time.perf_counter() - started:.2f}s")
+    
+    def query_neighbors(self, rows, n: int, same_category: bool = False):
+        """Obtener los n vecinos (filas y puntajes) de un vector de filas consulta"""
+        self._check_n_neighbors(n)
+        rows = np.asarray(rows, dtype=np.int64)
+        index = self.category_index if same_category else self.neighbor_index
+        if n <= index.n_neighbors or self.read_only:
+            return index.neighbors(rows, n)
+        return self._exact_neighbors(rows, n, same_category)
+    
+    def _exact_neighbors(self, rows: np.ndarray, n: int, same_category: bool = False):
+        """Calcular vecinos exactos cuando n supera el K del índice"""
+        self._require_features()
+        if len(rows) == 0:
+            # Lote sin productos conocidos: nada que calcular
+            return np.empty((0, n), dtype=np.int32), np.empty((0, n), dtype=np.float32)
+        # Una escritura concurrente agrega filas al almacén antes que a la matriz: recortar a la matriz leída
+        matrix = self.feature_matrix
+        active = self.store.active[:len(matrix)]
+        codes = self.category_codes[:len(matrix)]
+        indices, scores = [], []
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = matrix[block_rows].dot(matrix)
+            if not active.all():
+                block[:, ~active] = -np.inf
+            if same_category:
+                other_category = codes[None, :] != codes[block_rows, None]
+                block[other_category] = -np.inf
+            top, top_scores = select_top_k(block, n, exclude=block_rows)
+            indices.append(top)
+            scores.append(top_scores)
+        return np.vstack(indices), np.vstack(scores)
+    
     def save_model(self, filepath):
-        """Guardar modelo entrenado"""
+        """Guardar modelo entrenado (formato pickle heredado, ver save())"""
         logger.info(f"Guardando modelo en {filepath}")
         if not self.model_data:
             raise ValueError("No hay modelo para guardar")
         
         with open(filepath, 'wb') as f:
-            pickle.dump(self.model_data, f)
+            pickle.dump({**self.model_data, 'tfidf': self.tfidf, 'numeric_scaler': self.numeric_scaler}, f)
         logger.info("Modelo guardado exitosamente")
     
     @classmethod
     def load_model(cls, filepath):
-        """Cargar modelo guardado"""
+        """Cargar modelo guardado (formato pickle heredado, ver load())"""
         logger.info(f"Cargando modelo desde {filepath}")
         instance = cls()
         
         with open(filepath, 'rb') as f:
             model_data = pickle.load(f)
         
-        instance.df = model_data['df']
+        if 'store' in model_data:
+            instance.store = model_data['store']
+        else:
+            # Modelos antiguos guardaban el DataFrame completo
+            instance.store = ProductStore.from_frame(model_data.pop('df'))
+            model_data['store'] = instance.store
+        instance.stats = CatalogStats.from_store(instance.store)
+        instance.quality_scores = instance.stats.quality_scores(instance.store)
         instance.product_indices = model_data['product_indices']
         instance.inverse_indices = model_data['inverse_indices']
-        instance.similarity_matrix = model_data['similarity_matrix']
         instance.feature_matrix = model_data['feature_matrix']  # Cambiado de product_features
         instance.tfidf = model_data['tfidf']
-        instance.model_data = model_data
+        instance.numeric_columns = model_data.get('numeric_columns', [])
+        instance.numeric_scaler = model_data.get('numeric_scaler')
+        if 'neighbor_index' in model_data:
+            instance.neighbor_index = model_data['neighbor_index']
+        else:
+            # Modelos antiguos guardaban la matriz densa N×N: reconstruir el índice
+            logger.info("Modelo sin índice de vecinos, reconstruyendo")
+            dense = instance.feature_matrix
+            n_text = len(instance.tfidf.vocabulary_)
+            instance.feature_matrix = FeatureMatrix.from_blocks(
+                sparse.csr_matrix(dense[:, :n_text]), dense[:, n_text:]
+            )
+            instance.neighbor_index = instance._build_index()
+        if 'category_index' in model_data:
+            instance.category_level = model_data['category_level']
+            instance.category_index = model_data['category_index']
+            instance.categories = model_data['categories']
+            instance.category_codes = model_data['category_codes']
+            instance._category_lookup = {name: code for code, name in enumerate(instance.categories)}
+        else:
+            instance._build_category_index(pd.Series(instance.store.columns['category'].to_numpy()))
+        instance._update_model_data()
         
         logger.info("Modelo cargado exitosamente")
         return instance
 
-    def get_similar_products(self, product_id: int, by_category: bool = True, n_recommendations: int = 5) -> Dict:
-        """Obtener productos similares con filtro opcional por categoría"""
-        logger.info(f"Obteniendo productos similares para {product_id}")
+    def save(self, directory, serving_only: bool = False):
+        """Guardar el modelo en formato versionado sin pickle (arrays .npy + manifiesto JSON)
+
+        Con `serving_only` se escribe solo la tabla de vecinos (ids uint32 y
+        puntajes float16) y las columnas de los productos: basta para servir
+        lecturas, sin características, vocabulario ni scikit-learn.
+        """
+        directory = Path(directory)
+        serving_only = serving_only or self.read_only
+        logger.info(f"Guardando {'tabla de vecinos' if serving_only else 'modelo'} en {directory}")
+        if self.store is None:
+            raise ValueError("No hay modelo para guardar")
         
-        if self.df is None:
-            raise ValueError("El modelo no ha sido entrenado")
-            
-        # Obtener información del producto original
-        product_info = self.get_product_by_id(product_id)
-        if not product_info:
-            raise ValueError(f"No se pudo obtener información del producto {product_id}")
+        # Escribir en un directorio temporal y reemplazar al final
+        tmp_directory = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        tmp_directory.mkdir(parents=True)
+        
+        self.store.save(tmp_directory / 'store')
+        if serving_only:
+            self.neighbor_index.astype(np.float16).save(tmp_directory / 'neighbors')
+            self.category_index.astype(np.float16).save(tmp_directory / 'category_neighbors')
+        else:
+            self.feature_matrix.save(tmp_directory / 'features')
+            self.neighbor_index.save(tmp_directory / 'neighbors')
+            self.category_index.save(tmp_directory / 'category_neighbors')
+            np.save(tmp_directory / 'category_codes.npy', self.category_codes)
             
-        recommendations = self.get_recommendations(product_id, n_recommendations * 2)
+            # Vocabulario: un término por línea en el orden de su columna
+            terms = sorted(self.tfidf.vocabulary_, key=self.tfidf.vocabulary_.get)
+            (tmp_directory / 'vocabulary.txt').write_text('\n'.join(terms), encoding='utf-8')
+            np.save(tmp_directory / 'idf.npy', self.tfidf.idf_)
         
-        if by_category:
-            filtered_recommendations = [
-                rec for rec in recommendations['recommendations']
-                if rec['category'] == product_info['category']
-            ]
-            recommendations['recommendations'] = filtered_recommendations[:n_recommendations]
+        manifest = {
+            'format_version': MODEL_FORMAT_VERSION,
+            'artifact': ARTIFACT_NEIGHBOR_TABLE if serving_only else ARTIFACT_MODEL,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds,
+            'n_products': len(self.product_indices),
+            'config': {
+                'n_neighbors': self.n_neighbors,
+                'block_size': self.block_size,
+                'numeric_weight': self.numeric_weight,
+                'index_backend': self.index_backend,
+                'lsh_tables': self.lsh_tables,
+                'lsh_bits': self.lsh_bits,
+                'category_level': self.category_level,
+                'vector_dtype': self.vector_dtype,
+                'score_dtype': self.score_dtype,
+                'quality_weight': self.quality_weight,
+                'rerank_candidates': self.rerank_candidates
+            },
+            'categories': self.categories,
+            'store_columns': list(self.store.columns),
+            'numeric_columns': self.numeric_columns,
+            'numeric_range': {
+                'min': self.numeric_scaler.data_min_.tolist(),
+                'max': self.numeric_scaler.data_max_.tolist()
+            } if self.numeric_columns and not serving_only else None,
+            'n_text_columns': None if serving_only else self.feature_matrix.text.shape[1],
+            'pending_updates': self.pending_updates
+        }
+        (tmp_directory / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        
+        old_directory = directory.with_name(f"{directory.name}.old-{os.getpid()}")
+        if directory.exists():
+            directory.rename(old_directory)
+        tmp_directory.rename(directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        logger.info("Modelo guardado exitosamente")
+    
+    @classmethod
+    def load(cls, directory, mmap: bool = True, **options):
+        """Cargar un modelo guardado con save(); los arrays se abren con mmap"""
+        directory = Path(directory)
+        logger.info(f"Cargando modelo desde {directory}")
+        manifest = json.loads((directory / 'manifest.json').read_text(encoding='utf-8'))
+        if manifest['format_version'] != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Versión de formato no soportada: {manifest['format_version']}")
+        
+        # Copy-on-write: las páginas se comparten entre procesos hasta que se modifican
+        mmap_mode = 'c' if mmap else None
+        instance = cls(**{**manifest['config'], **options})
+        instance.store = ProductStore.load(directory / 'store', manifest['store_columns'], mmap_mode)
+        instance.stats = CatalogStats.from_store(instance.store)
+        instance.quality_scores = instance.stats.quality_scores(instance.store)
+        instance.neighbor_index = NeighborIndex.load(directory / 'neighbors', mmap_mode)
+        if manifest.get('artifact', ARTIFACT_MODEL) == ARTIFACT_NEIGHBOR_TABLE:
+            # Tabla de vecinos: solo lecturas, hasta K vecinos por producto
+            instance.category_index = NeighborIndex.load(directory / 'category_neighbors', mmap_mode)
+            instance.categories = manifest['categories']
+            instance._category_lookup = {name: code for code, name in enumerate(instance.categories)}
+            instance.numeric_columns = manifest['numeric_columns']
+            instance._finish_load(manifest)
+            logger.info(f"Tabla de vecinos cargada: {len(instance.product_indices)} productos")
+            return instance
+        
+        instance.feature_matrix = FeatureMatrix.load(
+            directory / 'features', manifest['n_text_columns'], mmap_mode
+        )
+        if (directory / 'category_neighbors').exists():
+            instance.category_index = NeighborIndex.load(directory / 'category_neighbors', mmap_mode)
+            instance.category_codes = np.load(directory / 'category_codes.npy', mmap_mode=mmap_mode)
+            instance.categories = manifest['categories']
+            instance._category_lookup = {name: code for code, name in enumerate(instance.categories)}
         else:
-            recommendations['recommendations'] = recommendations['recommendations'][:n_recommendations]
+            # Directorios guardados antes del índice por categoría
+            logger.warning("Modelo sin índice por categoría, reconstruyéndolo")
+            instance._build_category_index(pd.Series(instance.store.columns['category'].to_numpy()))
+        
+        # El vectorizador y el escalador se reconstruyen al primer uso (altas y cambios)
+        terms = (directory / 'vocabulary.txt').read_text(encoding='utf-8').split('\n')
+        instance.numeric_columns = manifest['numeric_columns']
+        instance._saved_transformers = {
+            'vocabulary': {term: idx for idx, term in enumerate(terms) if term},
+            'idf': np.load(directory / 'idf.npy'),
+            'numeric_range': manifest['numeric_range']
+        }
         
-        return recommendations
\ No newline at end of file
+        instance._finish_load(manifest)
+        logger.info(f"Modelo cargado exitosamente: {len(instance.product_indices)} productos")
+        return instance
+    
+    def _finish_load(self, manifest: Dict):
+        """Mapeos de ids y metadatos comunes a ambos artefactos"""
+        product_ids = self.store.columns['product_id']
+        active_rows = np.flatnonzero(self.store.active)
+        self.product_indices = dict(zip(product_ids[active_rows].tolist(), active_rows.tolist()))
+        self.inverse_indices = dict(zip(active_rows.tolist(), product_ids[active_rows].tolist()))
+        self.pending_updates = manifest['pending_updates']
+        self.built_at = manifest.get('built_at', manifest['created_at'])
+        self.build_seconds = manifest.get('build_seconds')
+        self._update_model_data()
+    
+    def warm_up(self) -> int:
+        """Leer una vez cada página de los arrays del modelo y ejecutar una consulta de prueba
+
+        Con mmap las páginas se cargan al primer acceso: sin precalentar, las
+        primeras solicitudes pagan los fallos de página del disco.
+        """
+        started = time.perf_counter()
+        arrays = [self.store.active, self.category_codes]
+        for column in self.store.columns.values():
+            arrays.extend([column.data, column.offsets] if isinstance(column, StringColumn) else [column])
+        for index in (self.neighbor_index, self.category_index):
+            arrays.extend([index.indices, index.scores])
+        if self.feature_matrix is not None:
+            text = self.feature_matrix.text
+            arrays.extend([text.data, text.indices, text.indptr, self.feature_matrix.numeric])
+        
+        touched = 0
+        for array in arrays:
+            if array is None or array.size == 0:
+                continue
+            pages = np.asarray(array).reshape(-1).view(np.uint8)[::mmap.PAGESIZE]
+            int(pages.sum())
+            touched += array.nbytes
+        
+        # Recorrer el camino de servicio una vez (sin dejar resultados en la caché)
+        if self.product_indices:
+            product_id = next(iter(self.product_indices))
+            self.get_recommendations(product_id)
+            self.get_recommendations_json(product_id)
+            self.get_similar_products_json(product_id)
+            self.cache.clear()
+        logger.info(f"Modelo precalentado: {touched / 1e6:.1f} MB en {time.perf_counter() - started:.2f}s")
+        return touched
+    
+    def get_similar_products(self, product_id: int, by_category: bool = True, n_recommendations: int = 5,
+                             quality_weight: Optional[float] = None) -> Dict:
+        """Obtener productos similares con filtro opcional por categoría"""
+        request_logger.info(f"Obteniendo productos similares para {product_id}")
+        if not by_category:
+            return self.get_recommendations(product_id, n_recommendations, quality_weight)
+        # Una sola consulta a la partición de la categoría del producto
+        return self._recommend('similar', product_id, n_recommendations, True, quality_weight, self._build_response)
+    
+    def get_similar_products_json(self, product_id: int, by_category: bool = True, n_recommendations: int = 5,
+                                  quality_weight: Optional[float] = None) -> bytes:
+        """Productos similares ya codificados en JSON"""
+        request_logger.info(f"Obteniendo productos similares (JSON) para {product_id}")
+        if not by_category:
+            return self.get_recommendations_json(product_id, n_recommendations, quality_weight)
+        return self._recommend(
+            'similar_json', product_id, n_recommendations, True, quality_weight, self._encode_response
+        )
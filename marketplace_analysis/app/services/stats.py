@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from app.services.analyzer import PRODUCT_SCORE_WEIGHTS
+from app.services.store import ProductStore
+
+# Percentiles precalculados por categoría
+STAT_PERCENTILES = (25, 50, 75, 90)
+STAT_COLUMNS = ('price', 'rating', 'sales_last_30_days')
+
+# Histograma de stock: límites inferiores de cada tramo (el último es abierto)
+STOCK_BINS = np.array([0, 1, 10, 50, 100, 500, 1000])
+SCORE_BINS = 10
+
+class CatalogStats:
+    """Estadísticas del catálogo activo precalculadas y mantenidas de forma incremental
+
+    Se calculan una vez al entrenar o cargar el modelo y se actualizan con
+    cada alta o baja; las lecturas devuelven estructuras ya construidas.
+    """
+
+    def __init__(self, score_ranges: Dict):
+        # Rango de normalización de la puntuación, fijo hasta el próximo entrenamiento
+        self.score_ranges = score_ranges
+        self.total_products = 0
+        self.category_counts = {}
+        self.category_summary = {}  # categoría -> conteo y percentiles
+        self._sorted_values = {}  # categoría -> {columna: valores ordenados}
+        self.stock_counts = np.zeros(len(STOCK_BINS), dtype=np.int64)
+        max_score = sum(PRODUCT_SCORE_WEIGHTS[col] for col in score_ranges)
+        self.score_edges = np.linspace(0, max_score, SCORE_BINS + 1)
+        self.score_counts = np.zeros(SCORE_BINS, dtype=np.int64)
+
+    @classmethod
+    def from_store(cls, store: ProductStore) -> 'CatalogStats':
+        """Calcular las estadísticas de las filas activas del almacén"""
+        rows = np.flatnonzero(store.active)
+        values = {
+            col: np.asarray(store.columns[col][rows], dtype=np.float64)
+            for col in set(STAT_COLUMNS) | set(PRODUCT_SCORE_WEIGHTS) | {'stock'}
+            if col in store.columns
+        }
+        stats = cls({
+            col: (float(values[col].min()), float(values[col].max())) if len(rows) else (0.0, 0.0)
+            for col in PRODUCT_SCORE_WEIGHTS if col in values
+        })
+        stats.total_products = len(rows)
+
+        codes, categories = pd.factorize(store.columns['category'][rows])
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for members in np.split(order, boundaries):
+            if len(members) == 0:
+                continue
+            category = categories[codes[members[0]]]
+            stats.category_counts[category] = len(members)
+            stats._sorted_values[category] = {
+                col: np.sort(values[col][members]) for col in STAT_COLUMNS if col in values
+            }
+            stats.category_summary[category] = stats._summarize(category)
+
+        if 'stock' in values:
+            stats.stock_counts += np.bincount(stats._stock_bin(values['stock']), minlength=len(STOCK_BINS))
+        stats.score_counts += np.bincount(stats._score_bin(values), minlength=SCORE_BINS)
+        return stats
+
+    def add_row(self, store: ProductStore, row: int):
+        """Registrar una fila nueva del almacén"""
+        self._apply(store, row, +1)
+
+    def remove_row(self, store: ProductStore, row: int):
+        """Descontar una fila dada de baja"""
+        self._apply(store, row, -1)
+
+    def _apply(self, store: ProductStore, row: int, sign: int):
+        category = store.columns['category'][row]
+        values = {
+            col: np.array([store.columns[col][row]], dtype=np.float64)
+            for col in set(STAT_COLUMNS) | set(PRODUCT_SCORE_WEIGHTS) | {'stock'}
+            if col in store.columns
+        }
+        self.total_products += sign
+
+        count = self.category_counts.get(category, 0) + sign
+        sorted_values = self._sorted_values.setdefault(category, {})
+        for col in STAT_COLUMNS:
+            if col not in values:
+                continue
+            column = sorted_values.get(col, np.empty(0))
+            position = np.searchsorted(column, values[col][0])
+            if sign > 0:
+                sorted_values[col] = np.insert(column, position, values[col][0])
+            else:
+                sorted_values[col] = np.delete(column, position)
+
+        # Copiar antes de modificar: las lecturas concurrentes ven una versión completa
+        counts = dict(self.category_counts)
+        summary = dict(self.category_summary)
+        if count > 0:
+            counts[category] = count
+            summary[category] = self._summarize(category, count)
+        else:
+            counts.pop(category, None)
+            summary.pop(category, None)
+            self._sorted_values.pop(category, None)
+        self.category_counts, self.category_summary = counts, summary
+
+        if 'stock' in values:
+            self.stock_counts[self._stock_bin(values['stock'])[0]] += sign
+        self.score_counts[self._score_bin(values)[0]] += sign
+
+    def _summarize(self, category, count: int = None) -> Dict:
+        sorted_values = self._sorted_values[category]
+        summary = {'count': count if count is not None else self.category_counts[category]}
+        for col, column in sorted_values.items():
+            summary[col] = _percentiles(column)
+        return summary
+
+    def _stock_bin(self, stock: np.ndarray) -> np.ndarray:
+        return np.clip(np.searchsorted(STOCK_BINS, stock, side='right') - 1, 0, len(STOCK_BINS) - 1)
+
+    def _product_score(self, values: Dict) -> np.ndarray:
+        """Fórmula de ProductAnalyzer.calculate_product_score con los rangos fijos"""
+        n_rows = len(next(iter(values.values()))) if values else 0
+        score = np.zeros(n_rows)
+        for col, (low, high) in self.score_ranges.items():
+            span = high - low if high > low else 1.0
+            score += np.clip((values[col] - low) / span, 0, 1) * PRODUCT_SCORE_WEIGHTS[col]
+        return score
+
+    def _score_bin(self, values: Dict) -> np.ndarray:
+        """Tramo de la puntuación del producto"""
+        bins = np.searchsorted(self.score_edges, self._product_score(values), side='right') - 1
+        return np.clip(bins, 0, SCORE_BINS - 1)
+
+    def quality_scores(self, store: ProductStore, rows=None) -> np.ndarray:
+        """Puntuación del producto por fila escalada a [0, 1] (float32, para re-ordenar)
+
+        Los valores nulos cuentan como el mínimo de su columna.
+        """
+        rows = np.arange(len(store.active)) if rows is None else np.asarray(rows)
+        values = {
+            col: np.nan_to_num(np.asarray(store.columns[col][rows], dtype=np.float64), nan=low)
+            for col, (low, _) in self.score_ranges.items()
+        }
+        max_score = self.score_edges[-1]
+        score = self._product_score(values) if values else np.zeros(len(rows))
+        return (score / max_score if max_score > 0 else score).astype(np.float32)
+
+    def category_distribution(self) -> Dict:
+        return {'distribution': self.category_counts, 'total_products': self.total_products}
+
+    def histograms(self) -> Dict:
+        """Histogramas de stock y de puntuación del producto"""
+        stock_labels = [
+            f"{low}-{high - 1}" if high - 1 > low else str(low)
+            for low, high in zip(STOCK_BINS[:-1].tolist(), STOCK_BINS[1:].tolist())
+        ] + [f"{STOCK_BINS[-1]}+"]
+        return {
+            'stock': dict(zip(stock_labels, self.stock_counts.tolist())),
+            'product_score': {
+                'edges': self.score_edges.round(4).tolist(),
+                'counts': self.score_counts.tolist()
+            },
+            'total_products': self.total_products
+        }
+
+def _percentiles(sorted_values: np.ndarray) -> Dict:
+    """Percentiles con interpolación lineal sobre valores ya ordenados (sin ordenar de nuevo)"""
+    if len(sorted_values) == 0:
+        return {f'p{q}': None for q in STAT_PERCENTILES}
+    positions = np.array(STAT_PERCENTILES) / 100 * (len(sorted_values) - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, len(sorted_values) - 1)
+    weights = positions - lower
+    values = sorted_values[lower] * (1 - weights) + sorted_values[upper] * weights
+    return {f'p{q}': round(float(value), 4) for q, value in zip(STAT_PERCENTILES, values)}
@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+import threading
+
+from app.core.serialization import dumps
+from app.services.buffers import RowBuffer
+
+# Columnas del catálogo que conserva el almacén (esquema de products.csv)
+STORE_COLUMNS = {
+    'product_id': np.int64,
+    'title': object,
+    'description': object,
+    'category': object,
+    'price': np.float64,
+    'rating': np.float64,
+    'reviews_count': np.int64,
+    'sales_last_30_days': np.int64,
+    'stock': np.int64,
+    'seller_rating': np.float64,
+    'shipping_time_days': np.int64,
+}
+
+# Campos que se sirven en cada recomendación
+PAYLOAD_FIELDS = ['product_id', 'title', 'price', 'rating', 'category', 'reviews_count']
+
+# Tope de fragmentos JSON en memoria: al superarlo se desalojan los menos usados
+MAX_PAYLOAD_FRAGMENTS = 500_000
+
+class StringColumn:
+    """Columna de texto compacta: bytes UTF-8 concatenados + offsets (apta para mmap)"""
+
+    _buffers = None  # RowBuffer de data y offsets, compartidos con las columnas que se derivan
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [str(value).encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+    def __getitem__(self, rows):
+        if np.isscalar(rows):
+            return self._decode(int(rows))
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        values = np.empty(len(rows), dtype=object)
+        values[:] = [self._decode(row) for row in rows.tolist()]
+        return values
+
+    def _decode(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def to_numpy(self) -> np.ndarray:
+        return self[np.arange(len(self))]
+
+    def concatenate(self, values) -> 'StringColumn':
+        """Nueva columna con los valores agregados al final (sin copiar las filas existentes)"""
+        other = StringColumn.from_values(values)
+        if self._buffers is None:
+            self._buffers = (RowBuffer(), RowBuffer())
+        data, offsets = self._buffers
+        column = StringColumn(
+            data.extend(self.data, other.data),
+            offsets.extend(self.offsets, other.offsets[1:] + self.offsets[-1])
+        )
+        column._buffers = self._buffers
+        return column
+
+class ProductStore:
+    """Almacén columnar de productos: una columna NumPy por campo, indexada por fila"""
+
+    _buffers = None  # RowBuffer por columna numérica y de active, creados al primer append
+
+    def __init__(self, columns: Dict[str, np.ndarray], active: np.ndarray = None):
+        self.columns = columns
+        # Filas dadas de baja quedan marcadas hasta la próxima compactación
+        if active is None:
+            active = np.ones(len(columns['product_id']), dtype=bool)
+        self.active = active
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """Construir el almacén a partir del DataFrame del catálogo"""
+        columns = {}
+        for name, dtype in STORE_COLUMNS.items():
+            if name not in df.columns:
+                continue
+            if dtype is object:
+                columns[name] = StringColumn.from_values(df[name].astype(str))
+            else:
+                columns[name] = df[name].fillna(0).to_numpy(dtype=dtype)
+
+        # Campos opcionales del payload con valor por defecto
+        n_rows = len(df)
+        columns.setdefault('rating', np.zeros(n_rows, dtype=np.float64))
+        columns.setdefault('reviews_count', np.zeros(n_rows, dtype=np.int64))
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns['product_id'])
+
+    @property
+    def n_active(self) -> int:
+        return int(self.active.sum())
+
+    def append(self, records: List[Dict]) -> np.ndarray:
+        """Agregar productos al final del almacén y devolver sus filas"""
+        start = len(self)
+        if self._buffers is None:
+            self._buffers = {}
+        # Convertir todas las columnas antes de reemplazarlas: un valor inválido no deja el almacén a medias
+        # (las filas escritas en la capacidad libre quedan fuera de las columnas publicadas)
+        columns = {}
+        for name, values in self.columns.items():
+            dtype = STORE_COLUMNS[name]
+            if dtype is object:
+                columns[name] = values.concatenate([record.get(name, '') for record in records])
+            else:
+                new_values = np.array(
+                    [record.get(name) if record.get(name) is not None else 0 for record in records],
+                    dtype=dtype
+                )
+                columns[name] = self._buffer(name).extend(values, new_values)
+        self.columns.update(columns)
+        self.active = self._buffer('active').extend(self.active, np.ones(len(records), dtype=bool))
+        return np.arange(start, len(self))
+
+    def _buffer(self, name: str) -> RowBuffer:
+        return self._buffers.setdefault(name, RowBuffer())
+
+    def deactivate(self, row: int):
+        """Dar de baja una fila sin reordenar el almacén"""
+        self.active[row] = False
+
+    def get(self, row: int) -> Dict:
+        """Obtener el payload de un producto por fila"""
+        return self.get_many([row])[0]
+
+    def get_many(self, rows) -> List[Dict]:
+        """Obtener los payloads de varias filas en una sola pasada por columna"""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = [self.columns[field][rows].tolist() for field in PAYLOAD_FIELDS]
+        return [dict(zip(PAYLOAD_FIELDS, record)) for record in zip(*values)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materializar el catálogo activo como DataFrame"""
+        rows = np.flatnonzero(self.active)
+        return pd.DataFrame({name: values[rows] for name, values in self.columns.items()})
+
+    @property
+    def nbytes(self) -> int:
+        return self.active.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def save(self, directory: Path):
+        """Guardar cada columna como archivos .npy independientes"""
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / 'active.npy', self.active)
+        for name, values in self.columns.items():
+            if isinstance(values, StringColumn):
+                np.save(directory / f'{name}.data.npy', values.data)
+                np.save(directory / f'{name}.offsets.npy', values.offsets)
+            else:
+                np.save(directory / f'{name}.npy', values)
+
+    @classmethod
+    def load(cls, directory: Path, columns: List[str], mmap_mode: str = None):
+        """Abrir las columnas guardadas, opcionalmente mapeadas en memoria"""
+        loaded = {}
+        for name in columns:
+            if STORE_COLUMNS[name] is object:
+                loaded[name] = StringColumn(
+                    np.load(directory / f'{name}.data.npy', mmap_mode=mmap_mode),
+                    np.load(directory / f'{name}.offsets.npy', mmap_mode=mmap_mode)
+                )
+            else:
+                loaded[name] = np.load(directory / f'{name}.npy', mmap_mode=mmap_mode)
+        return cls(loaded, np.load(directory / 'active.npy', mmap_mode=mmap_mode))
+
+class PayloadFragments:
+    """Payloads de productos pre-codificados en JSON, uno por fila del almacén
+
+    Cada fragmento es el objeto JSON del payload sin la llave de cierre, para
+    completarlo con los puntajes de la solicitud. Una fila nunca cambia
+    (los cambios del catálogo agregan filas nuevas), así que un fragmento
+    se codifica una sola vez mientras el almacén siga siendo el mismo. Con
+    más de maxsize fragmentos se desalojan los menos usados (LRU).
+    """
+
+    def __init__(self, store: ProductStore, maxsize: int = MAX_PAYLOAD_FRAGMENTS):
+        self.store = store
+        self.maxsize = maxsize
+        self._fragments: Dict[int, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get_many(self, rows: List[int]) -> List[bytes]:
+        """Fragmentos de varias filas, codificando en lote las que faltan"""
+        fragments = self._fragments
+        with self._lock:
+            cached = [fragments.get(row) for row in rows]
+            for row, fragment in zip(rows, cached):
+                if fragment is not None:
+                    fragments.move_to_end(row)
+        missing = [row for row, fragment in zip(rows, cached) if fragment is None]
+        if not missing:
+            return cached
+
+        # La codificación ocurre fuera del lock
+        encoded = {row: dumps(payload)[:-1] for row, payload in zip(missing, self.store.get_many(missing))}
+        with self._lock:
+            fragments.update(encoded)
+            while len(fragments) > self.maxsize:
+                fragments.popitem(last=False)
+                self.evictions += 1
+        return [encoded[row] if fragment is None else fragment for row, fragment in zip(rows, cached)]
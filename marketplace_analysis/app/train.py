@@ -0,0 +1,68 @@
+"""Entrenamiento offline del recomendador
+
+Uso: python -m app.train --data data/raw/products.csv --output models/trained/recommender --table-only
+
+Ejecuta ProductAnalyzer + ProductRecommender.fit fuera de la API y guarda el
+resultado. Con --table-only se escribe solo la tabla de vecinos (ids uint32,
+puntajes float16) y las columnas de los productos: la API la sirve sin
+scikit-learn, pero no admite altas ni cambios hasta el próximo entrenamiento.
+"""
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.model_manager import DATA_PATH, train_recommender
+
+logger = logging.getLogger(__name__)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', type=Path, default=DATA_PATH, help='Catálogo (CSV o Parquet)')
+    parser.add_argument('--output', type=Path, default=settings.model_path, help='Directorio del modelo')
+    parser.add_argument('--table-only', action='store_true',
+                        help='Guardar solo la tabla de vecinos para servir')
+    parser.add_argument('--n-neighbors', type=int, default=50)
+    parser.add_argument('--index-backend', choices=('exact', 'lsh'), default='exact')
+    parser.add_argument('--vector-dtype', choices=('float64', 'float32', 'int8'), default='float32')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Hilos para los bloques del índice de vecinos (por defecto, todos los núcleos)')
+    parser.add_argument('--text-jobs', type=int, default=os.cpu_count() or 1,
+                        help='Procesos para armar los documentos TF-IDF')
+    parser.add_argument('--memory-budget-mb', type=float, default=None)
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='Limpiar y normalizar el catálogo por bloques de este número de filas '
+                             '(el entrenamiento sigue cargando el catálogo procesado completo)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=settings.log_level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    started = time.perf_counter()
+    recommender = train_recommender(
+        args.data,
+        chunksize=args.chunksize,
+        n_neighbors=args.n_neighbors,
+        index_backend=args.index_backend,
+        vector_dtype=args.vector_dtype,
+        n_jobs=args.n_jobs,
+        text_jobs=args.text_jobs,
+        memory_budget_mb=args.memory_budget_mb
+    )
+    recommender.save(args.output, serving_only=args.table_only)
+
+    size = sum(path.stat().st_size for path in args.output.rglob('*') if path.is_file())
+    artifact = 'tabla de vecinos' if args.table_only else 'modelo'
+    logger.info(
+        f"Entrenamiento offline completado: {artifact} de {len(recommender.product_indices)} productos "
+        f"en {args.output} ({size / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s)"
+    )
+
+if __name__ == '__main__':
+    main()
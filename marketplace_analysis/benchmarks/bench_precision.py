@@ -0,0 +1,50 @@
+"""Comparar memoria y calidad de las recomendaciones con vectores y puntajes compactos
+
+Uso: python -m benchmarks.bench_precision --rows 50000 --k 10
+"""
+import argparse
+import json
+import logging
+
+from app.services.recommender import ProductRecommender
+from benchmarks.synthetic import generate_catalog
+
+# (vector_dtype, score_dtype) comparados contra float64/float32
+VARIANTS = (('float32', 'float32'), ('float32', 'float16'), ('int8', 'float16'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--sample-size', type=int, default=1000)
+    parser.add_argument('--output', help='Archivo JSON con los reportes')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    df = generate_catalog(args.rows, args.seed)
+    print(f"Catálogo sintético: {args.rows} filas")
+    reference = ProductRecommender(vector_dtype='float64', score_dtype='float32').fit(df.copy())
+
+    reports = []
+    for vector_dtype, score_dtype in VARIANTS:
+        model = ProductRecommender(vector_dtype=vector_dtype, score_dtype=score_dtype).fit(df.copy())
+        reports.append(model.precision_report(reference, args.k, args.sample_size, args.seed))
+        del model
+
+    print(f"{'vectores':>9} {'puntajes':>9} {'caract. (MB)':>13} {'índices (MB)':>13} {'reducción':>10} "
+          f"{'solap. índice':>14} {'solap. exacto':>14} {'error máx.':>11}")
+    for report in reports:
+        memory, reference_memory = report['memory'], report['reference_memory']
+        reduction = sum(reference_memory.values()) / sum(memory.values())
+        print(f"{report['vector_dtype']:>9} {report['score_dtype']:>9} "
+              f"{memory['features_bytes'] / 1e6:>13.1f} {memory['index_bytes'] / 1e6:>13.1f} "
+              f"{reduction:>9.1f}x {report['index_overlap']:>14.4f} "
+              f"{report['exact_overlap']:>14.4f} {report['max_score_error']:>11.5f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(reports, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Medir entrenamiento, memoria, tamaño, carga y latencia del recomendador por tamaño de catálogo
+
+Uso: python -m benchmarks.bench_recommender --rows 10000 100000 1000000 --backend lsh
+
+Cada tamaño se mide en un proceso hijo separado para que el pico de memoria
+(RSS) de un tamaño no contamine al siguiente. Los resultados se guardan en
+JSON en benchmarks/results/ para comparar corridas.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+LATENCY_METHODS = ('get_recommendations', 'get_similar_products', 'get_product_by_id')
+
+def _rss_mb() -> float:
+    """RSS actual del proceso (Linux); 0 si no está disponible"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _directory_size_mb(directory: Path) -> float:
+    return sum(path.stat().st_size for path in directory.rglob('*') if path.is_file()) / (1024 * 1024)
+
+def _latency(function, product_ids: np.ndarray) -> dict:
+    """p50/p99 (microsegundos) de una llamada por producto"""
+    samples = np.empty(len(product_ids))
+    for position, product_id in enumerate(product_ids.tolist()):
+        start = time.perf_counter()
+        function(product_id)
+        samples[position] = time.perf_counter() - start
+    p50, p99 = np.percentile(samples, [50, 99]) * 1e6
+    return {'p50_us': round(float(p50), 1), 'p99_us': round(float(p99), 1), 'calls': len(samples)}
+
+def measure(n_rows: int, backend: str, calls: int, seed: int) -> dict:
+    """Medir un tamaño de catálogo (se ejecuta en un proceso hijo)"""
+    from app.services.recommender import ProductRecommender
+    from benchmarks.synthetic import generate_catalog
+
+    logging.disable(logging.INFO)
+    df = generate_catalog(n_rows, seed)
+    baseline_rss = _rss_mb()
+
+    start = time.perf_counter()
+    recommender = ProductRecommender(index_backend=backend, cache_size=0).fit(df)
+    fit_seconds = time.perf_counter() - start
+    peak_rss = _peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp) / 'model'
+        recommender.save(directory)
+        model_size = _directory_size_mb(directory)
+        del recommender
+
+        start = time.perf_counter()
+        loaded = ProductRecommender.load(directory, cache_size=0)
+        load_seconds = time.perf_counter() - start
+
+        # Caché desactivada: se mide el camino de cálculo, no los aciertos
+        product_ids = np.random.default_rng(seed).choice(df['product_id'].to_numpy(), calls)
+        latency = {
+            method: _latency(getattr(loaded, method), product_ids) for method in LATENCY_METHODS
+        }
+
+    return {
+        'rows': n_rows,
+        'backend': backend,
+        'fit_seconds': round(fit_seconds, 3),
+        'baseline_rss_mb': round(baseline_rss, 1),
+        'peak_rss_mb': round(peak_rss, 1),
+        'model_size_mb': round(model_size, 2),
+        'load_seconds': round(load_seconds, 3),
+        'latency': latency
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _metadata() -> dict:
+    import pandas as pd
+    import sklearn
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def print_table(results: list):
+    print(f"{'filas':>9} {'fit (s)':>9} {'pico RSS (MB)':>14} {'modelo (MB)':>12} {'carga (s)':>10}  "
+          + '  '.join(f'{method} p50/p99 (µs)' for method in LATENCY_METHODS))
+    for result in results:
+        latency = '  '.join(
+            f"{result['latency'][method]['p50_us']:>{len(method) - 4}.0f}/{result['latency'][method]['p99_us']:<14.0f}"
+            for method in LATENCY_METHODS
+        )
+        print(f"{result['rows']:>9} {result['fit_seconds']:>9.2f} {result['peak_rss_mb']:>14.1f} "
+              f"{result['model_size_mb']:>12.2f} {result['load_seconds']:>10.3f}  {latency}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--backend', choices=('exact', 'lsh'), default='exact')
+    parser.add_argument('--calls', type=int, default=1000, help='Llamadas por método para los percentiles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Archivo JSON de resultados (por defecto en benchmarks/results/)')
+    args = parser.parse_args()
+
+    results = []
+    # spawn + un proceso por tamaño: memoria limpia en cada medición
+    context = multiprocessing.get_context('spawn')
+    for n_rows in args.rows:
+        print(f"Midiendo catálogo de {n_rows} filas ({args.backend})...", flush=True)
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            results.append(pool.apply(measure, (n_rows, args.backend, args.calls, args.seed)))
+
+    report = {'meta': _metadata(), 'results': results}
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"recommender_{args.backend}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+    print_table(results)
+    print(f"Resultados guardados en {output}")
+
+if __name__ == '__main__':
+    main()
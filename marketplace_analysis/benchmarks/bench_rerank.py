@@ -0,0 +1,60 @@
+"""Comparar la latencia de las recomendaciones con y sin re-ordenamiento por calidad
+
+Uso: python -m benchmarks.bench_rerank --rows 50000 --calls 5000 --weights 0 0.2 0.5 --model-weight 0.2
+
+Con la caché desactivada se mide get_recommendations completo y solo la
+etapa de vecinos (rank_neighbors) para cada peso de calidad. El peso del
+modelo (--model-weight) se sirve del orden precalculado al entrenar; los
+demás pesos se re-ordenan al vuelo.
+"""
+import argparse
+import json
+import logging
+import numpy as np
+
+from app.services.recommender import ProductRecommender
+from benchmarks.bench_recommender import _latency
+from benchmarks.synthetic import generate_catalog
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--n', type=int, default=5, help='Recomendaciones por llamada')
+    parser.add_argument('--weights', type=float, nargs='+', default=[0.0, 0.2, 0.5])
+    parser.add_argument('--model-weight', type=float, default=0.2, help='quality_weight del modelo (precalculado)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    df = generate_catalog(args.rows, args.seed)
+    recommender = ProductRecommender(cache_size=0, quality_weight=args.model_weight).fit(df)
+    product_ids = np.random.default_rng(args.seed).choice(df['product_id'].to_numpy(), args.calls)
+    rows = np.array([recommender.product_indices[pid] for pid in product_ids.tolist()])
+
+    results = []
+    for weight in args.weights:
+        # Una pasada previa para que ambas variantes midan con las páginas ya cargadas
+        recommender.get_recommendations(int(product_ids[0]), args.n, weight)
+        results.append({
+            'quality_weight': weight,
+            'request': _latency(lambda pid: recommender.get_recommendations(pid, args.n, weight), product_ids),
+            'ranking': _latency(lambda row: recommender.rank_neighbors([row], args.n, quality_weight=weight), rows)
+        })
+
+    baseline = results[0]['request']['p50_us']
+    print(f"{'peso':>6} {'solicitud p50/p99 (µs)':>24} {'vecinos p50/p99 (µs)':>22} {'vs. peso 0':>11}")
+    for result in results:
+        request, ranking = result['request'], result['ranking']
+        print(f"{result['quality_weight']:>6.2f} {request['p50_us']:>11.1f}/{request['p99_us']:<12.1f} "
+              f"{ranking['p50_us']:>10.1f}/{ranking['p99_us']:<11.1f} "
+              f"{(request['p50_us'] / baseline - 1) * 100:>+10.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'rows': args.rows, 'n': args.n, 'model_weight': args.model_weight, 'results': results},
+                      output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Comparar el throughput de las respuestas de recomendaciones: pydantic + JSON estándar frente a fragmentos pre-codificados
+
+Uso: python -m benchmarks.bench_responses --rows 20000 --calls 5000 --http-calls 2000
+
+Variantes (en proceso, por llamada):
+- pydantic: dict de get_recommendations, validación del response_model,
+  jsonable_encoder y JSONResponse estándar (el camino anterior de la API)
+- fragmentos+validación: bytes de get_recommendations_json validados con
+  pydantic (modo VALIDATE_RESPONSES)
+- fragmentos: bytes de get_recommendations_json tal cual
+
+Cada variante se mide sin caché (productos al azar) y con caché (productos
+populares repetidos). Con --http-calls se mide además la API completa con
+TestClient, con y sin VALIDATE_RESPONSES.
+"""
+import argparse
+import json
+import logging
+import time
+import numpy as np
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.api.models import RecommendationResponse
+from app.core import serialization
+from app.services.recommender import ProductRecommender
+from benchmarks.synthetic import generate_catalog
+
+def pydantic_path(recommender, product_id, n):
+    result = recommender.get_recommendations(product_id, n)
+    return JSONResponse(jsonable_encoder(RecommendationResponse.model_validate(result))).body
+
+def validated_fragments_path(recommender, product_id, n):
+    body = recommender.get_recommendations_json(product_id, n)
+    RecommendationResponse.model_validate_json(body)
+    return body
+
+def fragments_path(recommender, product_id, n):
+    return recommender.get_recommendations_json(product_id, n)
+
+VARIANTS = {
+    'pydantic': pydantic_path,
+    'fragmentos+validación': validated_fragments_path,
+    'fragmentos': fragments_path
+}
+
+def throughput(function, product_ids: list) -> float:
+    """Llamadas por segundo sobre la secuencia de productos"""
+    started = time.perf_counter()
+    for product_id in product_ids:
+        function(product_id)
+    return len(product_ids) / (time.perf_counter() - started)
+
+def http_throughput(recommender, product_ids: list, n: int, validate: bool) -> float:
+    from fastapi.testclient import TestClient
+    from app.api import routes
+    from app.core.config import settings
+
+    settings.validate_responses = validate
+    settings.request_logging = False
+    headers = {'Authorization': 'Bearer test-token'}
+    # Sin el ciclo de vida: se sirve el recomendador ya entrenado, sin carga en segundo plano
+    routes.app.state.recommender = recommender
+    recommender.cache.clear()
+    client = TestClient(routes.app)
+    return throughput(
+        lambda pid: client.get(f'/products/{pid}/recommendations',
+                               params={'n_recommendations': n}, headers=headers),
+        product_ids
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--n', type=int, default=10, help='Recomendaciones por respuesta')
+    parser.add_argument('--popular', type=int, default=100, help='Productos distintos en la medición con caché')
+    parser.add_argument('--http-calls', type=int, default=0, help='Solicitudes por modo a la API (0 = omitir)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    df = generate_catalog(args.rows, args.seed)
+    recommender = ProductRecommender().fit(df)
+    rng = np.random.default_rng(args.seed)
+    all_ids = df['product_id'].to_numpy()
+    workloads = {
+        'sin caché': rng.choice(all_ids, args.calls).tolist(),
+        'con caché': rng.choice(rng.choice(all_ids, args.popular), args.calls).tolist()
+    }
+    print(f"Codificador: {'orjson' if serialization.orjson is not None else 'json (estándar)'}")
+
+    results = {}
+    for workload, product_ids in workloads.items():
+        cache_size = recommender.cache.maxsize if workload == 'con caché' else 0
+        for name, path in VARIANTS.items():
+            recommender.cache.clear()
+            recommender.cache.maxsize = cache_size
+            recommender.fragments = None
+            recommender._update_model_data()  # Fragmentos nuevos: se mide también su codificación
+            results.setdefault(name, {})[workload] = round(
+                throughput(lambda pid: path(recommender, pid, args.n), product_ids), 1
+            )
+
+    if args.http_calls:
+        product_ids = workloads['sin caché'][:args.http_calls]
+        for validate in (True, False):
+            name = 'API ' + ('con validación' if validate else 'sin validación')
+            recommender.cache.maxsize = 0
+            results[name] = {'sin caché': round(http_throughput(recommender, product_ids, args.n, validate), 1)}
+
+    print(f"{'variante':>24} " + ' '.join(f"{workload + ' (llamadas/s)':>24}" for workload in workloads))
+    for name, by_workload in results.items():
+        print(f"{name:>24} " + ' '.join(
+            f"{by_workload[workload]:>24.0f}" if workload in by_workload else f"{'-':>24}"
+            for workload in workloads
+        ))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'rows': args.rows, 'n': args.n, 'results': results}, output, indent=2)
+
+if __name__ == '__main__':
+    main()
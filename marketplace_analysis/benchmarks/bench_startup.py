@@ -0,0 +1,116 @@
+"""Medir el arranque de la API: tiempo de importación, de vida, de disponibilidad y primera solicitud
+
+Uso: python -m benchmarks.bench_startup --rows 20000 --repeat 5
+
+Cada repetición arranca un intérprete nuevo que importa app.api.routes,
+ejecuta el ciclo de vida con TestClient y consulta /readyz hasta que el
+modelo está cargado. Se mide con y sin precalentamiento del modelo.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.bench_recommender import RESULTS_DIR, _metadata
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+# Se ejecuta en el proceso hijo; imprime una línea JSON con los tiempos
+CHILD_SCRIPT = '''
+import time
+started = time.perf_counter()
+import json
+import app.api.routes as routes
+imported = time.perf_counter() - started
+from fastapi.testclient import TestClient
+
+with TestClient(routes.app) as client:
+    client.get('/healthz')
+    alive = time.perf_counter() - started
+    while client.get('/readyz').status_code != 200:
+        time.sleep(0.005)
+    ready = time.perf_counter() - started
+    product_id = next(iter(routes.app.state.recommender.product_indices))
+    request_started = time.perf_counter()
+    client.get(f'/products/{product_id}/recommendations', headers={'Authorization': 'Bearer test-token'})
+    first_request = time.perf_counter() - request_started
+print(json.dumps({'import': imported, 'alive': alive, 'ready': ready, 'first_request': first_request}))
+'''
+
+def run_child(model_path: Path, warm_up: bool) -> dict:
+    env = {
+        **os.environ,
+        'MODEL_PATH': str(model_path),
+        'MODEL_WARM_UP': 'true' if warm_up else 'false',
+        'LOG_LEVEL': 'WARNING',
+        'PYTHONPATH': str(PROJECT_DIR)
+    }
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT], cwd=PROJECT_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def drop_page_cache(model_path: Path):
+    """Sacar los archivos del modelo de la caché de páginas (si el sistema lo permite)"""
+    for path in model_path.rglob('*'):
+        if path.is_file() and hasattr(os, 'posix_fadvise'):
+            with open(path, 'rb') as file:
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20_000, help='Filas del catálogo sintético')
+    parser.add_argument('--model', help='Directorio de un modelo ya guardado (omite el entrenamiento)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Archivo JSON de resultados (por defecto en benchmarks/results/)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.model:
+            model_path = Path(args.model).resolve()
+        else:
+            from app.services.recommender import ProductRecommender
+            from benchmarks.synthetic import generate_catalog
+
+            logging.disable(logging.INFO)
+            print(f"Entrenando modelo sintético de {args.rows} filas...", flush=True)
+            model_path = Path(tmp) / 'model'
+            ProductRecommender().fit(generate_catalog(args.rows, args.seed)).save(model_path)
+
+        results = []
+        for warm_up in (False, True):
+            runs = []
+            for _ in range(args.repeat):
+                drop_page_cache(model_path)
+                runs.append(run_child(model_path, warm_up))
+            summary = {
+                stage: round(float(np.median([run[stage] for run in runs])), 4)
+                for stage in ('import', 'alive', 'ready', 'first_request')
+            }
+            results.append({'warm_up': warm_up, 'rows': args.rows if not args.model else None,
+                            'median_seconds': summary, 'runs': runs})
+
+    print(f"{'precalentado':>13} {'import (s)':>11} {'vivo (s)':>9} {'listo (s)':>10} {'1ª solicitud (ms)':>18}")
+    for result in results:
+        summary = result['median_seconds']
+        print(f"{str(result['warm_up']):>13} {summary['import']:>11.3f} {summary['alive']:>9.3f} "
+              f"{summary['ready']:>10.3f} {summary['first_request'] * 1000:>18.2f}")
+
+    report = {'meta': _metadata(), 'results': results}
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"Resultados guardados en {output}")
+
+if __name__ == '__main__':
+    main()
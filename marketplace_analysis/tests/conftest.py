@@ -4,11 +4,12 @@ import logging
 import os
 from pathlib import Path
 from app.api.routes import app
+from app.core.config import settings
 from app.services.analyzer import ProductAnalyzer
 from app.services.recommender import ProductRecommender
 
 # Configuraciones
-MODEL_PATH = Path('models/trained/recommender.pkl')
+MODEL_PATH = Path('models/trained/recommender')
 DATA_PATH = Path('data/raw/products.csv')
 
 # Configurar logging
@@ -18,6 +19,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Modo de pruebas: las respuestas pre-codificadas se validan con pydantic
+settings.validate_responses = True
+
 @pytest.fixture(scope="session")
 def client():
     """Cliente de pruebas para la API"""
@@ -64,8 +68,8 @@ def setup_test_recommender(client, test_data_path, analyzer):
         # Verificar inicialización correcta
         if not hasattr(recommender, 'product_indices'):
             raise ValueError("Recomendador no inicializado correctamente: falta product_indices")
-        if not hasattr(recommender, 'similarity_matrix'):
-            raise ValueError("Recomendador no inicializado correctamente: falta similarity_matrix")
+        if getattr(recommender, 'neighbor_index', None) is None:
+            raise ValueError("Recomendador no inicializado correctamente: falta neighbor_index")
         if len(recommender.product_indices) == 0:
             raise ValueError("Recomendador no tiene productos en el índice")
         
@@ -74,9 +78,9 @@ def setup_test_recommender(client, test_data_path, analyzer):
         logger.info("Recomendador configurado exitosamente")
         
         # Guardar modelo si se requiere
-        if not MODEL_PATH.parent.exists():
+        if not MODEL_PATH.exists():
             os.makedirs(MODEL_PATH.parent, exist_ok=True)
-            recommender.save_model(MODEL_PATH)
+            recommender.save(MODEL_PATH)
             logger.info(f"Modelo guardado en {MODEL_PATH}")
         
         return recommender
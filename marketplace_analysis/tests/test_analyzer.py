@@ -1,4 +1,6 @@
 import unittest
+import importlib.util
+import numpy as np
 import pandas as pd
 from app.services.analyzer import ProductAnalyzer
 
@@ -25,5 +27,73 @@ class TestProductAnalyzer(unittest.TestCase):
         self.assertIn('price_normalized', normalized_df.columns)
         self.assertTrue(all(normalized_df['price_normalized'].between(0, 1)))
 
+    def test_vectorized_features_match_clean_text(self):
+        """Probar que la extracción vectorizada coincide con clean_text fila a fila"""
+        self.analyzer.df = pd.DataFrame({
+            'title': ['  Phone X ', np.nan, 'LAPTOP', 123],
+            'description': ['Desc ', None, '', 'Otra DESC'],
+            'category': ['Electronics/Phones', np.nan, 'Electronics', 'Home/Kitchen']
+        })
+        processed_df = self.analyzer.extract_features()
+        for col in ['title', 'description']:
+            expected = [self.analyzer.clean_text(value) for value in processed_df[col]]
+            self.assertEqual(list(processed_df[f'{col}_clean']), expected)
+        self.assertEqual(list(processed_df['main_category']), ['Electronics', 'Unknown', 'Electronics', 'Home'])
+
+        # Con dtype categórico el resultado es el mismo
+        self.analyzer.df['category'] = self.analyzer.df['category'].astype('category')
+        self.assertEqual(
+            list(self.analyzer.extract_features()['main_category']),
+            ['Electronics', 'Unknown', 'Electronics', 'Home']
+        )
+
+    def test_chunked_loading(self):
+        """Probar la carga por bloques con esquema tipado"""
+        chunked_df = ProductAnalyzer().load_data('data/raw/products.csv', chunksize=7)
+        self.assertEqual(len(chunked_df), len(self.df))
+        self.assertIsInstance(chunked_df['category'].dtype, pd.CategoricalDtype)
+        self.assertEqual(chunked_df['price'].dtype, np.float32)
+        self.assertEqual(chunked_df['reviews_count'].dtype, np.int32)
+        self.assertEqual(chunked_df['category'].astype(str).tolist(), self.df['category'].astype(str).tolist())
+        np.testing.assert_allclose(chunked_df['price'], self.df['price'], rtol=1e-6)
+
+    def test_stream_processing(self):
+        """Probar que la normalización por bloques usa el rango global"""
+        chunks = list(self.analyzer.process_stream('data/raw/products.csv', chunksize=7))
+        self.assertTrue(all(len(chunk) <= 7 for chunk in chunks))
+
+        processed_df = self.analyzer.load_processed('data/raw/products.csv', chunksize=7)
+        self.assertIn('title_clean', processed_df.columns)
+        self.assertIn('main_category', processed_df.columns)
+        self.assertTrue(all(processed_df['price_normalized'].between(0, 1)))
+        self.assertAlmostEqual(float(processed_df['price_normalized'].min()), 0.0)
+        self.assertAlmostEqual(float(processed_df['price_normalized'].max()), 1.0)
+
+    def test_stream_processing_missing_optional_column(self):
+        """Probar el procesamiento por bloques de un catálogo sin una columna opcional"""
+        import tempfile
+        from pathlib import Path
+        from app.services.model_manager import train_recommender
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'products.csv'
+            self.df.drop(columns=['sales_last_30_days']).to_csv(path, index=False)
+            processed_df = ProductAnalyzer().load_processed(path, chunksize=7)
+            recommender = train_recommender(path, chunksize=7, n_neighbors=5)
+        self.assertNotIn('sales_last_30_days_normalized', processed_df.columns)
+        self.assertTrue(all(processed_df['price_normalized'].between(0, 1)))
+        self.assertEqual(len(recommender.product_indices), len(self.df))
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow no instalado')
+    def test_parquet_loading(self):
+        """Probar la carga de archivos Parquet por lotes"""
+        import tempfile
+        from pathlib import Path
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'products.parquet'
+            self.df.to_parquet(path)
+            parquet_df = ProductAnalyzer().load_data(path, chunksize=7)
+        self.assertEqual(len(parquet_df), len(self.df))
+        self.assertIsInstance(parquet_df['category'].dtype, pd.CategoricalDtype)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
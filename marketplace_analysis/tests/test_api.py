@@ -58,12 +58,174 @@ def test_get_recommendations_invalid_product(client, auth_headers, setup_test_re
     )
     assert response.status_code == 404
 
+def test_invalid_n_recommendations(client, auth_headers, setup_test_recommender):
+    """Probar que n_recommendations menor que 1 se rechaza en las rutas de un producto"""
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    
+    for url in (f"/products/{valid_id}/recommendations", f"/products/{valid_id}/similar"):
+        for n in (0, -2):
+            response = client.get(url, params={"n_recommendations": n}, headers=auth_headers)
+            assert response.status_code == 422
+
 def test_get_recommendations_without_token(client):
     """Probar acceso sin token de autenticación"""
     logger.info("Probando la ruta de recomendaciones sin token")
     response = client.get("/products/1/recommendations")
     assert response.status_code == 401
 
+def test_get_recommendations_batch(client, auth_headers, setup_test_recommender):
+    """Probar recomendaciones en lote con un id inexistente en el lote"""
+    logger.info("Probando la ruta de recomendaciones en lote")
+    
+    valid_ids = list(setup_test_recommender.product_indices.keys())[:3]
+    invalid_id = max(setup_test_recommender.product_indices.keys()) + 1000
+    
+    response = client.post(
+        "/products/recommendations/batch",
+        json={"product_ids": valid_ids + [invalid_id], "n_recommendations": 4},
+        headers=auth_headers
+    )
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["product_id"] for item in results] == valid_ids + [invalid_id]
+    
+    for product_id, item in zip(valid_ids, results):
+        assert item["error"] is None
+        assert len(item["recommendations"]) == 4
+        single = client.get(
+            f"/products/{product_id}/recommendations",
+            params={"n_recommendations": 4},
+            headers=auth_headers
+        ).json()
+        assert item["recommendations"] == single["recommendations"]
+    
+    assert results[-1]["error"] is not None
+    assert results[-1]["recommendations"] == []
+
+def test_quality_reranking(client, auth_headers, setup_test_recommender):
+    """Probar el peso de la calidad elegido por solicitud"""
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    url = f"/products/{valid_id}/recommendations"
+    
+    plain = client.get(url, headers=auth_headers).json()
+    assert all(rec["rank_score"] is None for rec in plain["recommendations"])
+    
+    response = client.get(url, params={"quality_weight": 0.5}, headers=auth_headers)
+    assert response.status_code == 200
+    ranks = [rec["rank_score"] for rec in response.json()["recommendations"]]
+    assert len(ranks) == 5
+    assert ranks == sorted(ranks, reverse=True)
+    
+    batch = client.post(
+        "/products/recommendations/batch",
+        json={"product_ids": [valid_id], "quality_weight": 0.5},
+        headers=auth_headers
+    ).json()
+    assert batch["results"][0]["recommendations"] == response.json()["recommendations"]
+    
+    similar = client.get(
+        f"/products/{valid_id}/similar", params={"quality_weight": 1.0}, headers=auth_headers
+    )
+    assert similar.status_code == 200
+    assert client.get(url, params={"quality_weight": 2}, headers=auth_headers).status_code == 422
+
+def test_get_recommendations_batch_all_unknown(client, auth_headers, setup_test_recommender):
+    """Probar un lote sin ids conocidos pidiendo más vecinos que el K del índice"""
+    unknown_ids = [max(setup_test_recommender.product_indices.keys()) + offset for offset in (1000, 2000)]
+    n_recommendations = setup_test_recommender.neighbor_index.n_neighbors + 5
+    
+    response = client.post(
+        "/products/recommendations/batch",
+        json={"product_ids": unknown_ids, "n_recommendations": n_recommendations},
+        headers=auth_headers
+    )
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["product_id"] for item in results] == unknown_ids
+    assert all(item["error"] is not None and item["recommendations"] == [] for item in results)
+
+def test_pre_encoded_responses(client, auth_headers, setup_test_recommender, monkeypatch):
+    """Probar que la respuesta rápida sin validación es la misma que la validada"""
+    from app.core.config import settings
+    
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    urls = [f"/products/{valid_id}/recommendations", f"/products/{valid_id}/similar"]
+    validated = [client.get(url, headers=auth_headers) for url in urls]
+    
+    monkeypatch.setattr(settings, 'validate_responses', False)
+    for url, expected in zip(urls, validated):
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == expected.content
+    
+    response = client.get("/metrics/category_stats", headers=auth_headers)
+    assert response.status_code == 200
+
+def test_get_recommendations_batch_without_token(client):
+    """Probar el lote sin token de autenticación"""
+    response = client.post("/products/recommendations/batch", json={"product_ids": [1]})
+    assert response.status_code == 401
+
+def test_catalog_updates(client, auth_headers, setup_test_recommender):
+    """Probar alta, modificación y baja de productos vía API"""
+    logger.info("Probando las rutas de cambios del catálogo")
+    
+    product = {
+        "title": "Wireless Headphones X",
+        "description": "Noise cancelling wireless headphones",
+        "category": "Electronics/Audio",
+        "price": 120.0,
+        "rating": 4.2,
+        "reviews_count": 15
+    }
+    response = client.post("/products", json=product, headers=auth_headers)
+    assert response.status_code == 201
+    product_id = response.json()["product_id"]
+    assert product_id in setup_test_recommender.product_indices
+    
+    response = client.get(f"/products/{product_id}/recommendations", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["title"] == product["title"]
+    
+    response = client.put(
+        f"/products/{product_id}",
+        json=dict(product, price=99.0),
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert setup_test_recommender.get_product_by_id(product_id)["price"] == 99.0
+    
+    response = client.delete(f"/products/{product_id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "deleted"
+    
+    response = client.delete(f"/products/{product_id}", headers=auth_headers)
+    assert response.status_code == 404
+    response = client.get(f"/products/{product_id}/recommendations", headers=auth_headers)
+    assert response.status_code == 404
+
+def test_catalog_updates_rejected_in_process_mode(client, auth_headers, setup_test_recommender, monkeypatch):
+    """Probar que en modo 'process' los cambios del catálogo se rechazan con 409"""
+    from app.api.routes import app, get_executor
+    
+    monkeypatch.setattr(get_executor(app), "mode", "process")
+    product_id = list(setup_test_recommender.product_indices.keys())[0]
+    product = {"title": "Producto", "description": "", "category": "Electronics/Audio", "price": 10.0}
+    n_products = len(setup_test_recommender.product_indices)
+    
+    responses = [
+        client.post("/products", json=product, headers=auth_headers),
+        client.put(f"/products/{product_id}", json=product, headers=auth_headers),
+        client.delete(f"/products/{product_id}", headers=auth_headers)
+    ]
+    assert [response.status_code for response in responses] == [409, 409, 409]
+    assert "EXECUTOR_MODE=process" in responses[0].json()["detail"]
+    assert len(setup_test_recommender.product_indices) == n_products
+    assert setup_test_recommender.get_product_by_id(product_id)["title"] != "Producto"
+
 def test_get_similar_products(client, auth_headers, setup_test_recommender):
     """Probar obtención de productos similares"""
     logger.info("Probando la ruta de productos similares")
@@ -114,6 +276,230 @@ def test_get_category_distribution(client, auth_headers):
     assert isinstance(data["total_products"], int)
     assert data["total_products"] > 0
 
+def test_catalog_metrics(client, auth_headers, setup_test_recommender):
+    """Probar las métricas precalculadas del catálogo"""
+    response = client.get("/metrics/category_stats", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_products"] == len(setup_test_recommender.product_indices)
+    for summary in data["categories"].values():
+        assert summary["count"] > 0
+        for col in ["price", "rating", "sales_last_30_days"]:
+            assert summary[col]["p25"] <= summary[col]["p50"] <= summary[col]["p75"] <= summary[col]["p90"]
+    
+    response = client.get("/metrics/histograms", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert sum(data["stock"].values()) == data["total_products"]
+    assert len(data["product_score"]["edges"]) == len(data["product_score"]["counts"]) + 1
+
+def test_get_cache_stats(client, auth_headers, setup_test_recommender):
+    """Probar los contadores de la caché de recomendaciones"""
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    for _ in range(2):
+        client.get(f"/products/{valid_id}/recommendations", headers=auth_headers)
+    
+    response = client.get("/metrics/cache", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    for field in ["model_version", "size", "hits", "misses", "evictions", "hit_rate"]:
+        assert field in data
+    assert data["hits"] >= 1
+
+def test_background_retraining(client, auth_headers, setup_test_recommender):
+    """Probar el reentrenamiento en segundo plano con reemplazo atómico del modelo"""
+    import threading
+    from unittest import mock
+    from app.api.routes import app
+    from app.services.model_manager import ModelManager
+    from app.services.recommender import ProductRecommender
+    
+    release = threading.Event()
+    fit = ProductRecommender.fit
+    def blocked_fit(recommender, df):
+        release.wait(timeout=30)
+        return fit(recommender, df)
+    
+    app.state.model_manager = ModelManager(app.state)
+    patcher = mock.patch.object(ProductRecommender, "fit", blocked_fit)
+    patcher.start()
+    try:
+        old_version = setup_test_recommender.model_version
+        response = client.post("/admin/model/retrain", headers=auth_headers)
+        assert response.status_code == 202
+        assert response.json()["active_model_version"] == old_version
+        
+        # Mientras entrena se sigue sirviendo el modelo anterior
+        assert client.post("/admin/model/retrain", headers=auth_headers).status_code == 409
+        response = client.get("/admin/model/status", headers=auth_headers)
+        assert response.json()["retraining"]["state"] == "training"
+        assert response.json()["model_version"] == old_version
+        valid_id = list(setup_test_recommender.product_indices.keys())[0]
+        assert client.get(f"/products/{valid_id}/recommendations", headers=auth_headers).status_code == 200
+        
+        release.set()
+        assert app.state.model_manager.wait(timeout=60)
+        data = client.get("/admin/model/status", headers=auth_headers).json()
+        assert data["retraining"]["state"] == "idle"
+        assert data["retraining"]["duration_seconds"] is not None
+        assert data["model_version"] != old_version
+        assert data["built_at"] is not None
+        assert data["build_seconds"] > 0
+        assert app.state.recommender is not setup_test_recommender
+        assert client.get(f"/products/{valid_id}/recommendations", headers=auth_headers).status_code == 200
+    finally:
+        release.set()
+        patcher.stop()
+        app.state.model_manager.wait(timeout=60)
+        del app.state.model_manager
+        setup_test_recommender.successor = None
+        app.state.recommender = setup_test_recommender
+
+def test_retraining_keeps_catalog_writes(client, auth_headers, setup_test_recommender):
+    """Probar que el reentrenamiento parte del catálogo activo y conserva los cambios de la API"""
+    import threading
+    from unittest import mock
+    from app.api.routes import app
+    from app.services.model_manager import ModelManager
+    from app.services.recommender import ProductRecommender
+    
+    product = {"title": "Lámpara de escritorio LED", "description": "", "category": "Home/Lighting", "price": 35.0}
+    training, release = threading.Event(), threading.Event()
+    fit = ProductRecommender.fit
+    def blocked_fit(recommender, df):
+        training.set()
+        release.wait(timeout=30)
+        return fit(recommender, df)
+    
+    app.state.model_manager = ModelManager(app.state)
+    removed_id = list(setup_test_recommender.product_indices.keys())[-1]
+    added_ids = []
+    try:
+        response = client.post("/products", json=product, headers=auth_headers)
+        assert response.status_code == 201
+        added_ids.append(response.json()["product_id"])
+        
+        with mock.patch.object(ProductRecommender, "fit", blocked_fit):
+            assert client.post("/admin/model/retrain", headers=auth_headers).status_code == 202
+            assert training.wait(timeout=30)
+            # Las escrituras durante el entrenamiento se reenvían al modelo nuevo
+            writes = threading.Thread(target=lambda: (
+                added_ids.append(client.post("/products", json=product, headers=auth_headers).json()["product_id"]),
+                client.delete(f"/products/{removed_id}", headers=auth_headers)
+            ))
+            writes.start()
+            release.set()
+            assert app.state.model_manager.wait(timeout=60)
+            writes.join(timeout=60)
+        
+        assert app.state.model_manager.job_status["state"] == "idle"
+        assert app.state.recommender is not setup_test_recommender
+        for product_id in added_ids:
+            response = client.get(f"/products/{product_id}/recommendations", headers=auth_headers)
+            assert response.status_code == 200
+            assert response.json()["title"] == product["title"]
+        response = client.get(f"/products/{removed_id}/recommendations", headers=auth_headers)
+        assert response.status_code == 404
+    finally:
+        release.set()
+        app.state.model_manager.wait(timeout=60)
+        del app.state.model_manager
+        setup_test_recommender.successor = None
+        app.state.recommender = setup_test_recommender
+        for product_id in added_ids:
+            if product_id in setup_test_recommender.product_indices:
+                setup_test_recommender.remove_product(product_id)
+
+def test_executor_backpressure(client, auth_headers, setup_test_recommender):
+    """Probar que con la cola llena se responde 503 con Retry-After"""
+    import asyncio
+    import threading
+    from app.api.routes import app
+    from app.services.executor import ExecutorSaturated, RecommendationExecutor
+    
+    executor = RecommendationExecutor(max_workers=1, max_queue=1, retry_after=7)
+    release = threading.Event()
+    
+    async def burst():
+        calls = [executor.run(release.wait, 5) for _ in range(3)]
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    
+    results = asyncio.run(burst())
+    assert [isinstance(result, ExecutorSaturated) for result in results] == [False, False, True]
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["in_flight"] == 0
+    
+    # Vía API: el executor saturado rechaza la solicitud
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    app.state.executor = executor
+    executor.in_flight = 2
+    try:
+        response = client.get(f"/products/{valid_id}/recommendations", headers=auth_headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "7"
+        
+        executor.in_flight = 0
+        response = client.get(f"/products/{valid_id}/recommendations", headers=auth_headers)
+        assert response.status_code == 200
+        assert client.get("/metrics/executor", headers=auth_headers).json()["rejected"] == 2
+    finally:
+        executor.shutdown()
+        del app.state.executor
+
+def test_internal_metrics(client, auth_headers, setup_test_recommender):
+    """Probar la exposición de métricas por etapa y por ruta"""
+    valid_id = list(setup_test_recommender.product_indices.keys())[-1]
+    response = client.get(
+        f"/products/{valid_id}/recommendations",
+        params={"n_recommendations": 4},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    
+    response = client.get("/internal/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    for stage in ["auth", "cache", "lookup", "scoring", "hydration", "endpoint", "serialization", "queue_wait"]:
+        assert f'marketplace_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'route="/products/{product_id}/recommendations",status="200"' in text
+    assert "# TYPE marketplace_request_duration_seconds histogram" in text
+
+def test_process_executor_stage_metrics(setup_test_recommender, tmp_path):
+    """Probar que las etapas medidas en los procesos del executor se registran en el principal"""
+    import asyncio
+    from app.core.metrics import REGISTRY, RequestTimings, current_request
+    from app.services.executor import RecommendationExecutor
+    
+    def stage_count(stage):
+        prefix = f'marketplace_stage_duration_seconds_count{{stage="{stage}"}} '
+        lines = [line for line in REGISTRY.render().splitlines() if line.startswith(prefix)]
+        return int(lines[0][len(prefix):]) if lines else 0
+    
+    model_path = tmp_path / "model"
+    setup_test_recommender.save(model_path)
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    executor = RecommendationExecutor(max_workers=1, mode="process", model_path=model_path)
+    
+    async def call():
+        timings = RequestTimings()
+        current_request.set(timings)
+        body = await executor.call(None, "get_recommendations_json", valid_id, 4)
+        return body, timings
+    
+    stages = ["queue_wait", "cache", "lookup", "scoring", "hydration"]
+    before = {stage: stage_count(stage) for stage in stages}
+    try:
+        body, timings = asyncio.run(call())
+    finally:
+        executor.shutdown()
+    assert set(stages) <= set(timings.stages)
+    assert all(stage_count(stage) == before[stage] + 1 for stage in stages)
+    assert body == setup_test_recommender.get_recommendations_json(valid_id, 4)
+
 def test_invalid_token(client):
     """Probar acceso con token inválido"""
     logger.info("Probando acceso con token inválido")
@@ -159,4 +545,89 @@ def test_different_recommendation_counts(
         assert "rating" in rec
         assert "category" in rec
         assert "reviews_count" in rec
-        assert "similarity_score" in rec
\ No newline at end of file
+        assert "similarity_score" in rec
+
+def test_request_profiling(client, auth_headers, setup_test_recommender, tmp_path, monkeypatch):
+    """Probar el perfilado por header (inline y a disco) y por muestreo"""
+    from app.core.config import settings
+    from app.core.profiling import ProfileSession
+    
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    url = f"/products/{valid_id}/recommendations"
+    
+    # Deshabilitado: el header se ignora
+    response = client.get(url, headers={**auth_headers, "X-Profile": "inline"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profile_keep", 2)
+    
+    response = client.get(url, headers={**auth_headers, "X-Profile": "inline"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["response"]["product_id"] == valid_id
+    assert "get_recommendations" in data["profile"]["cpu"]
+    assert data["profile"]["memory"]["peak_bytes"] > 0
+    
+    # Sin header ni muestreo no se perfila
+    response = client.get(url, headers=auth_headers)
+    assert "x-profile-id" not in response.headers
+    
+    # El header solo se atiende con un token válido
+    for headers in ({"X-Profile": "inline"}, {"X-Profile": "inline", "Authorization": "Bearer otro"}):
+        response = client.get("/", headers=headers)
+        assert response.json() == {"message": "Marketplace Analysis API v1.0"}
+        assert "x-profile-id" not in response.headers
+    
+    # Con otra sesión en curso la solicitud se atiende sin perfilar
+    assert ProfileSession._active.acquire(blocking=False)
+    try:
+        response = client.get(url, headers={**auth_headers, "X-Profile": "inline"})
+    finally:
+        ProfileSession._active.release()
+    assert response.status_code == 200
+    assert response.json()["product_id"] == valid_id
+    assert "x-profile-id" not in response.headers
+    
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+    profile_ids = [client.get(url, headers=auth_headers).headers["x-profile-id"] for _ in range(3)]
+    assert len(set(profile_ids)) == 3
+    assert sorted(path.stem for path in tmp_path.glob("*.prof")) == sorted(profile_ids[1:])
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+def test_readiness_probes(client, auth_headers, setup_test_recommender, tmp_path):
+    """Probar /healthz, /readyz y la carga del modelo en segundo plano"""
+    from app.api.routes import app
+    from app.services.model_manager import ModelManager
+    
+    assert client.get("/healthz").json() == {"status": "alive"}
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+    
+    model_path = tmp_path / "model"
+    setup_test_recommender.save(model_path)
+    valid_id = list(setup_test_recommender.product_indices.keys())[0]
+    app.state.model_manager = ModelManager(app.state, model_path=model_path)
+    del app.state.recommender
+    try:
+        # Sin modelo: el proceso está vivo pero no listo
+        assert client.get("/healthz").status_code == 200
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+        response = client.get(f"/products/{valid_id}/recommendations", headers=auth_headers)
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        
+        assert app.state.model_manager.start_loading()
+        assert app.state.model_manager.wait(timeout=60)
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["loading"]["state"] == "idle"
+        assert client.get(f"/products/{valid_id}/recommendations", headers=auth_headers).status_code == 200
+    finally:
+        del app.state.model_manager
+        app.state.recommender = setup_test_recommender
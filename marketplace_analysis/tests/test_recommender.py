@@ -1,6 +1,10 @@
 import unittest
+import numpy as np
 import pandas as pd
+from scipy import sparse
+import scipy.sparse.linalg
 from app.services.recommender import ProductRecommender
+from app.services.neighbors import select_top_k
 from app.services.analyzer import ProductAnalyzer
 
 class TestProductRecommender(unittest.TestCase):
@@ -17,7 +21,7 @@ class TestProductRecommender(unittest.TestCase):
     def test_model_training(self):
         """Probar que el modelo se entrena correctamente"""
         self.recommender.fit(self.df)
-        self.assertIsNotNone(self.recommender.similarity_matrix)
+        self.assertIsNotNone(self.recommender.neighbor_index)
         self.assertIsNotNone(self.recommender.df)
         self.assertTrue(len(self.recommender.product_indices) > 0)
         
@@ -97,6 +101,429 @@ class TestProductRecommender(unittest.TestCase):
         for rec in response['recommendations']:
             self.assertEqual(rec['category'], product_category)
             
+    def test_neighbor_index_matches_exact_similarity(self):
+        """Probar que el índice top-K coincide con la similitud coseno exacta"""
+        from sklearn.metrics.pairwise import cosine_similarity
+        
+        recommender = ProductRecommender(n_neighbors=10, block_size=64, score_dtype='float32')
+        recommender.fit(self.df)
+        index = recommender.neighbor_index
+        self.assertEqual(index.indices.shape, (len(self.df), 10))
+        
+        exact = cosine_similarity(recommender.feature_matrix.tocsr())
+        np.fill_diagonal(exact, -np.inf)
+        expected_scores = -np.sort(-exact, axis=1)[:, :10]
+        np.testing.assert_allclose(index.scores, expected_scores, rtol=1e-5, atol=1e-5)
+        rows = np.arange(len(self.df))[:, None]
+        np.testing.assert_allclose(exact[rows, index.indices], index.scores, rtol=1e-5, atol=1e-5)
+        self.assertFalse((index.indices == rows).any())
+        
+    def test_parallel_tiled_index_build(self):
+        """Probar que el cálculo por bloques en paralelo y con presupuesto de memoria da el mismo índice"""
+        from app.services.neighbors import NeighborIndex, tile_rows
+        
+        self.recommender.fit(self.df)
+        matrix = self.recommender.feature_matrix
+        serial = NeighborIndex.build(matrix, 10, block_size=64, n_jobs=1)
+        budget_mb = 16 * len(self.df) * 4 * 3 / 1e6  # 3 filas por bloque con 4 hilos
+        self.assertEqual(tile_rows(len(self.df), 4, 64, budget_mb), 3)
+        parallel = NeighborIndex.build(matrix, 10, block_size=64, n_jobs=4, memory_budget_mb=budget_mb)
+        
+        self.assertEqual(parallel.scores.dtype, np.float32)
+        np.testing.assert_allclose(parallel.scores, serial.scores, rtol=1e-6)
+        np.testing.assert_array_equal(
+            np.sort(parallel.indices, axis=1), np.sort(serial.indices, axis=1)
+        )
+        
+    def test_feature_matrix_is_sparse(self):
+        """Probar que el TF-IDF se mantiene disperso en la matriz de características"""
+        self.recommender.fit(self.df)
+        features = self.recommender.feature_matrix
+        self.assertTrue(sparse.isspmatrix_csr(features.text))
+        self.assertEqual(features.shape[0], len(self.df))
+        self.assertEqual(features.nnz, features.text.nnz + features.numeric.size)
+        
+        # Cada fila completa queda con norma L2 unitaria
+        norms = sparse.linalg.norm(features.tocsr(), axis=1)
+        np.testing.assert_allclose(norms, 1.0, rtol=1e-6)
+        
+    def test_recommendations_beyond_index_size(self):
+        """Probar que se pueden pedir más recomendaciones que vecinos indexados"""
+        recommender = ProductRecommender(n_neighbors=5)
+        recommender.fit(self.df)
+        first_product_id = self.df['product_id'].iloc[0]
+        response = recommender.get_recommendations(first_product_id, n_recommendations=20)
+        
+        recommendations = response['recommendations']
+        self.assertEqual(len(recommendations), 20)
+        scores = [rec['similarity_score'] for rec in recommendations]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertNotIn(first_product_id, [rec['product_id'] for rec in recommendations])
+            
+    def test_query_neighbors_batch(self):
+        """Probar la consulta vectorizada de vecinos para varios productos"""
+        recommender = ProductRecommender(n_neighbors=5)
+        recommender.fit(self.df)
+        rows = np.array([0, 7, 42, 7])
+        
+        for n in [3, 12]:
+            indices, scores = recommender.query_neighbors(rows, n)
+            self.assertEqual(indices.shape, (len(rows), n))
+            self.assertFalse((indices == rows[:, None]).any())
+            self.assertTrue((np.diff(scores, axis=1) <= 1e-6).all())
+            for i, row in enumerate(rows):
+                single_indices, single_scores = recommender.query_neighbors([row], n)
+                np.testing.assert_allclose(single_scores[0], scores[i], rtol=1e-6)
+        
+        # n < 1 no se interpreta como un recorte desde el final de la lista
+        for n in [0, -3]:
+            with self.assertRaises(ValueError):
+                recommender.query_neighbors(rows, n)
+            with self.assertRaises(ValueError):
+                recommender.rank_neighbors(rows, n, quality_weight=0.5)
+        
+    def test_select_top_k(self):
+        """Probar la selección top-k con exclusión por índice"""
+        scores = np.array([[0.9, 0.1, 0.5, 0.7], [0.2, 1.0, 0.3, 0.8]])
+        top, top_scores = select_top_k(scores.copy(), 2, exclude=[0, 1])
+        np.testing.assert_array_equal(top, [[3, 2], [3, 2]])
+        np.testing.assert_allclose(top_scores, [[0.7, 0.5], [0.8, 0.3]], rtol=1e-6)
+        
+        top, _ = select_top_k(scores.copy(), 4, exclude=[0, 1])
+        np.testing.assert_array_equal(top[:, -1], [-1, -1])
+            
+    def test_lsh_index_recall(self):
+        """Probar el backend aproximado LSH y su reporte de recall"""
+        recommender = ProductRecommender(n_neighbors=10, index_backend='lsh', lsh_tables=6)
+        recommender.fit(self.df)
+        index = recommender.neighbor_index
+        self.assertEqual(index.indices.shape, (len(self.df), 10))
+        self.assertTrue((index.indices >= 0).all())
+        self.assertFalse((index.indices == np.arange(len(self.df))[:, None]).any())
+        
+        report = recommender.index_recall(k=10, sample_size=200)
+        self.assertEqual(report['backend'], 'lsh')
+        self.assertEqual(report['sample_size'], 200)
+        self.assertGreater(report['recall'], 0.5)
+        
+        exact = ProductRecommender(n_neighbors=10)
+        exact.fit(self.df)
+        self.assertAlmostEqual(exact.index_recall(k=10, sample_size=200)['recall'], 1.0, places=3)
+        
+        with self.assertRaises(ValueError):
+            ProductRecommender(index_backend='faiss')
+        
+    def test_product_store_lookup(self):
+        """Probar las consultas individuales y en lote del almacén columnar"""
+        self.recommender.fit(self.df)
+        product_ids = self.df['product_id'].iloc[[3, 0, 99]].tolist()
+        
+        products = self.recommender.get_products(product_ids + [999999])
+        self.assertIsNone(products[-1])
+        for product_id, product in zip(product_ids, products):
+            row = self.df[self.df['product_id'] == product_id].iloc[0]
+            self.assertEqual(product, self.recommender.get_product_by_id(product_id))
+            self.assertEqual(product['product_id'], product_id)
+            self.assertEqual(product['title'], row['title'])
+            self.assertEqual(product['category'], row['category'])
+            self.assertAlmostEqual(product['price'], row['price'])
+            self.assertIsInstance(product['reviews_count'], int)
+            self.assertIsInstance(product['rating'], float)
+        self.assertEqual(len(self.recommender.df), len(self.df))
+            
+    def test_incremental_catalog_updates(self):
+        """Probar altas, modificaciones y bajas sin reentrenar"""
+        recommender = ProductRecommender(n_neighbors=10, score_dtype='float32')
+        recommender.fit(self.df)
+        source = self.df.iloc[0]
+        product = source.drop('product_id').to_dict()
+        
+        # Alta: un duplicado exacto debe ser el vecino más cercano del original
+        new_id = recommender.add_product(product)
+        self.assertNotIn(new_id, self.df['product_id'].values)
+        recommendations = recommender.get_recommendations(int(source['product_id']), 1)
+        self.assertEqual(recommendations['recommendations'][0]['product_id'], new_id)
+        self.assertEqual(recommender.get_product_by_id(new_id)['title'], source['title'])
+        
+        # Modificación: el cambio de título se refleja en el almacén
+        recommender.update_product(new_id, dict(product, title='Producto modificado'))
+        self.assertEqual(recommender.get_product_by_id(new_id)['title'], 'Producto modificado')
+        self.assertEqual(len(recommender.df), len(self.df) + 1)
+        
+        # Una modificación inválida falla sin dar de baja la versión vigente
+        n_rows = len(recommender.store)
+        for invalid in ({'category': 'Sin título'}, dict(product, price='no es un número')):
+            with self.assertRaises((KeyError, ValueError)):
+                recommender.update_product(new_id, invalid)
+        self.assertEqual(recommender.get_product_by_id(new_id)['title'], 'Producto modificado')
+        self.assertEqual(len(recommender.store), n_rows)
+        self.assertEqual(recommender.pending_updates, 2)
+        
+        # Las listas parcheadas coinciden con la búsqueda exacta
+        rows = np.array(list(recommender.product_indices.values()))
+        exact_indices, exact_scores = recommender._exact_neighbors(rows, 10)
+        np.testing.assert_allclose(
+            recommender.neighbor_index.scores[rows], exact_scores, rtol=1e-5, atol=1e-5
+        )
+        
+        # Baja: el producto desaparece de todas las recomendaciones
+        recommender.remove_product(new_id)
+        self.assertIsNone(recommender.get_product_by_id(new_id))
+        active_rows = recommender.neighbor_index.indices[rows]
+        self.assertFalse(np.isin(active_rows, np.flatnonzero(~recommender.store.active)).any())
+        self.assertEqual(recommender.pending_updates, 3)
+        with self.assertRaises(ValueError):
+            recommender.remove_product(new_id)
+        
+        # Compactación: reentrena sobre el catálogo activo
+        compacted = recommender.compacted()
+        self.assertEqual(len(compacted.store), len(self.df))
+        self.assertEqual(compacted.pending_updates, 0)
+            
+    def test_writes_during_compaction(self):
+        """Probar que las escrituras concurrentes a la compactación llegan al modelo compactado"""
+        import threading
+        from unittest import mock
+        
+        recommender = ProductRecommender(n_neighbors=10)
+        recommender.fit(self.df)
+        product = self.df.iloc[0].drop('product_id').to_dict()
+        removed_id = int(self.df['product_id'].iloc[1])
+        
+        refit_started, release_refit = threading.Event(), threading.Event()
+        original_fit = ProductRecommender.fit
+        def slow_fit(model, df):
+            refit_started.set()
+            release_refit.wait(5)
+            return original_fit(model, df)
+        
+        results = {}
+        with mock.patch.object(ProductRecommender, 'fit', slow_fit):
+            compaction = threading.Thread(target=lambda: results.update(compacted=recommender.compacted()))
+            compaction.start()
+            self.assertTrue(refit_started.wait(5))
+            writers = [
+                threading.Thread(target=lambda: results.update(new_id=recommender.add_product(product))),
+                threading.Thread(target=lambda: recommender.remove_product(removed_id))
+            ]
+            for writer in writers:
+                writer.start()
+            release_refit.set()
+            compaction.join(10)
+            for writer in writers:
+                writer.join(10)
+        
+        compacted = results['compacted']
+        self.assertIs(recommender.successor, compacted)
+        self.assertIsNotNone(compacted.get_product_by_id(results['new_id']))
+        self.assertIsNone(compacted.get_product_by_id(removed_id))
+        self.assertEqual(compacted.pending_updates, 2)
+        with self.assertRaises(ValueError):
+            recommender.compacted()
+        
+    def test_incremental_writes_grow_in_place(self):
+        """Probar que las escrituras no copian los arrays completos y mantienen listas exactas"""
+        recommender = ProductRecommender(n_neighbors=10, vector_dtype='int8')
+        recommender.fit(self.df)
+        products = [row.drop('product_id').to_dict() for _, row in self.df.head(6).iterrows()]
+        
+        # Tras el primer crecimiento, la siguiente alta escribe en la capacidad libre
+        recommender.add_product(products[0])
+        arrays = lambda: [
+            recommender.neighbor_index.indices, recommender.category_index.scores,
+            recommender.feature_matrix.text.data, recommender.feature_matrix.numeric,
+            recommender.store.columns['title'].data, recommender.store.columns['price'],
+            recommender.store.active, recommender.category_codes, recommender.quality_scores
+        ]
+        bases = [array.base for array in arrays()]
+        new_ids = [recommender.add_product(product) for product in products[1:]]
+        for base, array in zip(bases, arrays()):
+            self.assertIsNotNone(base)
+            self.assertIs(array.base, base)
+        
+        # Modificaciones y bajas: ninguna lista activa apunta a una fila dada de baja
+        recommender.update_product(new_ids[0], dict(products[1], title='Producto modificado'))
+        recommender.remove_product(new_ids[1])
+        recommender.remove_product(int(self.df['product_id'].iloc[0]))
+        rows = np.array(list(recommender.product_indices.values()))
+        inactive = np.flatnonzero(~recommender.store.active)
+        for same_category, index in ((False, recommender.neighbor_index), (True, recommender.category_index)):
+            self.assertFalse(np.isin(index.indices[rows], inactive).any())
+            _, exact_scores = recommender._exact_neighbors(rows, 10, same_category)
+            np.testing.assert_allclose(
+                index.scores[rows].astype(np.float32), exact_scores, rtol=1e-2, atol=1e-2
+            )
+    
+    def test_neighbor_rows_read_consistently(self):
+        """Probar que una lectura nunca combina ids y puntajes de escrituras distintas"""
+        import threading
+        from app.services.neighbors import NeighborIndex
+        
+        index = NeighborIndex(np.zeros((64, 10), dtype=np.int32), np.zeros((64, 10), dtype=np.float32))
+        rows = np.arange(64)
+        done = threading.Event()
+        
+        def write():
+            for version in range(1, 2000):
+                index.set_rows(rows, np.full((64, 10), version), np.full((64, 10), version))
+            done.set()
+        
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not done.is_set():
+            indices, scores = index.neighbors(rows, 10)
+            self.assertTrue((indices == indices[0, 0]).all())
+            self.assertTrue((scores == indices[0, 0]).all())
+        writer.join()
+        self.assertEqual(index.generation % 2, 0)
+    
+    def test_compact_vector_store(self):
+        """Probar float32 por defecto, la cuantización int8 y los puntajes float16"""
+        import tempfile
+        
+        reference = ProductRecommender(n_neighbors=10, vector_dtype='float64', score_dtype='float32')
+        reference.fit(self.df.copy())
+        compact = ProductRecommender(n_neighbors=10)
+        compact.fit(self.df.copy())
+        self.assertEqual(compact.feature_matrix.dtype, np.float32)
+        self.assertEqual(compact.neighbor_index.scores.dtype, np.float16)
+        
+        quantized = ProductRecommender(n_neighbors=10, vector_dtype='int8')
+        quantized.fit(self.df.copy())
+        matrix = quantized.feature_matrix
+        self.assertEqual(matrix.dtype, np.int8)
+        self.assertEqual(matrix.numeric.dtype, np.int8)
+        self.assertLess(matrix.nbytes, reference.feature_matrix.nbytes / 2)
+        # El error de dequantizar es a lo sumo media escala por dimensión
+        error = abs(matrix.dequantize(np.float64).tocsr() - reference.feature_matrix.tocsr()).max(axis=0)
+        self.assertTrue((error.toarray().ravel() <= matrix.scales / 2 + 1e-6).all())
+        
+        report = quantized.precision_report(reference, k=10, sample_size=200)
+        self.assertGreater(report['index_overlap'], 0.8)
+        self.assertGreater(report['exact_overlap'], 0.8)
+        self.assertLess(report['max_score_error'], 0.05)
+        self.assertLess(report['memory']['index_bytes'], report['reference_memory']['index_bytes'])
+        self.assertEqual(compact.precision_report(reference, k=10)['exact_overlap'], 1.0)
+        
+        # Altas incrementales y guardado conservan la representación int8
+        source = self.df.iloc[0]
+        new_id = quantized.add_product(source.drop('product_id').to_dict())
+        self.assertEqual(
+            quantized.get_recommendations(int(source['product_id']), 1)['recommendations'][0]['product_id'],
+            new_id
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            quantized.save(tmp)
+            loaded = ProductRecommender.load(tmp)
+            self.assertEqual(loaded.vector_dtype, 'int8')
+            np.testing.assert_array_equal(loaded.feature_matrix.scales, quantized.feature_matrix.scales)
+            self.assertEqual(
+                loaded.get_recommendations(new_id, 5), quantized.get_recommendations(new_id, 5)
+            )
+        
+        with self.assertRaises(ValueError):
+            ProductRecommender(vector_dtype='int4')
+    
+    def test_quantized_index_build_by_chunks(self):
+        """Probar que los índices int8 se construyen por tramos igual que sobre la matriz dequantizada"""
+        from unittest import mock
+        import app.services.neighbors as neighbors
+        from app.services.features import FeatureMatrix
+        from app.services.neighbors import NeighborIndex
+        
+        quantized = ProductRecommender(n_neighbors=10, vector_dtype='int8')
+        quantized.fit(self.df.copy())
+        matrix = quantized.feature_matrix
+        reference = NeighborIndex.build(matrix.dequantize(), 10)
+        reference_lsh = NeighborIndex.build_lsh(matrix.dequantize(), 10, seed=0)
+        
+        # Tramos más chicos que el catálogo: cada uno se dequantiza por separado
+        chunk_rows = len(matrix) // 3
+        with mock.patch.object(neighbors, 'QUANTIZED_CHUNK_ROWS', chunk_rows), \
+                mock.patch('app.services.features.QUANTIZED_CHUNK_ROWS', chunk_rows):
+            with mock.patch.object(FeatureMatrix, 'dequantize', autospec=True,
+                                   side_effect=FeatureMatrix.dequantize) as dequantize:
+                index = NeighborIndex.build(matrix, 10, block_size=64, n_jobs=2)
+            self.assertTrue(all(len(call.args[0]) <= chunk_rows for call in dequantize.call_args_list))
+            lsh = NeighborIndex.build_lsh(matrix, 10, seed=0)
+        for built, expected in ((index, reference), (lsh, reference_lsh)):
+            np.testing.assert_allclose(built.scores, expected.scores, rtol=1e-6, atol=1e-6)
+            self.assertGreater((built.indices == expected.indices).mean(), 0.99)
+            
+    def test_lazy_load_and_warm_up(self):
+        """Probar que un modelo cargado sirve sin reconstruir los transformadores y se precalienta"""
+        import tempfile
+        
+        self.recommender.fit(self.df)
+        with tempfile.TemporaryDirectory() as tmp:
+            self.recommender.save(tmp)
+            loaded = ProductRecommender.load(tmp)
+            self.assertIsNone(loaded._tfidf)
+            self.assertGreater(loaded.warm_up(), 0)
+            self.assertEqual(loaded.cache.stats()['size'], 0)
+            self.assertIsNone(loaded._tfidf)
+            
+            # Las altas reconstruyen el vectorizador con el vocabulario guardado
+            self.assertEqual(loaded.tfidf.vocabulary_, self.recommender.tfidf.vocabulary_)
+            np.testing.assert_allclose(
+                loaded.numeric_scaler.data_max_, self.recommender.numeric_scaler.data_max_
+            )
+            source = self.df.iloc[0]
+            new_id = loaded.add_product(source.drop('product_id').to_dict())
+            self.assertEqual(
+                loaded.get_recommendations(int(source['product_id']), 1)['recommendations'][0]['product_id'],
+                new_id
+            )
+            
+    def test_neighbor_table_artifact(self):
+        """Probar la tabla de vecinos de solo lectura generada por python -m app.train"""
+        import subprocess
+        import sys
+        import tempfile
+        from pathlib import Path
+        from app.services.errors import ReadOnlyModelError
+        
+        project_dir = Path(__file__).parent.parent
+        with tempfile.TemporaryDirectory() as tmp:
+            table_path = Path(tmp) / 'table'
+            subprocess.run(
+                [sys.executable, '-m', 'app.train', '--data', 'data/raw/products.csv',
+                 '--output', str(table_path), '--table-only', '--n-neighbors', '10', '--text-jobs', '1'],
+                cwd=project_dir, check=True, capture_output=True
+            )
+            self.assertFalse((table_path / 'features').exists())
+            self.assertFalse((table_path / 'vocabulary.txt').exists())
+            self.assertEqual(np.load(table_path / 'neighbors' / 'indices.npy').dtype, np.uint32)
+            self.assertEqual(np.load(table_path / 'neighbors' / 'scores.npy').dtype, np.float16)
+            
+            # Servir desde la tabla sin importar scikit-learn
+            script = (
+                "import sys; from app.services.recommender import ProductRecommender; "
+                f"r = ProductRecommender.load({str(table_path)!r}); r.warm_up(); "
+                "pid = next(iter(r.product_indices)); "
+                "assert len(r.get_recommendations(pid, 5)['recommendations']) == 5; "
+                "assert r.get_similar_products(pid)['recommendations']; "
+                "assert 'sklearn' not in sys.modules, 'scikit-learn importado'"
+            )
+            subprocess.run([sys.executable, '-c', script], cwd=project_dir, check=True, capture_output=True)
+            
+            table = ProductRecommender.load(table_path)
+            self.assertTrue(table.read_only)
+            full = ProductRecommender(n_neighbors=10).fit(self.df)
+            product_id = int(self.df['product_id'].iloc[0])
+            expected = full.get_recommendations(product_id, 10)
+            self.assertEqual(
+                [rec['product_id'] for rec in table.get_recommendations(product_id, 10)['recommendations']],
+                [rec['product_id'] for rec in expected['recommendations']]
+            )
+            # Más vecinos que K: la tabla devuelve los K disponibles
+            self.assertEqual(len(table.get_recommendations(product_id, 25)['recommendations']), 10)
+            with self.assertRaises(ReadOnlyModelError):
+                table.add_product(self.df.iloc[0].drop('product_id').to_dict())
+            with self.assertRaises(ReadOnlyModelError):
+                table.remove_product(product_id)
+            self.assertIn(product_id, table.product_indices)
+            
     def test_invalid_product_id(self):
         """Probar manejo de ID de producto inválido"""
         self.recommender.fit(self.df)
@@ -129,5 +556,314 @@ class TestProductRecommender(unittest.TestCase):
         # Limpiar archivo temporal
         os.unlink(tmp.name)
 
+    def test_similar_products_category_partition(self):
+        """Probar que by_category devuelve exactamente n productos de la categoría"""
+        recommender = ProductRecommender(n_neighbors=5)
+        recommender.fit(self.df)
+        category_sizes = self.df['category'].value_counts()
+        
+        # La categoría más pequeña con más de n productos
+        category = category_sizes[category_sizes > 8].index[-1]
+        product_id = self.df.loc[self.df['category'] == category, 'product_id'].iloc[0]
+        for n in [3, 8]:
+            response = recommender.get_similar_products(product_id, by_category=True, n_recommendations=n)
+            recommendations = response['recommendations']
+            self.assertEqual(len(recommendations), n)
+            self.assertTrue(all(rec['category'] == category for rec in recommendations))
+            self.assertNotIn(product_id, [rec['product_id'] for rec in recommendations])
+        
+        # Las particiones por categoría principal agrupan subcategorías
+        main_recommender = ProductRecommender(n_neighbors=5, category_level='main_category')
+        main_recommender.fit(self.df)
+        response = main_recommender.get_similar_products(product_id, n_recommendations=5)
+        main_category = category.split('/')[0]
+        self.assertTrue(all(
+            rec['category'].split('/')[0] == main_category for rec in response['recommendations']
+        ))
+        
+        # Un producto nuevo entra en la partición de su categoría
+        new_id = recommender.add_product(dict(self.df.iloc[0].drop('product_id').to_dict(), category=category))
+        response = recommender.get_similar_products(product_id, n_recommendations=8)
+        self.assertTrue(all(rec['category'] == category for rec in response['recommendations']))
+        similar = recommender.get_similar_products(new_id, n_recommendations=3)
+        self.assertEqual(len(similar['recommendations']), 3)
+        
+    def test_result_cache(self):
+        """Probar la caché de resultados y su invalidación por versión de modelo"""
+        recommender = ProductRecommender(cache_size=2)
+        recommender.fit(self.df)
+        product_ids = self.df['product_id'].iloc[:3].tolist()
+        
+        first = recommender.get_recommendations(product_ids[0])
+        self.assertIs(recommender.get_recommendations(product_ids[0]), first)
+        similar = recommender.get_similar_products(product_ids[0], by_category=False)
+        self.assertIsNot(similar, recommender.get_similar_products(product_ids[0], by_category=True))
+        self.assertEqual(len(first['recommendations']), 5)
+        for product_id in product_ids[1:]:
+            recommender.get_recommendations(product_id)
+        
+        stats = recommender.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertLessEqual(stats['size'], 2)
+        
+        # Un cambio del catálogo invalida la caché
+        version = recommender.model_version
+        recommender.remove_product(product_ids[1])
+        self.assertNotEqual(recommender.model_version, version)
+        self.assertEqual(len(recommender.cache), 0)
+        refreshed = recommender.get_recommendations(product_ids[0])
+        self.assertNotIn(product_ids[1], [rec['product_id'] for rec in refreshed['recommendations']])
+        
+    def test_quality_rerank(self):
+        """Probar el re-ordenamiento híbrido por similitud y puntuación del producto"""
+        from app.services.analyzer import PRODUCT_SCORE_WEIGHTS
+        
+        recommender = ProductRecommender(n_neighbors=20, score_dtype='float32')
+        recommender.fit(self.df)
+        
+        # La calidad precalculada sigue la fórmula de calculate_product_score
+        scored = self.analyzer.calculate_product_score()
+        max_score = sum(weight for col, weight in PRODUCT_SCORE_WEIGHTS.items() if col in scored.columns)
+        expected = (scored['product_score'] / max_score).to_numpy()
+        known = ~np.isnan(expected)
+        np.testing.assert_allclose(recommender.quality_scores[known], expected[known], atol=1e-5)
+        
+        # Peso 0: idéntico a la recuperación por similitud
+        first_product_id = self.df['product_id'].iloc[0]
+        plain = recommender.get_recommendations(first_product_id, 5)
+        self.assertIs(recommender.get_recommendations(first_product_id, 5, quality_weight=0.0), plain)
+        self.assertIsNone(plain['recommendations'][0]['rank_score'])
+        
+        # Peso 1: los candidatos por similitud se ordenan solo por calidad
+        rows = np.array([0, 3, 10])
+        candidates, _ = recommender.query_neighbors(rows, 20)
+        indices, similarity, blended = recommender.rank_neighbors(rows, 5, quality_weight=1.0)
+        for i in range(len(rows)):
+            self.assertTrue(set(indices[i]) <= set(candidates[i]))
+            np.testing.assert_allclose(
+                blended[i], np.sort(recommender.quality_scores[candidates[i]])[::-1][:5], rtol=1e-6
+            )
+        
+        # Peso intermedio: combinación lineal de ambos puntajes, descendente
+        indices, similarity, blended = recommender.rank_neighbors(rows, 5, quality_weight=0.3)
+        np.testing.assert_allclose(
+            blended, 0.7 * similarity + 0.3 * recommender.quality_scores[indices], rtol=1e-5
+        )
+        self.assertTrue((np.diff(blended, axis=1) <= 1e-6).all())
+        
+        # El peso forma parte de la clave de caché y se puede fijar en el modelo
+        reranked = recommender.get_recommendations(first_product_id, 5, quality_weight=0.3)
+        self.assertIsNot(reranked, plain)
+        np.testing.assert_allclose(
+            [rec['rank_score'] for rec in reranked['recommendations']], blended[0], rtol=1e-5
+        )
+        batch = recommender.get_recommendations_batch([first_product_id], 5, quality_weight=0.3)
+        self.assertEqual(batch[0]['recommendations'], reranked['recommendations'])
+        recommender.quality_weight = 0.3
+        self.assertEqual(recommender.get_recommendations(first_product_id, 5), reranked)
+        with self.assertRaises(ValueError):
+            recommender.get_recommendations(first_product_id, 5, quality_weight=1.5)
+        
+        # Las altas extienden el array de calidad
+        recommender.add_product({
+            'title': 'Nuevo', 'description': '', 'category': self.df['category'].iloc[0],
+            'price': 10.0, 'rating': 4.0, 'reviews_count': 3, 'sales_last_30_days': 3
+        })
+        self.assertEqual(len(recommender.quality_scores), len(recommender.store.active))
+        
+    def test_precomputed_quality_rank(self):
+        """Probar que el orden precalculado del peso del modelo coincide con el re-ordenamiento al vuelo"""
+        recommender = ProductRecommender(n_neighbors=20, score_dtype='float32', quality_weight=0.3, block_size=7)
+        recommender.fit(self.df)
+        self.assertEqual(recommender.ranked_neighbors[0], 0.3)
+        
+        rows = np.arange(len(self.df))
+        for same_category in (False, True):
+            precomputed = recommender.rank_neighbors(rows, 5, same_category, quality_weight=0.3)
+            ranked, recommender.ranked_neighbors = recommender.ranked_neighbors, None
+            on_the_fly = recommender.rank_neighbors(rows, 5, same_category, quality_weight=0.3)
+            recommender.ranked_neighbors = ranked
+            for expected, actual in zip(on_the_fly, precomputed):
+                np.testing.assert_array_equal(actual, expected)
+        
+        # Los cambios del catálogo descartan el orden precalculado hasta el próximo entrenamiento
+        first_product_id = self.df['product_id'].iloc[0]
+        recommender.remove_product(self.df['product_id'].iloc[1])
+        self.assertIsNone(recommender.ranked_neighbors)
+        self.assertIn('rank_score', recommender.get_recommendations(first_product_id, 5)['recommendations'][0])
+        self.assertIsNotNone(recommender.compacted().ranked_neighbors)
+        
+    def test_pre_encoded_json_responses(self):
+        """Probar que las respuestas armadas con fragmentos coinciden con las de pydantic"""
+        from unittest import mock
+        from app.api.models import BatchRecommendationResponse, RecommendationResponse, SimilarProductsResponse
+        from app.core import serialization
+        from app.services.store import PayloadFragments
+        
+        self.recommender.fit(self.df)
+        product_ids = self.df['product_id'].iloc[:3].tolist()
+        for quality_weight in (None, 0.4):
+            for product_id in product_ids:
+                expected = RecommendationResponse.model_validate(
+                    self.recommender.get_recommendations(product_id, 5, quality_weight)
+                )
+                body = self.recommender.get_recommendations_json(product_id, 5, quality_weight)
+                self.assertEqual(body, expected.model_dump_json().encode())
+                self.assertIs(self.recommender.get_recommendations_json(product_id, 5, quality_weight), body)
+                # Sin validación los dicts se codifican tal cual: mismas claves, incluido rank_score
+                for _ in range(2):  # La segunda vez desde la caché
+                    self.assertEqual(
+                        serialization.dumps(self.recommender.get_recommendations(product_id, 5, quality_weight)), body
+                    )
+                
+                expected = SimilarProductsResponse.model_validate(
+                    self.recommender.get_similar_products(product_id, True, 8, quality_weight)
+                )
+                body = self.recommender.get_similar_products_json(product_id, True, 8, quality_weight)
+                self.assertEqual(body, expected.model_dump_json().encode())
+            
+            batch_ids = product_ids + [-1]
+            expected = BatchRecommendationResponse.model_validate({
+                'results': self.recommender.get_recommendations_batch(batch_ids, 4, quality_weight)
+            })
+            body = self.recommender.get_recommendations_batch_json(batch_ids, 4, quality_weight)
+            self.assertEqual(body, expected.model_dump_json().encode())
+            self.assertEqual(
+                serialization.dumps({'results': self.recommender.get_recommendations_batch(batch_ids, 4, quality_weight)}),
+                body
+            )
+        
+        # Los fragmentos se codifican una vez por fila y sobreviven a los cambios del catálogo
+        fragments = self.recommender.fragments
+        self.assertGreater(len(fragments), 0)
+        self.recommender.remove_product(product_ids[2])
+        self.assertIs(self.recommender.fragments, fragments)
+        
+        # Con el tope alcanzado se desalojan los fragmentos menos usados
+        fragments = PayloadFragments(self.recommender.store, maxsize=3)
+        first = fragments.get_many([0, 1, 2])
+        self.assertEqual(fragments.get_many([0]), first[:1])
+        fragments.get_many([3, 4])
+        self.assertEqual((len(fragments), fragments.evictions), (3, 2))
+        self.assertEqual(list(fragments._fragments), [0, 3, 4])
+        self.assertEqual(fragments.get_many([1, 0]), [first[1], first[0]])
+        
+        # Sin orjson se usa el codificador estándar con el mismo resultado
+        with mock.patch.object(serialization, 'orjson', None):
+            fallback = serialization.dumps({'title': 'Ñandú "x"', 'score': 0.25, 'items': [1, None]})
+        self.assertEqual(fallback, serialization.dumps({'title': 'Ñandú "x"', 'score': 0.25, 'items': [1, None]}))
+        
+        # NaN e infinitos se codifican como null en ambos caminos (no fallan)
+        non_finite = {'price': float('nan'), 'rating': np.float64('nan'), 'scores': [float('inf'), (0.5, -np.inf)]}
+        with mock.patch.object(serialization, 'orjson', None):
+            fallback = serialization.dumps(non_finite)
+        self.assertEqual(fallback, b'{"price":null,"rating":null,"scores":[null,[0.5,null]]}')
+        self.assertEqual(fallback, serialization.dumps(non_finite))
+        
+    def test_memory_mapped_model_format(self):
+        """Probar el formato versionado sin pickle y su carga con mmap"""
+        import tempfile
+        import json
+        from pathlib import Path
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_dir = Path(tmp_dir) / 'recommender'
+            self.recommender.fit(self.df)
+            self.recommender.save(model_dir)
+            
+            manifest = json.loads((model_dir / 'manifest.json').read_text())
+            self.assertEqual(manifest['n_products'], len(self.df))
+            self.assertFalse(list(model_dir.rglob('*.pkl')))
+            
+            loaded = ProductRecommender.load(model_dir)
+            self.assertIsInstance(loaded.neighbor_index.indices, np.memmap)
+            self.assertIsInstance(loaded.feature_matrix.numeric, np.memmap)
+            
+            first_product_id = self.df['product_id'].iloc[0]
+            self.assertEqual(
+                loaded.get_recommendations(first_product_id),
+                self.recommender.get_recommendations(first_product_id)
+            )
+            self.assertEqual(
+                loaded.get_recommendations(first_product_id, 60),
+                self.recommender.get_recommendations(first_product_id, 60)
+            )
+            
+            # El modelo cargado admite cambios incrementales (copy-on-write)
+            new_id = loaded.add_product({'title': 'Nuevo', 'description': '', 'category': 'Books', 'price': 1.0})
+            self.assertIsNotNone(loaded.get_product_by_id(new_id))
+            loaded.remove_product(first_product_id)
+            self.assertIsNone(loaded.get_product_by_id(first_product_id))
+            self.assertIsNotNone(ProductRecommender.load(model_dir).get_product_by_id(first_product_id))
+
+    def test_vectorized_documents_match_row_apply(self):
+        """Probar que el ensamblado columnar produce los mismos documentos que el apply por fila"""
+        from unittest import mock
+        from app.services import features
+        
+        df = self.df.copy()
+        df.loc[df.index[0], 'description'] = np.nan
+        df.loc[df.index[1], 'title'] = None
+        df.loc[df.index[2], 'title'] = '  Título CON Espacios  '
+        df['category'] = df['category'].astype('category')
+        expected = df.apply(
+            lambda row: ' '.join([
+                self.recommender._preprocess_text(str(row['title'])),
+                self.recommender._preprocess_text(str(row.get('description', ''))),
+                self.recommender._preprocess_text(str(row['category']))
+            ]),
+            axis=1
+        )
+        self.assertEqual(features.build_documents(df).tolist(), expected.tolist())
+        
+        # Sin descripción y repartido entre procesos
+        no_description = df.drop(columns=['description'])
+        expected = no_description.apply(
+            lambda row: ' '.join([
+                self.recommender._preprocess_text(str(row['title'])),
+                self.recommender._preprocess_text(str(row.get('description', ''))),
+                self.recommender._preprocess_text(str(row['category']))
+            ]),
+            axis=1
+        )
+        with mock.patch.object(features, 'PARALLEL_TEXT_MIN_ROWS', 0):
+            documents = features.build_documents(no_description, n_jobs=2)
+        self.assertEqual(documents.tolist(), expected.tolist())
+        self.assertTrue(documents.index.equals(no_description.index))
+
+    def test_catalog_stats(self):
+        """Probar las estadísticas precalculadas y su actualización incremental"""
+        from app.services.stats import CatalogStats
+        
+        self.recommender.fit(self.df)
+        stats = self.recommender.stats
+        self.assertEqual(stats.category_counts, self.df['category'].value_counts().to_dict())
+        self.assertEqual(stats.total_products, len(self.df))
+        
+        category = self.df['category'].iloc[0]
+        prices = self.df.loc[self.df['category'] == category, 'price']
+        self.assertAlmostEqual(stats.category_summary[category]['price']['p50'], np.percentile(prices, 50), places=3)
+        self.assertAlmostEqual(stats.category_summary[category]['price']['p90'], np.percentile(prices, 90), places=3)
+        histograms = stats.histograms()
+        self.assertEqual(sum(histograms['stock'].values()), len(self.df))
+        self.assertEqual(sum(histograms['product_score']['counts']), len(self.df))
+        
+        # Los cambios incrementales equivalen a recalcular desde el almacén
+        first_product_id = self.df['product_id'].iloc[0]
+        self.recommender.add_product({
+            'title': 'Nuevo', 'description': '', 'category': 'Nueva/Categoría',
+            'price': 10.0, 'rating': 4.0, 'stock': 5, 'sales_last_30_days': 3
+        })
+        self.recommender.update_product(first_product_id, dict(self.df.iloc[0].to_dict(), price=1.0))
+        self.recommender.remove_product(self.df['product_id'].iloc[1])
+        recomputed = CatalogStats.from_store(self.recommender.store)
+        recomputed.score_ranges = stats.score_ranges
+        self.assertEqual(stats.category_counts, recomputed.category_counts)
+        self.assertEqual(stats.category_summary, recomputed.category_summary)
+        self.assertEqual(stats.histograms()['stock'], recomputed.histograms()['stock'])
+        self.assertEqual(stats.total_products, len(self.df))
+        self.assertEqual(stats.category_counts['Nueva/Categoría'], 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file